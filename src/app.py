@@ -1,23 +1,44 @@
+import argparse
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
 import cv2
 import json
-import sleap
-import matplotlib.pyplot as plt 
-from utils import SimulatedCamera
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import os
 from utils import SimulatedCamera
+from utils import VideoFrameSource, draw_predictions, predict_peaks
+from roi import EXPLORE_LABEL, NONE_LABEL, RoiClassifier, RoiMask
+from predictions import PredictionStore, prediction_key, prediction_store_path
+from labels import LabelStore
+from labeling import AutoLabeler, DEFAULT_BATCH_SIZE, MotionGate
+from tracking import save_track_labels, track_store
+from viewer import FrameViewer
+from profiling import DISABLED_PROFILER, Profiler
+from models import get_predictor, load_sleap, predictor_registry, preload_sleap
+from video_index import IndexedVideoReader, av
 import numpy as np
-from shapely.geometry import Point, Polygon
-import csv
+import queue
+import threading
+import time
+
+# Interval at which the GUI polls the auto-labeling worker for results (ms)
+AUTO_LABEL_POLL_MS = 100
+
+# Frames wider than this are downscaled for display (px)
+DISPLAY_MAX_WIDTH = 960
+
+# Default number of frames skipped by Shift+Left/Right
+DEFAULT_JUMP_SIZE = 100
 
-sleap.disable_preallocation()
+# Interval at which the stage timings status line is refreshed when profiling (ms)
+STATS_REFRESH_MS = 500
 
 
 class LabelBatApp:
-    def __init__(self, root):
+    def __init__(self, root, profiler=None):
         self.root = root
+        # Times the decoding, inference, ROI and drawing stages; disabled unless started with --profile
+        self.profiler = profiler if profiler is not None else DISABLED_PROFILER
         self.root.title("Bat Actions Auto-Label Tool")
         # Bind the X button to the exit handler
         self.root.protocol("WM_DELETE_WINDOW", self.on_exit)
@@ -30,6 +51,7 @@ class LabelBatApp:
             try:
                 # Perform any cleanup here
                 print("Performing cleanup before exit...")
+                self.cancel_auto_label()
                 
                 if hasattr(self,"frame_labels"):
                     # If necessary, check if labeling was done and prompt user to save
@@ -37,6 +59,8 @@ class LabelBatApp:
                         if messagebox.askyesno("Save Labels", "You have unsaved labels. Do you want to save them before exiting?"):
                             self.finish_labeling()
 
+                self.close_video()
+
                 # Close the application
                 self.root.quit()  # Close the Tkinter window
                 self.root.destroy()  # Destroy the root window to exit the app
@@ -63,15 +87,12 @@ class LabelBatApp:
         for widget in self.root.winfo_children():
             widget.destroy()
 
-        page_title = tk.Label(self.root, text="Create or Edit Labels", font=("Arial", 14))
+        page_title = tk.Label(self.root, text="Create Labels", font=("Arial", 14))
         page_title.pack(pady=20)
 
         new_labels_button = tk.Button(self.root, text="New Labels", command=self.new_labels_page, font=("Arial", 12))
         new_labels_button.pack(pady=10)
 
-        edit_labels_button = tk.Button(self.root, text="Edit Labels", command=self.edit_labels, font=("Arial", 12))
-        edit_labels_button.pack(pady=10)
-
         back_button = tk.Button(self.root, text="Back", command=self.main_page, font=("Arial", 12))
         back_button.pack(pady=10)
 
@@ -173,15 +194,14 @@ class LabelBatApp:
         # After saving, go back to the previous page
         self.create_labels_page()
 
-    def edit_labels(self):
-        print("Edit Labels button pressed")
-        # Add functionality for editing labels here
-
     def start_auto_label(self):
         """Navigates to the page for starting auto-labeling."""
         for widget in self.root.winfo_children():
             widget.destroy()
 
+        # Import sleap and TensorFlow while the user fills in the paths; the ROI drawing pages never need them
+        preload_sleap()
+
         # Page title
         page_title = tk.Label(self.root, text="Auto Label Task", font=("Arial", 14))
         page_title.pack(pady=20)
@@ -198,6 +218,11 @@ class LabelBatApp:
         browse_button = tk.Button(self.root, text="Browse", command=self.browse_config_file, font=("Arial", 12))
         browse_button.pack(pady=10)
 
+        # Option for compiling the ROIs into a label image for faster lookups
+        self.use_roi_mask_var = tk.BooleanVar(value=False)
+        roi_mask_check = tk.Checkbutton(self.root, text="Use precomputed ROI mask", variable=self.use_roi_mask_var, font=("Arial", 12))
+        roi_mask_check.pack(pady=10)
+
         # Button for New Video Auto Label
         new_video_button = tk.Button(self.root, text="New Video Auto Label", command=self.new_video_auto_label, font=("Arial", 12))
         new_video_button.pack(pady=10)
@@ -248,6 +273,25 @@ class LabelBatApp:
         self.centered_model_path_var = tk.StringVar()
         centered_model_path_label = tk.Entry(self.root, textvariable=self.centered_model_path_var, width=50, font=("Arial", 12))
         centered_model_path_label.pack(pady=10)
+
+        # Inference batch size used by the auto-labeling
+        batch_size_label = tk.Label(self.root, text="Inference batch size:", font=("Arial", 12))
+        batch_size_label.pack(pady=10)
+        self.batch_size_var = tk.IntVar(value=DEFAULT_BATCH_SIZE)
+        batch_size_entry = tk.Entry(self.root, textvariable=self.batch_size_var, width=10, font=("Arial", 12))
+        batch_size_entry.pack(pady=10)
+
+        # Option for reusing predictions saved next to the video by previous sessions
+        self.cache_predictions_var = tk.BooleanVar(value=True)
+        cache_predictions_check = tk.Checkbutton(self.root, text="Cache predictions", variable=self.cache_predictions_var, font=("Arial", 12))
+        cache_predictions_check.pack(pady=10)
+
+        # Motion gating: frames that barely changed since the last inferred frame reuse its peaks
+        motion_threshold_label = tk.Label(self.root, text="Motion gating threshold (empty = off):", font=("Arial", 12))
+        motion_threshold_label.pack(pady=10)
+        self.motion_threshold_var = tk.StringVar()
+        motion_threshold_entry = tk.Entry(self.root, textvariable=self.motion_threshold_var, width=10, font=("Arial", 12))
+        motion_threshold_entry.pack(pady=10)
         
         # Button to start the auto-labeling process
         start_button = tk.Button(self.root, text="Start", command=self.start_auto_labeling, font=("Arial", 12))
@@ -285,20 +329,49 @@ class LabelBatApp:
         if not video_path or not config_path or not centroid_model_path or not centered_model_path:
             messagebox.showwarning("Input Error", "Please provide the video file, models, and config file path.")
             return
+
+        try:
+            self.batch_size = self.batch_size_var.get()
+        except tk.TclError:
+            self.batch_size = 0
+        if self.batch_size < 1:
+            messagebox.showwarning("Input Error", "Please provide a positive inference batch size.")
+            return
+
+        self.motion_threshold = None
+        if self.motion_threshold_var.get().strip():
+            try:
+                self.motion_threshold = float(self.motion_threshold_var.get())
+            except ValueError:
+                self.motion_threshold = -1
+            if self.motion_threshold < 0:
+                messagebox.showwarning("Input Error", "Please provide a non-negative motion gating threshold, or leave it empty.")
+                return
         
         # Load the video and models
         try:
-            video = sleap.load_video(video_path)
-            predictor = sleap.load_model([centroid_model_path, centered_model_path], batch_size=1)
-
-            # Initialize the simulated camera with pre-loaded frames
-            self.camera = SimulatedCamera(video[:])
-            self.current_frame_index = 0
-            self.total_frames = len(video)
+            self.open_video(video_path)
+            # Models stay loaded between videos; a new video shape only costs a warm-up on blank frames
+            # The predictor may still be running for the previous video, so its lock comes with it
+            predictor, self.inference_lock = get_predictor([centroid_model_path, centered_model_path], batch_size=self.batch_size,
+                                                           frame_shape=self.camera.frames.shape[1:])
+
+            # Open the prediction cache for this video and pair of models. Without it the
+            # predictions are still kept in memory, shared by auto-labeling and display.
+            self.prediction_store = None
+            if self.cache_predictions_var.get():
+                try:
+                    key = prediction_key(video_path, [centroid_model_path, centered_model_path])
+                    self.prediction_store = PredictionStore(self.total_frames, prediction_store_path(video_path, key))
+                except (OSError, ValueError) as e:
+                    print(f"Failed to open the prediction cache, predictions will not be cached: {e}")
+            if self.prediction_store is None:
+                self.prediction_store = PredictionStore(self.total_frames)
 
             # Load shapes config
             with open(config_path, 'r') as json_file:
                 self.shapes_config = json.load(json_file)
+            self.config_path = config_path
 
             # Move to the next page
             self.auto_label_page(predictor)
@@ -306,36 +379,95 @@ class LabelBatApp:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load video or models: {e}")
 
-    def initialize_dataset(self):
-        """Initializes the dataset container and maps frames to labels."""
-        self.frame_labels = {}  # This will map each frame index to its corresponding label
+    def open_video(self, video_path):
+        """Opens a video for random access, through a simulated camera decoding frames on demand."""
+        video = load_sleap().load_video(video_path)
+        self.close_video()
+
+        # Decode through a keyframe index when PyAV is available, so random access
+        # never decodes more than one GOP
+        frame_reader = video
+        if av is not None:
+            try:
+                frame_reader = IndexedVideoReader(video_path, grayscale=video.channels == 1)
+            except Exception as e:
+                print(f"Failed to index the video, falling back to sequential seeking: {e}")
+
+        # Initialize the simulated camera with frames decoded on demand
+        self.camera = SimulatedCamera(VideoFrameSource(frame_reader))
+        self.current_frame_index = 0
+        self.total_frames = len(frame_reader)
+
+    def close_video(self):
+        """Stops the prefetching of the open video, drops its decoded frames and closes its reader."""
+        if getattr(self, "camera", None) is not None:
+            # The auto-labeling worker stops after its current batch; wait for it, since it decodes from the reader
+            self.cancel_auto_label()
+            if getattr(self, "auto_label_thread", None) is not None:
+                self.auto_label_thread.join()
+            self.camera.frames.close()
+            self.camera = None
+
+    def initialize_dataset(self, frame_labels=None):
+        """
+        Initializes the dataset container and maps frames to labels.
+
+        Args:
+            frame_labels (LabelStore): Labels opened for editing. If None, all frames start unlabeled.
+        """
         self.dataset_labeled = False
-        # Initialize polygons from the shapes config
-        self.roi_polygons = {}  # Maps shape names to Polygon objects
-        for shape_name, shape_data in self.shapes_config.items():
-            shape_points = shape_data["shape_points"]
-            poly = Polygon(shape_points)
-            self.roi_polygons[shape_name] = poly
-
-    def auto_label_page(self,predictor):
-        """Displays the auto-label button and buttons for each shape in the JSON config."""
+        self.auto_label_thread = None
+        self.auto_label_cancel = threading.Event()
+        # Initialize the ROI classifier from the shapes config, optionally looking
+        # keypoints up in a label image compiled at the video resolution
+        locator = None
+        if self.use_roi_mask_var.get():
+            _, height, width = self.camera.frames.shape[:3]
+            locator = RoiMask.load_or_compile(self.config_path, self.shapes_config, (width, height))
+        self.roi_classifier = RoiClassifier(self.shapes_config, locator=locator)
+        # Maps each frame index to its label, with the codes of the ROI classifier
+        if frame_labels is None:
+            frame_labels = LabelStore(self.total_frames, self.roi_classifier.labels)
+        self.frame_labels = frame_labels
+
+    def auto_label_page(self, predictor, frame_labels=None):
+        """
+        Displays the auto-label button and buttons for each shape in the JSON config.
+
+        Args:
+            predictor: Loaded SLEAP predictor, or None when editing saved labels without models.
+            frame_labels (LabelStore): Labels opened for editing, if any.
+        """
         for widget in self.root.winfo_children():
             widget.destroy()
 
         
         # Initialize the dataset container
-        self.initialize_dataset()
+        self.initialize_dataset(frame_labels)
         
         # Page title
-        page_title = tk.Label(self.root, text="Auto Labeling Options", font=("Arial", 14))
+        page_title = tk.Label(self.root, text="Auto Labeling Options" if predictor is not None else "Edit Video Labels", font=("Arial", 14))
         page_title.pack(pady=20)
 
-        # Auto-label button
-        labels_title = tk.Label(self.root, text="Auto labeling:", font=("Arial", 12))
-        labels_title.pack(pady=10)
-        
-        auto_label_button = tk.Button(self.root, text="Auto Label", command=lambda: self.auto_label_task(predictor=predictor), font=("Arial", 12))
-        auto_label_button.pack(pady=10)
+        if predictor is not None:
+            # Auto-label button
+            labels_title = tk.Label(self.root, text="Auto labeling:", font=("Arial", 12))
+            labels_title.pack(pady=10)
+
+            self.auto_label_button = tk.Button(self.root, text="Auto Label", command=lambda: self.auto_label_task(predictor=predictor), font=("Arial", 12))
+            self.auto_label_button.pack(pady=10)
+
+            # Cancel button and progress of the auto-labeling running in the background
+            self.cancel_button = tk.Button(self.root, text="Cancel", command=self.cancel_auto_label, state=tk.DISABLED, font=("Arial", 12))
+            self.cancel_button.pack(pady=5)
+            self.progress_display = tk.Label(self.root, text="", font=("Arial", 10))
+            self.progress_display.pack(pady=5)
+
+        if self.profiler.enabled:
+            # Throughput and mean latency of each stage
+            self.stats_display = tk.Label(self.root, text="", font=("Arial", 10))
+            self.stats_display.pack(pady=5)
+            self.root.after(STATS_REFRESH_MS, self.update_stats_display)
 
         # Label for "Labels" section
         labels_title = tk.Label(self.root, text="Manual labeling:", font=("Arial", 12))
@@ -359,11 +491,21 @@ class LabelBatApp:
         # Finish button
         finish_button = tk.Button(self.root, text="Finish", command=self.finish_labeling, font=("Arial", 12))
         finish_button.pack(pady=10)
+
+        # Save runs of frames with the same label instead of one row per frame
+        self.save_segments_var = tk.BooleanVar(value=False)
+        save_segments_check = tk.Checkbutton(self.root, text="Save label segments (Start, End, Label)", variable=self.save_segments_var, font=("Arial", 12))
+        save_segments_check.pack(pady=5)
+
+        # Also save one label per bat and frame, with the bats linked across frames
+        self.save_tracks_var = tk.BooleanVar(value=False)
+        save_tracks_check = tk.Checkbutton(self.root, text="Save per-bat track labels", variable=self.save_tracks_var, font=("Arial", 12))
+        save_tracks_check.pack(pady=5)
         
-                # Frame display
-        self.fig, self.ax = plt.subplots()
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self.root)
-        self.canvas.get_tk_widget().pack()
+        # Frame display
+        frame_width = self.camera.frames.shape[2]
+        self.viewer = FrameViewer(self.root, display_scale=min(1.0, DISPLAY_MAX_WIDTH / frame_width))
+        self.viewer.pack()
 
         # Frame number display
         self.frame_label = tk.Label(self.root, text=f"Frame {self.current_frame_index + 1}", font=("Arial", 12))
@@ -372,69 +514,77 @@ class LabelBatApp:
         
         self.label_display = tk.Label(self.root, text="", font=("Arial", 12))
         self.label_display.pack(pady=10)
+
+        # Random-access navigation
+        navigation_frame = tk.Frame(self.root)
+        navigation_frame.pack(pady=5)
+
+        jump_label = tk.Label(navigation_frame, text="Go to frame:", font=("Arial", 12))
+        jump_label.pack(side=tk.LEFT)
+        self.jump_frame_var = tk.StringVar()
+        jump_entry = tk.Entry(navigation_frame, textvariable=self.jump_frame_var, width=10, font=("Arial", 12))
+        jump_entry.pack(side=tk.LEFT)
+        jump_entry.bind("<Return>", lambda event: self.jump_to_entered_frame(predictor))
+        jump_button = tk.Button(navigation_frame, text="Go", command=lambda: self.jump_to_entered_frame(predictor), font=("Arial", 12))
+        jump_button.pack(side=tk.LEFT, padx=5)
+
+        jump_size_label = tk.Label(navigation_frame, text="Jump size (Shift+Left/Right):", font=("Arial", 12))
+        jump_size_label.pack(side=tk.LEFT, padx=(20, 0))
+        self.jump_size_var = tk.IntVar(value=DEFAULT_JUMP_SIZE)
+        jump_size_entry = tk.Entry(navigation_frame, textvariable=self.jump_size_var, width=6, font=("Arial", 12))
+        jump_size_entry.pack(side=tk.LEFT)
+
+        navigation_help = tk.Label(self.root, text="Ctrl+Left/Right: previous/next label change", font=("Arial", 10))
+        navigation_help.pack()
     
         # Capture keyboard events for navigation
         self.root.bind("<Right>", lambda event: self.show_next_frame(predictor))
         self.root.bind("<Left>", lambda event: self.show_previous_frame(predictor))
+        self.root.bind("<Shift-Right>", lambda event: self.jump_frames(predictor, 1))
+        self.root.bind("<Shift-Left>", lambda event: self.jump_frames(predictor, -1))
+        self.root.bind("<Control-Right>", lambda event: self.jump_to_label_change(predictor, 1))
+        self.root.bind("<Control-Left>", lambda event: self.jump_to_label_change(predictor, -1))
 
         # Show the first frame
         self.show_frame(predictor)
 
+    def get_frame_peaks(self, predictor, frame_idx, frame):
+        """Returns the predicted peaks of a frame, only running inference the first time it is needed."""
+        peaks_np = self.prediction_store.get(frame_idx)
+        if peaks_np is None and predictor is None:
+            # Editing without models: frames missing from the prediction cache have no overlay
+            return np.empty((0, 2, 2), dtype=np.float32)
+        if peaks_np is None:
+            # Predict the skeletons on the frame
+            with self.inference_lock, self.profiler.stage("inference", frames=1):
+                peaks_np = predict_peaks(predictor, np.expand_dims(frame, axis=0))[0]
+            self.prediction_store.put(frame_idx, peaks_np)
+        return peaks_np
+
     def show_frame(self, predictor):
         """Displays the current frame and inference results."""
+        with self.profiler.stage("show_frame", frames=1):
+            self._show_frame(predictor)
+
+    def _show_frame(self, predictor):
         # Get the current frame from the camera
-        frame = self.camera.frames[self.current_frame_index]
-
-        # Predict the skeletons on the frame
-        frame_predictions = predictor.inference_model.predict_on_batch(np.expand_dims(frame, axis=0))
-        peaks_np = np.array(frame_predictions["instance_peaks"][0])
-
-        # Process and display the peaks
-        for peak in peaks_np:
-            if len(peak) >= 1:
-                x_head, y_head = peak[0][0], peak[0][1]
-
-                # Only draw circle if the head coordinates are not NaN
-                if not (np.isnan(x_head) or np.isnan(y_head)):
-                    x_head, y_head = int(x_head), int(y_head)
-                    cv2.circle(frame, (x_head, y_head), 5, (0, 255, 0), -1)  # Green circle for the head point
-
-                # Check if there is a second peak (tail)
-                if len(peak) >= 2:
-                    x_tail, y_tail = peak[1][0], peak[1][1]
-
-                    # Only draw circle if the head coordinates are not NaN
-                    if not (np.isnan(x_tail) or np.isnan(y_tail)):
-                        x_tail, y_tail = int(x_tail), int(y_tail)
-                        cv2.circle(frame, (x_tail, y_tail), 5, (0, 255, 0), -1)  # Green circle for the tail point
-                    
-                    # Only draw circle and line if both head and tail coordinates are not NaN
-                    if not (np.isnan(x_tail) or np.isnan(y_tail)) and not (np.isnan(x_head) or np.isnan(y_head)):
-                        # Draw a red line connecting the two points (head and tail)
-                        cv2.line(frame, (x_head, y_head), (x_tail, y_tail), (0, 0, 255), 2)  # Red line
-
-        # Display the ROI shapes from shapes_config
-        for shape_name, shape_data in self.shapes_config.items():
-            shape_points = shape_data["shape_points"]
-
-            # Convert shape points to integers and draw the polygon or line
-            points = np.array(shape_points, dtype=np.int32)
-            cv2.polylines(frame, [points], isClosed=True, color=(255, 0, 0), thickness=2)  # Blue lines for ROI
+        with self.profiler.stage("decode", frames=1):
+            frame = self.camera.frames[self.current_frame_index]
+        peaks_np = self.get_frame_peaks(predictor, self.current_frame_index, frame)
 
-        
-        if self.dataset_labeled:
-            # Get the label for the current frame
-            current_label = self.frame_labels.get(self.current_frame_index, "None")
+        # Draw on a copy, so the frames served by the camera stay untouched
+        with self.profiler.stage("draw", frames=1):
+            frame = draw_predictions(frame, peaks_np, self.shapes_config)
 
-            # Display the label
-            self.label_display.config(text=f"Label: {current_label}")
+        if self.current_frame_index in self.frame_labels:
+            # Display the label of the current frame, which may be labeled while auto-labeling runs
+            self.label_display.config(text=f"Label: {self.frame_labels[self.current_frame_index]}")
+        else:
+            self.label_display.config(text="")
 
         # Convert BGR frame to RGB and display it
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        self.ax.clear()
-        self.ax.imshow(frame_rgb)
-        self.ax.axis('off')
-        self.canvas.draw()
+        with self.profiler.stage("display", frames=1):
+            self.viewer.show(frame)
 
         # Update frame label
         self.frame_label.config(text=f"Frame {self.current_frame_index + 1}")
@@ -456,24 +606,72 @@ class LabelBatApp:
         else:
             print("Already at the first frame.")
 
+    def jump_to_frame(self, predictor, frame_idx):
+        """Moves to any frame of the video."""
+        frame_idx = min(max(frame_idx, 0), self.total_frames - 1)
+        if frame_idx != self.current_frame_index:
+            self.current_frame_index = frame_idx
+            self.show_frame(predictor)
+
+    def jump_to_entered_frame(self, predictor):
+        """Moves to the frame number typed in the "Go to frame" field."""
+        try:
+            frame_number = int(self.jump_frame_var.get())
+        except ValueError:
+            messagebox.showwarning("Input Error", "Please enter a frame number.")
+            return
+        # Frame numbers are displayed starting from 1
+        self.jump_to_frame(predictor, frame_number - 1)
+
+    def jump_frames(self, predictor, direction):
+        """Moves forward (direction=1) or backward (direction=-1) by the jump size."""
+        try:
+            jump_size = self.jump_size_var.get()
+        except tk.TclError:
+            jump_size = DEFAULT_JUMP_SIZE
+        self.jump_to_frame(predictor, self.current_frame_index + direction * max(jump_size, 1))
+
+    def jump_to_label_change(self, predictor, direction):
+        """Moves to the next (direction=1) or previous (direction=-1) frame whose label differs from the current one."""
+        frame_idx = self.frame_labels.next_change(self.current_frame_index, direction)
+        if frame_idx is not None:
+            self.jump_to_frame(predictor, frame_idx)
+        else:
+            print("No label change in this direction.")
+
     def finish_labeling(self):
         """Handles the finish action after auto-labeling is complete."""
         print("Finished labeling process")
+        self.cancel_auto_label()
+
+        if self.frame_labels.path is not None:
+            # Editing a saved label file: write the changed frames back to it
+            try:
+                num_written = self.frame_labels.save_binary()
+                print(f"Saved {num_written} changed frames to {self.frame_labels.path}")
+            except Exception as e:
+                print(f"Failed to save labels: {e}")
+                messagebox.showerror("Save Error", f"Failed to save labels: {e}")
+                return
+            if not messagebox.askyesno("Export Labels", f"Changes saved to {self.frame_labels.path}. Also export the labels to a CSV file?"):
+                self.start_auto_label()
+                return
 
         # Step 1: Save the frame_labels container to a .csv file
         file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
         if file_path:
             try:
-                with open(file_path, mode='w', newline='') as csv_file:
-                    fieldnames = ['Frame', 'Label']
-                    writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+                self.frame_labels.save(file_path, segments=self.save_segments_var.get())
+                saved = file_path
 
-                    writer.writeheader()
-                    for frame, label in self.frame_labels.items():
-                        writer.writerow({'Frame': frame, 'Label': label})
+                if self.save_tracks_var.get():
+                    # Per-bat labels from the predictions, next to the label file
+                    tracks_path = os.path.splitext(file_path)[0] + ".tracks.csv"
+                    save_track_labels(tracks_path, track_store(self.prediction_store, self.roi_classifier), self.roi_classifier.labels)
+                    saved += f" and {tracks_path}"
 
-                print(f"Labels saved successfully to {file_path}")
-                messagebox.showinfo("Save Complete", f"Labels saved successfully to {file_path}")
+                print(f"Labels saved successfully to {saved}")
+                messagebox.showinfo("Save Complete", f"Labels saved successfully to {saved}")
 
             except Exception as e:
                 print(f"Failed to save labels to CSV: {e}")
@@ -482,68 +680,122 @@ class LabelBatApp:
         self.start_auto_label()
         
     def auto_label_task(self,predictor):
-        """Automatically labels all frames based on the prediction and ROIs."""
-
-        # Run auto-labeling in the background (no display)
-        for frame_idx in range(self.total_frames):
-            frame = self.camera.frames[frame_idx]
-
-            # Get predictions for the current frame
-            frame_predictions = predictor.inference_model.predict_on_batch(np.expand_dims(frame, axis=0))
-            peaks_np = np.array(frame_predictions["instance_peaks"][0])
-
-            # Check if there are predictions
-            if len(peaks_np) > 0:
-                # Loop through the peaks (predicted points)
-                labeled = False
-                for peak in peaks_np:
-                    # Check head point first
-                    if len(peak) >= 1:
-                        x_head, y_head = peak[0][0], peak[0][1]
-                        # Only draw circle if the head coordinates are not NaN
-                        if not (np.isnan(x_head) or np.isnan(y_head)):
-                            point_head = Point(x_head, y_head)
-
-                            # Check if head point is inside any ROI
-                            for shape_name, polygon in self.roi_polygons.items():
-                                if polygon.contains(point_head):
-                                    self.frame_labels[frame_idx] = shape_name  # Label with shape name
-                                    labeled = True
-                                    break  # No need to check other shapes if we have a match
-
-                    # If labeled, we don't need to check tail or other shapes
-                    if labeled:
-                        break
-
-                    # Check tail point if head didn't match
-                    if len(peak) >= 2:
-                        x_tail, y_tail = peak[1][0], peak[1][1]
-                        if not (np.isnan(x_tail) or np.isnan(y_tail)):
-
-                            point_tail = Point(x_tail, y_tail)
-                            for shape_name, polygon in self.roi_polygons.items():
-                                if polygon.contains(point_tail):
-                                    self.frame_labels[frame_idx] = shape_name  # Label with shape name
-                                    labeled = True
-                                    break
-
-                # If no point was inside any ROI, label it as "Explore"
-                if not labeled:
-                    self.frame_labels[frame_idx] = "Explore"
+        """Starts automatically labeling all frames based on the prediction and ROIs."""
+        if self.auto_label_thread is not None and self.auto_label_thread.is_alive():
+            return
+
+        self.motion_gate = MotionGate(self.motion_threshold) if self.motion_threshold is not None else None
+        labeler = AutoLabeler(self.camera.frames, predictor, self.roi_classifier, self.prediction_store,
+                              batch_size=self.batch_size, inference_lock=self.inference_lock, motion_gate=self.motion_gate,
+                              profiler=self.profiler)
+
+        # Run auto-labeling in the background (no display); results come back through a
+        # queue polled from the Tk mainloop, so the window stays responsive
+        self.auto_label_cancel = threading.Event()
+        self.auto_label_messages = queue.Queue()
+        self.auto_label_thread = threading.Thread(target=self.auto_label_worker, args=(labeler, self.auto_label_messages, self.auto_label_cancel), daemon=True)
+
+        self.auto_label_start_time = time.time()
+        self.auto_label_num_labeled = 0
+        self.auto_label_counts = np.zeros(len(self.roi_classifier.labels), dtype=np.int64)
+        self.auto_label_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress_display.config(text="Auto-labeling started...")
+
+        self.auto_label_thread.start()
+        self.root.after(AUTO_LABEL_POLL_MS, self.poll_auto_label)
+
+    @staticmethod
+    def auto_label_worker(labeler, messages, cancel_event):
+        """Runs the auto-labeling in a worker thread and posts the results to `messages`."""
+        try:
+            for start, codes in labeler.run():
+                messages.put(("labels", start, codes))
+                if cancel_event.is_set():
+                    break
+            messages.put(("done", cancel_event.is_set()))
+        except Exception as e:
+            messages.put(("error", e))
+
+    def poll_auto_label(self):
+        """Applies the results posted by the auto-labeling worker and updates the progress."""
+        # Stop polling once the user left the auto-label page
+        if not self.progress_display.winfo_exists():
+            return
+
+        finished = None
+        while finished is None:
+            try:
+                message = self.auto_label_messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if message[0] == "labels":
+                _, start, codes = message
+                self.label_frames(start, codes)
             else:
-                # If there is no prediction for the current frame, label it as "None"
-                self.frame_labels[frame_idx] = "None"
+                finished = message
+
+        self.update_auto_label_progress()
+        if finished is None:
+            self.root.after(AUTO_LABEL_POLL_MS, self.poll_auto_label)
+            return
+
+        self.auto_label_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        if finished[0] == "error":
+            messagebox.showerror("Error", f"Auto-labeling failed: {finished[1]}")
+            return
+        if finished[1]:
+            self.progress_display.config(text=self.progress_display.cget("text") + " (cancelled)")
+            return
 
-        # # After auto-labeling, display the frames with labels interactively
-        # self.show_labeled_frames()
         self.dataset_labeled = True
-        
+
         # Get the label for the current frame
         current_label = self.frame_labels.get(self.current_frame_index, "None")
 
         # Display the label
         self.label_display.config(text=f"Label: {current_label}")
-        
+
+    def update_auto_label_progress(self):
+        """Shows the auto-labeling throughput, ETA and per-label counts."""
+        elapsed = time.time() - self.auto_label_start_time
+        fps = self.auto_label_num_labeled / elapsed if elapsed > 0 else 0.0
+        remaining = self.total_frames - self.auto_label_num_labeled
+        eta = f"{remaining / fps:.0f}s" if fps > 0 else "-"
+        counts = ", ".join(f"{label}: {count}" for label, count in zip(self.roi_classifier.labels, self.auto_label_counts) if count)
+        skipped = f" | {self.motion_gate.num_skipped} skipped by motion gating" if self.motion_gate is not None else ""
+
+        self.progress_display.config(text=f"{self.auto_label_num_labeled}/{self.total_frames} frames | {fps:.1f} frames/s | ETA {eta}{skipped}\n{counts}")
+
+    def update_stats_display(self):
+        """Refreshes the stage timings status line while the auto-label page is shown."""
+        if not self.stats_display.winfo_exists():
+            return
+        status = self.profiler.status_line(fps_stages=[("viewer", "show_frame"), ("labeling", "roi")],
+                                           stages=[stage for stage in self.profiler.stages() if stage != "show_frame"])
+        self.stats_display.config(text=status)
+        self.root.after(STATS_REFRESH_MS, self.update_stats_display)
+
+    def cancel_auto_label(self):
+        """Asks the auto-labeling worker to stop after the current batch."""
+        if getattr(self, "auto_label_thread", None) is not None and self.auto_label_thread.is_alive():
+            self.auto_label_cancel.set()
+            if self.cancel_button.winfo_exists():
+                self.cancel_button.config(state=tk.DISABLED)
+
+    def label_frames(self, start, codes):
+        """Labels consecutive frames, starting at `start`, from their label codes."""
+        self.frame_labels.set_codes(start, codes)
+
+        self.auto_label_num_labeled += len(codes)
+        self.auto_label_counts += np.bincount(codes, minlength=len(self.auto_label_counts))
+
+        # Refresh the label of the current frame if it was just labeled
+        if start <= self.current_frame_index < start + len(codes):
+            self.label_display.config(text=f"Label: {self.frame_labels[self.current_frame_index]}")
+
     def label_shape(self, shape_name):
         """Handles the task for manually labeling the current frame with a specific shape."""
 
@@ -557,15 +809,99 @@ class LabelBatApp:
         print(f"Frame {self.current_frame_index} manually labeled as '{shape_name}'")
 
     def edit_video_labels(self):
-        """Placeholder function for editing video labels."""
+        """Navigates to the page for reopening a video with its saved labels and cached predictions."""
         config_path = self.config_path_var.get()
         if not config_path:
             messagebox.showwarning("Input Error", "Please provide a valid config file path.")
             return
-        print(f"Editing Video Labels with config: {config_path}")
-        # Add functionality for editing labels in the video
+        self.config_path = config_path
+
+        for widget in self.root.winfo_children():
+            widget.destroy()
+
+        page_title = tk.Label(self.root, text="Edit Video Labels", font=("Arial", 14))
+        page_title.pack(pady=20)
+
+        # Video, label file and prediction cache inputs, each with a browse button
+        self.video_path_var = tk.StringVar()
+        self.label_file_path_var = tk.StringVar()
+        self.predictions_path_var = tk.StringVar()
+        inputs = [
+            ("Load .mp4 File", self.upload_video_file, self.video_path_var),
+            ("Load Label File (.csv or .npy)", self.upload_label_file, self.label_file_path_var),
+            ("Load Predictions Dir (optional)", self.upload_predictions_dir, self.predictions_path_var),
+        ]
+        for text, command, path_var in inputs:
+            upload_button = tk.Button(self.root, text=text, command=command, font=("Arial", 12))
+            upload_button.pack(pady=10)
+            path_entry = tk.Entry(self.root, textvariable=path_var, width=50, font=("Arial", 12))
+            path_entry.pack(pady=10)
+
+        open_button = tk.Button(self.root, text="Open", command=self.open_video_labels, font=("Arial", 12))
+        open_button.pack(pady=10)
+
+        back_button = tk.Button(self.root, text="Back", command=self.start_auto_label, font=("Arial", 12))
+        back_button.pack(pady=10)
+
+    def upload_label_file(self):
+        """Opens a file dialog to select a saved label file."""
+        file_path = filedialog.askopenfilename(filetypes=[("Label files", "*.csv *.npy")])
+        if file_path:
+            self.label_file_path_var.set(file_path)
+
+    def upload_predictions_dir(self):
+        """Opens a file dialog to select a prediction cache directory."""
+        file_path = filedialog.askdirectory()
+        if file_path:
+            self.predictions_path_var.set(file_path)
+
+    def open_video_labels(self):
+        """Opens the video, its labels and cached predictions, and moves to the labeling page without models."""
+        video_path = self.video_path_var.get()
+        label_file_path = self.label_file_path_var.get()
+        predictions_path = self.predictions_path_var.get()
+
+        if not video_path or not label_file_path:
+            messagebox.showwarning("Input Error", "Please provide the video file and the label file.")
+            return
+        if predictions_path and not os.path.isfile(os.path.join(predictions_path, "num_instances.npy")):
+            messagebox.showwarning("Input Error", f"{predictions_path} is not a prediction cache directory.")
+            return
+
+        try:
+            # Everything below is opened lazily: frames are decoded when shown, and the labels
+            # and predictions are memory-mapped
+            self.open_video(video_path)
+            with open(self.config_path, 'r') as json_file:
+                self.shapes_config = json.load(json_file)
+
+            categories = [EXPLORE_LABEL, NONE_LABEL, *self.shapes_config]
+            frame_labels = LabelStore.open_for_editing(label_file_path, self.total_frames, categories)
+            self.prediction_store = PredictionStore(self.total_frames, predictions_path or None)
+            # No models are loaded, so nothing runs inference
+            self.inference_lock = threading.Lock()
+
+            self.auto_label_page(None, frame_labels=frame_labels)
+
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to open video or labels: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bat actions auto-label tool.")
+    parser.add_argument("--profile", action="store_true", help="Time the labeling stages and show them on the auto-label page.")
+    parser.add_argument("--trace", default=None, help="Write the stage timings to this Chrome trace-event JSON file on exit (implies --profile).")
+    parser.add_argument("--max_models", type=int, default=predictor_registry.max_predictors,
+                        help="Number of loaded model pairs kept between videos (lower it when memory is tight, 0 reloads every time).")
+    args = parser.parse_args()
+    predictor_registry.set_max_predictors(args.max_models)
+
+    profiler = Profiler(trace=args.trace is not None) if args.profile or args.trace else None
     root = tk.Tk()
-    app = LabelBatApp(root)
+    app = LabelBatApp(root, profiler=profiler)
     root.mainloop()
+
+    if profiler is not None:
+        profiler.print_summary()
+        if args.trace:
+            num_events = profiler.save_trace(args.trace)
+            print(f"Wrote {num_events} trace events to {args.trace}")
@@ -0,0 +1,272 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import time
+
+from labels import LabelStore
+from labeling import AutoLabeler, DEFAULT_BATCH_SIZE, DEFAULT_MOTION_REFRESH, MotionGate
+from models import get_predictor, load_sleap
+from predictions import PredictionStore, prediction_key, prediction_store_path
+from roi import RoiClassifier, RoiMask, load_roi_config
+from tracking import num_tracks, save_track_labels, track_store
+from utils import VideoFrameSource
+
+# State of each worker process, set up once by `init_worker`
+_worker = {}
+
+
+def expand_video_paths(patterns):
+    """Expands glob patterns into a sorted list of unique video paths."""
+    video_paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in video_paths:
+                video_paths.append(path)
+    return video_paths
+
+
+def label_file_path(video_path, output_dir=None, suffix=".labels.csv", root_dir=None):
+    """
+    Path of the label file written for a video, next to it unless `output_dir` is given.
+
+    In `output_dir`, the label file keeps the path of the video relative to `root_dir`, so
+    videos with the same name in different directories get different label files.
+    """
+    if not output_dir:
+        return os.path.splitext(video_path)[0] + suffix
+    relative_path = os.path.relpath(os.path.abspath(video_path), root_dir) if root_dir else os.path.basename(video_path)
+    return os.path.join(output_dir, os.path.splitext(relative_path)[0] + suffix)
+
+
+def videos_root_dir(video_paths):
+    """Deepest directory containing all the videos."""
+    return os.path.commonpath([os.path.dirname(os.path.abspath(video_path)) for video_path in video_paths])
+
+
+def duplicate_label_files(video_paths, output_dir=None, root_dir=None):
+    """
+    Finds videos whose label files would overwrite each other (e.g. clip.mp4 and clip.avi).
+
+    Returns:
+        dict: Label file path -> the videos writing it, for the paths written more than once.
+    """
+    videos_per_path = {}
+    for video_path in video_paths:
+        output_path = os.path.abspath(label_file_path(video_path, output_dir, root_dir=root_dir))
+        videos_per_path.setdefault(output_path, []).append(video_path)
+    return {output_path: videos for output_path, videos in videos_per_path.items() if len(videos) > 1}
+
+
+def init_worker(config_path, shapes_config, centroid_model_path, centered_model_path, batch_size, use_roi_mask, cache_predictions,
+                motion_threshold=None, motion_refresh=DEFAULT_MOTION_REFRESH, save_segments=False, save_tracks=False):
+    """
+    Sets up the labeling parameters of a worker process.
+
+    Nothing here may fail: a pool whose initializer raises respawns its workers forever. The
+    models are loaded by the first `label_video` of the worker and then kept in the registry,
+    so a model that fails to load fails the videos instead.
+    """
+    _worker["model_paths"] = [centroid_model_path, centered_model_path]
+    _worker["config_path"] = config_path
+    _worker["shapes_config"] = shapes_config
+    _worker["batch_size"] = batch_size
+    _worker["use_roi_mask"] = use_roi_mask
+    _worker["cache_predictions"] = cache_predictions
+    _worker["motion_threshold"] = motion_threshold
+    _worker["motion_refresh"] = motion_refresh
+    _worker["save_segments"] = save_segments
+    _worker["save_tracks"] = save_tracks
+
+
+def label_video(video_path, output_dir=None, root_dir=None):
+    """
+    Auto-labels a video in a worker process and writes its label file.
+
+    Args:
+        video_path (str): Path to the video.
+        output_dir (str): Directory for the label files. Defaults to next to the video.
+        root_dir (str): Directory the label file paths in `output_dir` are relative to (see `label_file_path`).
+
+    Returns:
+        dict: Summary of the run for the video.
+    """
+    start_time = time.time()
+    video = load_sleap().load_video(video_path)
+    frames = VideoFrameSource(video, prefetch_ahead=0, prefetch_behind=0)
+    try:
+        return _label_frames(video_path, frames, output_dir, root_dir, start_time)
+    finally:
+        # Workers live for many videos, so close the video reader even when labeling fails
+        frames.close()
+
+
+def _label_frames(video_path, frames, output_dir, root_dir, start_time):
+    """Labels the frames of a video opened by `label_video` and writes its label files."""
+    num_frames = len(frames)
+    predictor, inference_lock = get_predictor(_worker["model_paths"], _worker["batch_size"], frame_shape=frames.shape[1:])
+
+    locator = None
+    if _worker["use_roi_mask"]:
+        _, height, width = frames.shape[:3]
+        locator = RoiMask.load_or_compile(_worker["config_path"], _worker["shapes_config"], (width, height))
+    roi_classifier = RoiClassifier(_worker["shapes_config"], locator=locator)
+
+    if _worker["cache_predictions"]:
+        key = prediction_key(video_path, _worker["model_paths"])
+        prediction_store = PredictionStore(num_frames, prediction_store_path(video_path, key))
+    else:
+        prediction_store = PredictionStore(num_frames)
+
+    motion_gate = None
+    if _worker["motion_threshold"] is not None:
+        motion_gate = MotionGate(_worker["motion_threshold"], refresh_interval=_worker["motion_refresh"])
+    num_cached = num_frames - len(prediction_store.missing(include_reused=motion_gate is None))
+
+    labeler = AutoLabeler(frames, predictor, roi_classifier, prediction_store, batch_size=_worker["batch_size"],
+                          inference_lock=inference_lock, motion_gate=motion_gate)
+    frame_labels = LabelStore(num_frames, roi_classifier.labels)
+    for start, chunk_codes in labeler.run():
+        frame_labels.set_codes(start, chunk_codes)
+
+    output_path = label_file_path(video_path, output_dir, root_dir=root_dir)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    frame_labels.save(output_path, segments=_worker["save_segments"])
+
+    # Per-bat labels: instances linked into tracks, one row per track seen in a frame
+    video_num_tracks = None
+    if _worker["save_tracks"]:
+        track_labels = track_store(prediction_store, roi_classifier)
+        save_track_labels(label_file_path(video_path, output_dir, suffix=".tracks.csv", root_dir=root_dir), track_labels,
+                          roi_classifier.labels)
+        video_num_tracks = num_tracks(track_labels)
+
+    counts = frame_labels.counts()
+    return {
+        "video_path": video_path,
+        "output_path": output_path,
+        "num_frames": num_frames,
+        "num_cached": num_cached,
+        "num_skipped": motion_gate.num_skipped if motion_gate is not None else 0,
+        "num_tracks": video_num_tracks,
+        "elapsed": time.time() - start_time,
+        "counts": {label: int(count) for label, count in zip(roi_classifier.labels, counts) if count},
+    }
+
+
+def _label_video_task(args):
+    video_path, output_dir, root_dir = args
+    try:
+        return label_video(video_path, output_dir, root_dir)
+    except Exception as e:
+        return {"video_path": video_path, "error": f"{type(e).__name__}: {e}"}
+
+
+def run(video_paths, config_path, centroid_model_path, centered_model_path, output_dir=None, workers=1,
+        batch_size=DEFAULT_BATCH_SIZE, use_roi_mask=False, cache_predictions=True, motion_threshold=None,
+        motion_refresh=DEFAULT_MOTION_REFRESH, save_segments=False, save_tracks=False):
+    """
+    Auto-labels many videos, spread across a pool of worker processes.
+
+    Each worker loads the models once and then labels videos until none are left. If
+    `motion_threshold` is set, frames that barely changed since the last inferred frame
+    reuse its peaks (see `MotionGate`). In `output_dir`, label files keep the directory
+    layout of the videos below their common directory.
+
+    Returns:
+        list: Summary of the run for each video.
+
+    Raises:
+        ValueError: If two videos would write the same label file, or a model is missing.
+        OSError: If the ROI config cannot be read.
+    """
+    # Checked here rather than in the workers, where a failure would hang the pool
+    shapes_config = load_roi_config(config_path)
+    for model_path in (centroid_model_path, centered_model_path):
+        if not os.path.exists(model_path):
+            raise ValueError(f"Model not found: {model_path}")
+
+    root_dir = videos_root_dir(video_paths) if output_dir and video_paths else None
+    duplicates = duplicate_label_files(video_paths, output_dir, root_dir)
+    if duplicates:
+        raise ValueError("Several videos would write the same label file: " +
+                         "; ".join(f"{output_path} ({', '.join(videos)})" for output_path, videos in duplicates.items()))
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    start_time = time.time()
+    results = []
+    # TensorFlow does not survive a fork, so workers are always spawned
+    context = multiprocessing.get_context("spawn")
+    initargs = (config_path, shapes_config, centroid_model_path, centered_model_path, batch_size, use_roi_mask, cache_predictions,
+                motion_threshold, motion_refresh, save_segments, save_tracks)
+    with context.Pool(processes=workers, initializer=init_worker, initargs=initargs) as pool:
+        tasks = [(video_path, output_dir, root_dir) for video_path in video_paths]
+        for result in pool.imap_unordered(_label_video_task, tasks):
+            if "error" in result:
+                print(f"[failed] {result['video_path']}: {result['error']}")
+            else:
+                print(f"[done] {result['video_path']}: {result['num_frames']} frames "
+                      f"({result['num_cached']} cached, {result['num_skipped']} skipped) "
+                      f"in {result['elapsed']:.1f}s -> {result['output_path']}"
+                      + (f" ({result['num_tracks']} tracks)" if result["num_tracks"] is not None else ""))
+            results.append(result)
+
+    print_summary(results, time.time() - start_time)
+    return results
+
+
+def print_summary(results, elapsed):
+    """Prints the throughput of a run."""
+    done = [result for result in results if "error" not in result]
+    total_frames = sum(result["num_frames"] for result in done)
+    total_skipped = sum(result["num_skipped"] for result in done)
+    print("\n--- Auto-label summary ---")
+    print(f"Videos: {len(done)} labeled, {len(results) - len(done)} failed")
+    print(f"Frames: {total_frames}")
+    print(f"Skipped by motion gating: {total_skipped} ({100 * total_skipped / total_frames if total_frames else 0.0:.1f}%)")
+    print(f"Wall time: {elapsed:.1f}s")
+    print(f"Throughput: {total_frames / elapsed if elapsed > 0 else 0.0:.1f} frames/s")
+
+
+if __name__ == "__main__":
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Auto-label videos from ROIs and SLEAP predictions, without the GUI.")
+    parser.add_argument("--videos", required=True, nargs="+", help="Video files or glob patterns (quote them to let the script expand them).")
+    parser.add_argument("--roi_config", required=True, help="Path to the ROI JSON config file.")
+    parser.add_argument("--centroid_model_path", required=True, help="Path to the centroid SLEAP model.")
+    parser.add_argument("--centered_instance_model_path", required=True, help="Path to the centered instance model.")
+    parser.add_argument("--output_dir", default=None, help="Directory for the label files. Defaults to next to each video.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE, help="Inference batch size.")
+    parser.add_argument("--roi_mask", action="store_true", help="Look keypoints up in a precomputed ROI mask.")
+    parser.add_argument("--no_cache", action="store_true", help="Do not read or write the prediction cache next to the videos.")
+    parser.add_argument("--segments", action="store_true",
+                        help="Write label segments (Start, End, Label) instead of one row per frame.")
+    parser.add_argument("--tracks", action="store_true",
+                        help="Also link the bats across frames and write per-track labels to <video>.tracks.csv.")
+    parser.add_argument("--motion_threshold", type=float, default=None,
+                        help="Reuse the previous peaks on frames whose downsampled difference to the last inferred frame "
+                             "stays below this many gray levels. Disabled by default.")
+    parser.add_argument("--motion_refresh", type=int, default=DEFAULT_MOTION_REFRESH,
+                        help="With --motion_threshold, run inference at least once every this many frames.")
+    args = parser.parse_args()
+
+    video_paths = expand_video_paths(args.videos)
+    if not video_paths:
+        parser.error("No videos matched.")
+
+    root_dir = videos_root_dir(video_paths) if args.output_dir else None
+    duplicates = duplicate_label_files(video_paths, args.output_dir, root_dir)
+    if duplicates:
+        parser.error("Several videos would write the same label file:\n" +
+                     "\n".join(f"  {output_path}: {', '.join(videos)}" for output_path, videos in duplicates.items()))
+
+    try:
+        run(video_paths, args.roi_config, args.centroid_model_path, args.centered_instance_model_path,
+            output_dir=args.output_dir, workers=args.workers, batch_size=args.batch_size,
+            use_roi_mask=args.roi_mask, cache_predictions=not args.no_cache, motion_threshold=args.motion_threshold,
+            motion_refresh=args.motion_refresh, save_segments=args.segments, save_tracks=args.tracks)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
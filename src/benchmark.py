@@ -0,0 +1,838 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+from labeling import DEFAULT_BATCH_SIZE, DEFAULT_MOTION_REFRESH
+
+
+class SyntheticFrames:
+    """
+    Synthetic video of a bright blob moving over a static noisy background, rendered on access.
+
+    It indexes like a decoded video (`frames[i]`, `len(frames)`), so long or high resolution
+    videos never have to fit in memory, and every access pays a copy like a decode would.
+
+    Attributes:
+        num_frames: Number of frames.
+        background: Static background, with shape (height, width, channels).
+        radius: Radius of the blob.
+    """
+    def __init__(self, num_frames, height, width, channels=3, seed=0):
+        rng = np.random.default_rng(seed)
+        self.num_frames = num_frames
+        self.background = rng.integers(0, 64, size=(height, width, channels), dtype=np.uint8)
+        self.radius = max(2, min(height, width) // 40)
+
+    def __len__(self):
+        return self.num_frames
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self.num_frames:
+            raise IndexError(f"Frame index {idx} out of range for {self.num_frames} frames")
+        height, width, channels = self.background.shape
+        frame = self.background.copy()
+        center = (int(width / 2 + width / 3 * np.cos(idx / 25)), int(height / 2 + height / 3 * np.sin(idx / 25)))
+        cv2.circle(frame, center, self.radius, (255,) * channels, -1)
+        return frame
+
+
+def iter_synthetic_frames(num_frames, height, width, channels=3, seed=0):
+    """
+    Yields frames of a bright blob moving over a static noisy background.
+
+    Args:
+        num_frames (int): Number of frames.
+        height (int): Frame height.
+        width (int): Frame width.
+        channels (int): Number of channels.
+        seed (int): Seed of the background noise.
+
+    Yields:
+        np.ndarray: Frame with shape (height, width, channels), uint8.
+    """
+    frames = SyntheticFrames(num_frames, height, width, channels, seed)
+    for i in range(num_frames):
+        yield frames[i]
+
+
+def synthetic_frames(num_frames, height, width, channels=3, seed=0):
+    """Synthetic frames (see `iter_synthetic_frames`) as an array of shape (frames, height, width, channels)."""
+    return np.stack(list(iter_synthetic_frames(num_frames, height, width, channels, seed)))
+
+
+def write_synthetic_video(video_path, num_frames, height, width, fps=30):
+    """Writes synthetic frames to an mp4 file without holding the video in memory."""
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    for frame in iter_synthetic_frames(num_frames, height, width):
+        writer.write(frame)
+    writer.release()
+
+
+def synthetic_roi_config(num_rois, width, height, vertices=6, seed=0):
+    """
+    ROI config of a multi-cage rig: `num_rois` jittered polygons tiled over the frame.
+
+    Returns:
+        dict: ROI config mapping shape names to {"shape_points": [...]}.
+    """
+    rng = np.random.default_rng(seed)
+    num_cols = int(np.ceil(np.sqrt(num_rois * width / height)))
+    num_rows = int(np.ceil(num_rois / num_cols))
+    tile_width, tile_height = width / num_cols, height / num_rows
+
+    shapes_config = {}
+    for i in range(num_rois):
+        row, col = divmod(i, num_cols)
+        center = np.array([(col + 0.5) * tile_width, (row + 0.5) * tile_height])
+        angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False) + rng.uniform(0, np.pi / vertices)
+        radii = rng.uniform(0.3, 0.45, vertices)[:, None] * [tile_width, tile_height]
+        points = center + radii * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        shapes_config[f"cage_{i}"] = {"shape_points": np.round(points).astype(int).tolist()}
+    return shapes_config
+
+
+def synthetic_trajectories(num_frames, num_instances, width, height, dropout=0.05, seed=0):
+    """
+    Head and tail keypoints of bats flying smooth random paths, as the predictor would return them.
+
+    Instances come in a random order in each frame, and each one is missed with
+    probability `dropout`.
+
+    Returns:
+        tuple: (peaks with shape (frames, instances, 2, 2) padded with NaN, number of instances
+        per frame, true identity of each instance with shape (frames, instances), -1 for padding).
+    """
+    rng = np.random.default_rng(seed)
+    # Velocities drift randomly around zero, at a few pixels per frame
+    velocity = np.zeros((num_frames, num_instances, 2))
+    noise = rng.normal(0, 0.6, size=(num_frames, num_instances, 2))
+    for frame in range(1, num_frames):
+        velocity[frame] = 0.95 * velocity[frame - 1] + noise[frame]
+    positions = rng.uniform(0, [width, height], size=(num_instances, 2)) + np.cumsum(velocity, axis=0)
+    # Fold the paths back into the frame
+    positions = np.abs((positions + [width, height]) % (2 * np.array([width, height])) - [width, height])
+
+    heading = np.arctan2(velocity[..., 1], velocity[..., 0])
+    offset = 10 * np.stack([np.cos(heading), np.sin(heading)], axis=-1)
+    keypoints = np.stack([positions + offset, positions - offset], axis=2)
+
+    peaks = np.full((num_frames, num_instances, 2, 2), np.nan)
+    identities = np.full((num_frames, num_instances), -1, dtype=np.int32)
+    num_detected = np.zeros(num_frames, dtype=np.int32)
+    detected = rng.random((num_frames, num_instances)) >= dropout
+    for frame in range(num_frames):
+        order = rng.permutation(np.flatnonzero(detected[frame]))
+        peaks[frame, :len(order)] = keypoints[frame, order]
+        identities[frame, :len(order)] = order
+        num_detected[frame] = len(order)
+    return peaks, num_detected, identities
+
+
+def synthetic_keypoints(num_frames, max_instances, num_nodes=2, noise=1.0, miss_rate=0.1, false_positive_rate=0.1, seed=0):
+    """
+    Ground truth and predicted keypoints of a labeled project, as `metrics.evaluate_keypoints` takes them.
+
+    Predictions are the ground truth plus Gaussian noise; each GT instance is missed with
+    probability `miss_rate`, and each frame gets a false positive with probability
+    `false_positive_rate`.
+    """
+    rng = np.random.default_rng(seed)
+    num_gt = rng.integers(1, max_instances + 1, size=num_frames)
+    is_gt = np.arange(max_instances) < num_gt[:, None]
+
+    # Nodes spread along the body of each bat, 40 px long
+    centers = rng.uniform(0, 1000, size=(num_frames, max_instances, 1, 2))
+    heading = rng.uniform(0, 2 * np.pi, size=(num_frames, max_instances, 1))
+    along = np.linspace(-20, 20, num_nodes)[None, None, :, None]
+    points_gt = centers + along * np.stack([np.cos(heading), np.sin(heading)], axis=-1)
+    points_gt += rng.normal(0, 5, size=points_gt.shape)
+    points_gt[~is_gt] = np.nan
+
+    # Detected instances, then an optional false positive, packed at the start of each frame
+    points_pr = np.concatenate([points_gt + rng.normal(0, noise, size=points_gt.shape),
+                                rng.uniform(0, 1000, size=(num_frames, 1, num_nodes, 2))], axis=1)
+    scores_pr = np.concatenate([rng.uniform(0.5, 1, size=(num_frames, max_instances)),
+                                rng.uniform(0, 0.6, size=(num_frames, 1))], axis=1)
+    is_pr = np.concatenate([is_gt & (rng.random(is_gt.shape) >= miss_rate),
+                            rng.random((num_frames, 1)) < false_positive_rate], axis=1)
+    order = np.argsort(~is_pr, axis=1, kind="stable")
+    points_pr = np.take_along_axis(points_pr, order[:, :, None, None], axis=1)
+    scores_pr = np.take_along_axis(scores_pr, order, axis=1)
+    num_pr = is_pr.sum(axis=1)
+    is_pr = np.arange(max_instances + 1) < num_pr[:, None]
+    points_pr[~is_pr] = np.nan
+    scores_pr[~is_pr] = np.nan
+
+    return {
+        "points_gt": points_gt,
+        "num_gt": num_gt,
+        "points_pr": points_pr,
+        "scores_pr": scores_pr,
+        "num_pr": num_pr,
+        "frame_idxs": np.arange(num_frames),
+        "node_names": np.array([f"node{node}" for node in range(num_nodes)]),
+    }
+
+
+def keypoint_labels(keypoints):
+    """Builds the SLEAP ground truth and predicted labels holding keypoint arrays, on a blank video."""
+    import sleap
+
+    skeleton = sleap.Skeleton.from_names_and_edge_inds(keypoints["node_names"].tolist())
+    video = sleap.Video.from_numpy(np.zeros((int(keypoints["frame_idxs"].max()) + 1, 1, 1, 1), dtype=np.uint8))
+    frames_gt = []
+    frames_pr = []
+    for frame, frame_idx in enumerate(keypoints["frame_idxs"].tolist()):
+        instances_gt = [sleap.Instance.from_numpy(points, skeleton)
+                        for points in keypoints["points_gt"][frame, :keypoints["num_gt"][frame]]]
+        instances_pr = [sleap.PredictedInstance.from_numpy(points, np.ones(len(points)), score, skeleton)
+                        for points, score in zip(keypoints["points_pr"][frame, :keypoints["num_pr"][frame]],
+                                                 keypoints["scores_pr"][frame])]
+        frames_gt.append(sleap.LabeledFrame(video=video, frame_idx=frame_idx, instances=instances_gt))
+        frames_pr.append(sleap.LabeledFrame(video=video, frame_idx=frame_idx, instances=instances_pr))
+    return sleap.Labels(frames_gt), sleap.Labels(frames_pr)
+
+
+class StubInferenceModel:
+    """
+    Stands in for the inference model of a SLEAP predictor, without TensorFlow.
+
+    `predict_on_batch` returns `instance_peaks` like SLEAP does: up to `num_instances`
+    instances per frame, the missing ones padded with NaN. Peaks are a function of the
+    frame content only, so runs are reproducible whatever the batching.
+
+    Attributes:
+        num_instances: Largest number of instances per frame.
+        num_nodes: Number of nodes per instance.
+        latency: Time spent per frame, in seconds, to emulate the network.
+    """
+    def __init__(self, num_instances, num_nodes=2, latency=0.0):
+        self.num_instances = num_instances
+        self.num_nodes = num_nodes
+        self.latency = latency
+
+    def predict_on_batch(self, frames):
+        if self.latency:
+            time.sleep(self.latency * len(frames))
+        height, width = frames.shape[1:3]
+        peaks = np.full((len(frames), self.num_instances, self.num_nodes, 2), np.nan, dtype=np.float32)
+        for i, frame in enumerate(frames):
+            rng = np.random.default_rng(zlib.crc32(frame[::max(1, height // 16), ::max(1, width // 16)].tobytes()))
+            num_detected = rng.integers(0, self.num_instances + 1)
+            centers = rng.uniform(0, [width, height], size=(num_detected, 1, 2))
+            peaks[i, :num_detected] = centers + rng.normal(0, 10, size=(num_detected, self.num_nodes, 2))
+        return {"instance_peaks": peaks}
+
+
+class StubPredictor:
+    """Loaded SLEAP predictor stand-in: only exposes `inference_model`, which is all the pipeline uses."""
+    def __init__(self, num_instances, num_nodes=2, latency=0.0):
+        self.inference_model = StubInferenceModel(num_instances, num_nodes, latency)
+
+
+def summarize_latencies(latencies):
+    """Summarizes latencies measured in seconds."""
+    latencies = np.asarray(latencies)
+    return {
+        "mean_ms": 1000 * latencies.mean(),
+        "p50_ms": 1000 * np.percentile(latencies, 50),
+        "p95_ms": 1000 * np.percentile(latencies, 95),
+        "fps": 1 / latencies.mean(),
+    }
+
+
+def benchmark_viewer(args):
+    """Measures frame-to-screen latency of the matplotlib viewer and of the direct blit viewer."""
+    import tkinter as tk
+    from viewer import FigureFrameViewer, FrameViewer
+
+    frames = synthetic_frames(args.frames, args.height, args.width)
+    viewers = {
+        "matplotlib": lambda root: FigureFrameViewer(root),
+        "blit": lambda root: FrameViewer(root),
+        f"blit@{args.display_scale:g}": lambda root: FrameViewer(root, display_scale=args.display_scale),
+    }
+
+    for name, make_viewer in viewers.items():
+        root = tk.Tk()
+        viewer = make_viewer(root)
+        viewer.pack()
+        viewer.show(frames[0])
+        root.update()
+
+        latencies = []
+        for frame in frames:
+            start_time = time.perf_counter()
+            viewer.show(frame)
+            # Let Tk draw the new frame before stopping the clock
+            root.update()
+            latencies.append(time.perf_counter() - start_time)
+        root.destroy()
+
+        stats = summarize_latencies(latencies)
+        print(f"{name:>12}: mean {stats['mean_ms']:.2f} ms | p50 {stats['p50_ms']:.2f} ms | "
+              f"p95 {stats['p95_ms']:.2f} ms | {stats['fps']:.1f} fps")
+
+
+def benchmark_seek(args):
+    """Measures random seek latency on a long video, with and without the keyframe index."""
+    from video_index import IndexedVideoReader, KeyframeIndex
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = args.video
+        if video_path is None:
+            video_path = os.path.join(tmp_dir, "synthetic.mp4")
+            print(f"Writing a synthetic video with {args.frames} frames of {args.width}x{args.height}...")
+            write_synthetic_video(video_path, args.frames, args.height, args.width)
+
+        start_time = time.perf_counter()
+        KeyframeIndex.build(video_path)
+        build_time = time.perf_counter() - start_time
+        # Saves the sidecar on the first call, like the app does
+        KeyframeIndex.load_or_build(video_path)
+        start_time = time.perf_counter()
+        index = KeyframeIndex.load_or_build(video_path)
+        load_time = time.perf_counter() - start_time
+        gop_sizes = np.diff(np.append(index.keyframes, len(index)))
+        print(f"Index: {len(index)} frames, {len(index.keyframes)} keyframes (max GOP {gop_sizes.max()}) | "
+              f"built in {1000 * build_time:.1f} ms, loaded in {1000 * load_time:.1f} ms")
+
+        rng = np.random.default_rng(0)
+        targets = rng.integers(0, len(index), size=args.seeks)
+
+        reader = IndexedVideoReader(video_path, index=index)
+        latencies = []
+        for frame_idx in targets:
+            start_time = time.perf_counter()
+            reader.get_frame(frame_idx)
+            latencies.append(time.perf_counter() - start_time)
+        reader.close()
+        stats = summarize_latencies(latencies)
+        print(f"{'indexed':>8}: mean {stats['mean_ms']:.2f} ms | p50 {stats['p50_ms']:.2f} ms | p95 {stats['p95_ms']:.2f} ms")
+
+        # Baseline: OpenCV seek, as used by sleap.Video
+        capture = cv2.VideoCapture(video_path)
+        latencies = []
+        for frame_idx in targets:
+            start_time = time.perf_counter()
+            capture.set(cv2.CAP_PROP_POS_FRAMES, int(frame_idx))
+            capture.read()
+            latencies.append(time.perf_counter() - start_time)
+        capture.release()
+        stats = summarize_latencies(latencies)
+        print(f"{'opencv':>8}: mean {stats['mean_ms']:.2f} ms | p50 {stats['p50_ms']:.2f} ms | p95 {stats['p95_ms']:.2f} ms")
+
+
+def benchmark_gating(args):
+    """Compares the speed and the labels of auto-labeling a clip with and without motion gating."""
+    import sleap
+    from labeling import AutoLabeler, MotionGate
+    from labels import UNLABELED, LabelStore
+    from predictions import PredictionStore
+    from roi import RoiClassifier, load_roi_config
+    from utils import VideoFrameSource
+
+    sleap.disable_preallocation()
+    predictor = sleap.load_model([args.centroid_model_path, args.centered_instance_model_path], batch_size=args.batch_size)
+    roi_classifier = RoiClassifier(load_roi_config(args.roi_config))
+    frames = VideoFrameSource(sleap.load_video(args.video), prefetch_ahead=0, prefetch_behind=0)
+    num_frames = min(len(frames), args.frames) if args.frames else len(frames)
+
+    reference = None
+    if args.labels:
+        # The label file may cover more or fewer frames than the clip
+        reference_codes = LabelStore.load(args.labels, categories=roi_classifier.labels).codes[:num_frames]
+        reference = np.full(num_frames, UNLABELED, dtype=np.int16)
+        reference[:len(reference_codes)] = reference_codes
+
+    results = []
+    for threshold in [None] + args.thresholds:
+        motion_gate = MotionGate(threshold, refresh_interval=args.refresh) if threshold is not None else None
+        labeler = AutoLabeler(frames, predictor, roi_classifier, PredictionStore(num_frames), batch_size=args.batch_size,
+                              motion_gate=motion_gate)
+        codes = np.empty(num_frames, dtype=np.int32)
+        start_time = time.perf_counter()
+        for start, chunk_codes in labeler.run():
+            codes[start:start + len(chunk_codes)] = chunk_codes
+        elapsed = time.perf_counter() - start_time
+        results.append((threshold, motion_gate.num_skipped if motion_gate is not None else 0, elapsed, codes))
+    frames.close()
+
+    # Without a labeled clip, the labels of the ungated run are the reference
+    if reference is None:
+        reference = results[0][3]
+    labeled = reference != UNLABELED
+    baseline_time = results[0][2]
+
+    print(f"{num_frames} frames, refresh every {args.refresh} frames, {int(labeled.sum())} reference labels")
+    print(f"{'threshold':>9} | {'skipped':>7} | {'time':>7} | {'fps':>6} | {'speedup':>7} | {'agreement':>9}")
+    for threshold, num_skipped, elapsed, codes in results:
+        agreement = (codes[labeled] == reference[labeled]).mean() if labeled.any() else np.nan
+        name = "off" if threshold is None else f"{threshold:g}"
+        print(f"{name:>9} | {100 * num_skipped / num_frames:6.1f}% | {elapsed:6.1f}s | {num_frames / elapsed:6.1f} | "
+              f"{baseline_time / elapsed:6.2f}x | {100 * agreement:8.2f}%")
+
+
+def benchmark_roi(args):
+    """Measures the time per keypoint of the ROI lookups as the number of ROIs grows."""
+    from roi import PolygonLocator, RoiIndex, RoiMask
+
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, [args.width, args.height], size=(args.points, 2))
+
+    print(f"{args.points} keypoints on a {args.width}x{args.height} frame (time per keypoint)")
+    print(f"{'ROIs':>5} | {'polygons':>10} | {'index':>10} | {'mask':>10} | {'index build':>11} | {'candidates/cell':>15}")
+    for num_rois in args.rois:
+        shapes_config = synthetic_roi_config(num_rois, args.width, args.height)
+
+        start_time = time.perf_counter()
+        roi_index = RoiIndex(shapes_config)
+        build_time = time.perf_counter() - start_time
+        roi_mask = RoiMask.compile(shapes_config, (args.width, args.height))
+
+        timings = {}
+        results = {}
+        for name, locator in (("polygons", PolygonLocator(shapes_config)), ("index", roi_index), ("mask", roi_mask)):
+            start_time = time.perf_counter()
+            results[name] = locator.locate(points)
+            timings[name] = (time.perf_counter() - start_time) / args.points
+        if not np.array_equal(results["polygons"], results["index"]):
+            print(f"Warning: the ROI index disagrees with the polygon tests on {num_rois} ROIs")
+
+        occupied = roi_index.num_candidates[roi_index.num_candidates > 0]
+        print(f"{num_rois:>5} | {1e9 * timings['polygons']:>7.0f} ns | {1e9 * timings['index']:>7.0f} ns | "
+              f"{1e9 * timings['mask']:>7.0f} ns | {1000 * build_time:>8.1f} ms | {occupied.mean():>15.1f}")
+
+
+def benchmark_tracking(args):
+    """Compares the throughput of single-label classification and of per-track labeling on synthetic trajectories."""
+    from labeling import LABEL_CHUNK_SIZE
+    from roi import RoiClassifier
+    from tracking import Tracker, track_rows
+
+    peaks, num_instances, identities = synthetic_trajectories(args.frames, args.instances, args.width, args.height)
+    roi_classifier = RoiClassifier(synthetic_roi_config(args.rois, args.width, args.height))
+    chunks = [slice(start, start + LABEL_CHUNK_SIZE) for start in range(0, args.frames, LABEL_CHUNK_SIZE)]
+
+    start_time = time.perf_counter()
+    for chunk in chunks:
+        roi_classifier.classify(peaks[chunk], num_instances[chunk])
+    single_time = time.perf_counter() - start_time
+
+    tracker = Tracker()
+    track_ids = []
+    start_time = time.perf_counter()
+    for chunk in chunks:
+        chunk_track_ids = tracker.update(peaks[chunk], num_instances[chunk])
+        instance_codes = roi_classifier.classify_instances(peaks[chunk], num_instances[chunk])
+        track_rows(chunk_track_ids, instance_codes, chunk.start)
+        track_ids.append(chunk_track_ids)
+    tracking_time = time.perf_counter() - start_time
+    track_ids = np.concatenate(track_ids)
+
+    # Identity switches: consecutive detections of a track that belong to different bats
+    frames, instances = np.nonzero(track_ids >= 0)
+    order = np.lexsort((frames, track_ids[frames, instances]))
+    tracks = track_ids[frames, instances][order]
+    bats = identities[frames, instances][order]
+    num_switches = np.count_nonzero((np.diff(tracks) == 0) & (np.diff(bats) != 0))
+
+    print(f"{args.frames} frames, {args.instances} bats, {args.rois} ROIs")
+    print(f"{'single label':>13}: {args.frames / single_time:>10.0f} frames/s")
+    print(f"{'per track':>13}: {args.frames / tracking_time:>10.0f} frames/s ({tracking_time / single_time:.1f}x slower)")
+    print(f"Tracks: {tracker.num_tracks} for {args.instances} bats | {num_switches} identity switches "
+          f"({1000 * num_switches / args.frames:.2f} per 1000 frames)")
+
+
+def benchmark_metrics(args):
+    """Times the array metrics engine and checks it against `sleap.nn.evals.evaluate`."""
+    from metrics import evaluate_keypoints
+
+    try:
+        import sleap
+    except ImportError:
+        sleap = None
+
+    if args.project:
+        if sleap is None:
+            raise SystemExit("Reading a project requires sleap.")
+        from evaluation import keypoint_arrays
+        labels_gt = sleap.load_file(args.project)
+        labels_pr = sleap.load_file(args.predictions)
+        start_time = time.perf_counter()
+        keypoints = keypoint_arrays(labels_gt, labels_pr)
+        print(f"Converted {len(keypoints['num_gt'])} frames to arrays in {time.perf_counter() - start_time:.2f}s")
+    else:
+        keypoints = synthetic_keypoints(args.frames, args.instances, args.nodes)
+        labels_gt = labels_pr = None
+
+    num_frames = len(keypoints["num_gt"])
+    print(f"{num_frames} frames, {int(keypoints['num_gt'].sum())} GT instances, {int(keypoints['num_pr'].sum())} predicted instances")
+    for name, nodes in [("all nodes", None)] + [(f"node {node}", [node]) for node in keypoints["node_names"].tolist()[:2]]:
+        node_indices = None if nodes is None else [keypoints["node_names"].tolist().index(node) for node in nodes]
+        times = []
+        for _ in range(args.repeats):
+            start_time = time.perf_counter()
+            metrics = evaluate_keypoints(keypoints, nodes=node_indices)
+            times.append(time.perf_counter() - start_time)
+        print(f"{'arrays, ' + name:>20}: {1000 * min(times):8.1f} ms | mAP {metrics['oks_voc.mAP']:.4f} mAR {metrics['oks_voc.mAR']:.4f}")
+
+    if sleap is None:
+        print("sleap is not installed, skipping the comparison with sleap.nn.evals.evaluate")
+        return
+    if labels_gt is None:
+        labels_gt, labels_pr = keypoint_labels(keypoints)
+
+    start_time = time.perf_counter()
+    sleap_metrics = sleap.nn.evals.evaluate(labels_gt, labels_pr)
+    sleap_time = time.perf_counter() - start_time
+    metrics = evaluate_keypoints(keypoints)
+    print(f"{'sleap, all nodes':>20}: {1000 * sleap_time:8.1f} ms ({sleap_time / min(times):.0f}x slower)")
+    for key in ("oks_voc.mAP", "oks_voc.mAR", "oks.mOKS", "dist.avg", "dist.p50", "dist.p90", "dist.p95", "dist.p99"):
+        print(f"{key:>20}: sleap {sleap_metrics[key]:.6f} | arrays {metrics[key]:.6f} | diff {abs(sleap_metrics[key] - metrics[key]):.2e}")
+
+
+def stage_stats(elapsed, num_frames):
+    """Timing of a pipeline stage over `num_frames` frames."""
+    return {
+        "seconds": elapsed,
+        "frames": num_frames,
+        "ms_per_frame": 1000 * elapsed / num_frames if num_frames else 0.0,
+        "frames_per_s": num_frames / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def environment_info():
+    """Commit and machine the benchmark ran on, so result files can be compared."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_pipeline_stages(num_frames, height, width, num_rois, num_instances, batch_size=DEFAULT_BATCH_SIZE, render_frames=200):
+    """
+    Times the stages of the auto-label pipeline on a synthetic video with the stub predictor.
+
+    Stages:
+        camera_access: `SimulatedCamera.grab_frame` over the whole video.
+        auto_label: `AutoLabeler.run` as `auto_label_task` runs it (decoding, inference, prediction
+            store and ROI classification), with the labels written to a `LabelStore`.
+        roi_classification: `RoiClassifier.classify` alone, on the stored predictions.
+        show_frame: `show_frame` without Tk (drawing the predictions and ROIs, converting for display).
+        label_export: saving the labels as frames and segments CSV and as a binary file.
+        track_export: tracking the instances and saving the per-track labels.
+
+    Returns:
+        dict: `stage_stats` of each stage.
+    """
+    from labeling import LABEL_CHUNK_SIZE, AutoLabeler
+    from labels import LabelStore
+    from predictions import PredictionStore
+    from roi import RoiClassifier
+    from tracking import save_track_labels, track_store
+    from utils import SimulatedCamera, draw_predictions
+    from viewer import to_display_rgb
+    from PIL import Image
+
+    frames = SyntheticFrames(num_frames, height, width)
+    roi_config = synthetic_roi_config(num_rois, width, height)
+    stages = {}
+
+    camera = SimulatedCamera(frames)
+    start_time = time.perf_counter()
+    for _ in range(num_frames):
+        camera.grab_frame()
+    stages["camera_access"] = stage_stats(time.perf_counter() - start_time, num_frames)
+
+    roi_classifier = RoiClassifier(roi_config)
+    prediction_store = PredictionStore(num_frames)
+    labeler = AutoLabeler(frames, StubPredictor(num_instances), roi_classifier, prediction_store, batch_size=batch_size)
+    frame_labels = LabelStore(num_frames, roi_classifier.labels)
+    start_time = time.perf_counter()
+    for start, codes in labeler.run():
+        frame_labels.set_codes(start, codes)
+    stages["auto_label"] = stage_stats(time.perf_counter() - start_time, num_frames)
+
+    start_time = time.perf_counter()
+    for chunk_start in range(0, num_frames, LABEL_CHUNK_SIZE):
+        roi_classifier.classify(*prediction_store.stack(chunk_start, chunk_start + LABEL_CHUNK_SIZE))
+    stages["roi_classification"] = stage_stats(time.perf_counter() - start_time, num_frames)
+
+    frame_indices = np.linspace(0, num_frames - 1, min(render_frames, num_frames)).astype(int)
+    start_time = time.perf_counter()
+    for frame_idx in frame_indices:
+        frame = draw_predictions(frames[frame_idx], prediction_store.get(frame_idx), roi_config)
+        Image.fromarray(to_display_rgb(frame))
+    stages["show_frame"] = stage_stats(time.perf_counter() - start_time, len(frame_indices))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start_time = time.perf_counter()
+        frame_labels.save(os.path.join(tmp_dir, "labels.csv"))
+        frame_labels.save(os.path.join(tmp_dir, "segments.csv"), segments=True)
+        frame_labels.save_binary(os.path.join(tmp_dir, "labels.npy"))
+        stages["label_export"] = stage_stats(time.perf_counter() - start_time, num_frames)
+
+        start_time = time.perf_counter()
+        save_track_labels(os.path.join(tmp_dir, "labels.tracks.csv"), track_store(prediction_store, roi_classifier), roi_classifier.labels)
+        stages["track_export"] = stage_stats(time.perf_counter() - start_time, num_frames)
+    return stages
+
+
+def parse_resolution(resolution):
+    """Parses WIDTHxHEIGHT into (width, height)."""
+    width, height = resolution.lower().split("x")
+    return int(width), int(height)
+
+
+def config_key(config):
+    return tuple(sorted((key, value) for key, value in config.items()))
+
+
+def compare_suite_results(baseline, results):
+    """Prints the time ratio of each stage between a baseline result file and this run."""
+    baseline_runs = {config_key(run["config"]): run["stages"] for run in baseline["runs"]}
+    print(f"\n--- Compared with {baseline['environment'].get('commit') or 'baseline'} (time ratio, >1 is slower) ---")
+    for run in results["runs"]:
+        baseline_stages = baseline_runs.get(config_key(run["config"]))
+        if baseline_stages is None:
+            continue
+        ratios = [f"{stage} {stats['seconds'] / baseline_stages[stage]['seconds']:.2f}x"
+                  for stage, stats in run["stages"].items()
+                  if stage in baseline_stages and baseline_stages[stage]["seconds"] > 0]
+        print(f"{json.dumps(run['config'])}: " + ", ".join(ratios))
+
+
+def benchmark_suite(args):
+    """Times the pipeline stages over a grid of video lengths, resolutions, ROI counts and instance counts."""
+    runs = []
+    grid = list(itertools.product(args.frames, args.resolutions, args.rois, args.instances))
+    for run_idx, (num_frames, resolution, num_rois, num_instances) in enumerate(grid, start=1):
+        width, height = parse_resolution(resolution)
+        config = {"frames": num_frames, "width": width, "height": height, "rois": num_rois, "instances": num_instances,
+                  "batch_size": args.batch_size}
+        stages = run_pipeline_stages(num_frames, height, width, num_rois, num_instances, args.batch_size, args.render_frames)
+        runs.append({"config": config, "stages": stages})
+        print(f"[{run_idx}/{len(grid)}] {num_frames} frames {resolution}, {num_rois} ROIs, {num_instances} bats: "
+              + ", ".join(f"{stage} {stats['ms_per_frame']:.3f} ms" for stage, stats in stages.items()), file=sys.stderr)
+
+    results = {"environment": environment_info(), "runs": runs}
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as json_file:
+            compare_suite_results(json.load(json_file), results)
+
+
+# Run in a fresh interpreter by `benchmark_startup`: opens the welcome page of the app and
+# reports the time to get there and the memory used
+STARTUP_SCRIPT = """
+import json, sys, time
+start_time = time.perf_counter()
+sys.path.insert(0, {src_dir!r})
+if {eager!r}:
+    # What app.py did before sleap was imported lazily
+    import sleap
+    sleap.disable_preallocation()
+import app
+import_time = time.perf_counter() - start_time
+window_time = None
+try:
+    import tkinter as tk
+    root = tk.Tk()
+    app.LabelBatApp(root)
+    root.update()
+    window_time = time.perf_counter() - start_time
+    root.destroy()
+except tk.TclError:
+    pass
+status = dict(line.split(":", 1) for line in open("/proc/self/status") if ":" in line)
+print(json.dumps({{
+    "import_s": import_time,
+    "first_window_s": window_time,
+    "rss_mb": int(status["VmRSS"].split()[0]) / 1024,
+    "peak_rss_mb": int(status["VmHWM"].split()[0]) / 1024,
+    "sleap_imported": "sleap" in sys.modules,
+    "tensorflow_imported": "tensorflow" in sys.modules,
+}}))
+"""
+
+
+def benchmark_startup(args):
+    """Measures time-to-first-window and memory of the app, importing sleap lazily (now) and eagerly (before)."""
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for mode in ("lazy", "eager"):
+        runs = []
+        for _ in range(args.runs):
+            start_time = time.perf_counter()
+            process = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT.format(src_dir=src_dir, eager=mode == "eager")],
+                                     capture_output=True, text=True)
+            process_time = time.perf_counter() - start_time
+            if process.returncode != 0:
+                print(f"{mode}: failed ({process.stderr.strip().splitlines()[-1] if process.stderr.strip() else process.returncode})")
+                break
+            runs.append({**json.loads(process.stdout.strip().splitlines()[-1]), "process_s": process_time})
+        if not runs:
+            continue
+
+        results[mode] = runs
+        window_times = [run["first_window_s"] for run in runs if run["first_window_s"] is not None]
+        window = f"{np.median(window_times):.2f}s" if window_times else "no display"
+        print(f"{mode:>5}: import {np.median([run['import_s'] for run in runs]):.2f}s | first window {window} | "
+              f"process {np.median([run['process_s'] for run in runs]):.2f}s | RSS {np.median([run['rss_mb'] for run in runs]):.0f} MB "
+              f"(peak {np.median([run['peak_rss_mb'] for run in runs]):.0f} MB) | sleap imported: {runs[0]['sleap_imported']}")
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump({"environment": environment_info(), "startup": results}, json_file, indent=2)
+        print(f"Wrote {args.output}")
+
+
+def benchmark_streaming(args):
+    """Measures labels delivered, frames dropped and capture-to-label latency of the streaming mode with the stub predictor."""
+    from roi import RoiClassifier
+    from streaming import StreamingLabeler
+    from utils import SimulatedCamera
+
+    frames = SyntheticFrames(args.frames, args.height, args.width)
+    roi_classifier = RoiClassifier(synthetic_roi_config(args.rois, args.width, args.height))
+    print(f"{args.frames} frames at {args.width}x{args.height}, {args.inference_ms:g} ms/frame inference, "
+          f"{args.latency_budget_ms:g} ms budget, queues of {args.queue_size}")
+    print(f"{'fps':>6} | {'policy':>6} | {'labeled':>7} | {'source':>6} | {'queue':>6} | {'stale':>6} | {'late':>5} | "
+          f"{'p50':>8} | {'p95':>8} | {'max':>8}")
+    results = []
+    for fps, policy in itertools.product(args.fps, args.policies):
+        predictor = StubPredictor(args.instances, latency=args.inference_ms / 1000)
+        labeler = StreamingLabeler(SimulatedCamera(frames), predictor, roi_classifier, fps=fps,
+                                   latency_budget=args.latency_budget_ms / 1000, queue_size=args.queue_size,
+                                   drop_policy=policy, batch_size=args.batch_size)
+        for _ in labeler.run(args.frames):
+            pass
+        stats = labeler.stats()
+        results.append({"fps": fps, "policy": policy, **stats})
+        print(f"{fps:>6g} | {policy:>6} | {stats['labeled']:>7} | {stats['dropped_source']:>6} | {stats['dropped_queue']:>6} | "
+              f"{stats['dropped_stale']:>6} | {stats['late']:>5} | {stats['p50_ms']:>5.1f} ms | {stats['p95_ms']:>5.1f} ms | "
+              f"{stats['max_ms']:>5.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump({"environment": environment_info(), "streaming": results}, json_file, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Performance benchmarks of the auto-label tool.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    viewer_parser = subparsers.add_parser("viewer", help="Frame-to-screen latency of the auto-label page viewers (needs a display).")
+    viewer_parser.add_argument("--frames", type=int, default=200, help="Number of frames shown per viewer.")
+    viewer_parser.add_argument("--width", type=int, default=1920, help="Frame width.")
+    viewer_parser.add_argument("--height", type=int, default=1080, help="Frame height.")
+    viewer_parser.add_argument("--display_scale", type=float, default=0.5, help="Display scale of the downscaled blit viewer.")
+    viewer_parser.set_defaults(func=benchmark_viewer)
+
+    seek_parser = subparsers.add_parser("seek", help="Random seek latency on a long video, with the keyframe index and with OpenCV.")
+    seek_parser.add_argument("--video", default=None, help="Video to seek in. Defaults to a synthetic video.")
+    seek_parser.add_argument("--frames", type=int, default=18000, help="Number of frames of the synthetic video.")
+    seek_parser.add_argument("--width", type=int, default=640, help="Width of the synthetic video.")
+    seek_parser.add_argument("--height", type=int, default=360, help="Height of the synthetic video.")
+    seek_parser.add_argument("--seeks", type=int, default=200, help="Number of random seeks.")
+    seek_parser.set_defaults(func=benchmark_seek)
+
+    gating_parser = subparsers.add_parser("gating", help="Accuracy vs speed of motion-gated auto-labeling on a (labeled) clip.")
+    gating_parser.add_argument("--video", required=True, help="Video of the clip.")
+    gating_parser.add_argument("--roi_config", required=True, help="Path to the ROI JSON config file.")
+    gating_parser.add_argument("--centroid_model_path", required=True, help="Path to the centroid SLEAP model.")
+    gating_parser.add_argument("--centered_instance_model_path", required=True, help="Path to the centered instance model.")
+    gating_parser.add_argument("--labels", default=None,
+                               help="Label file with the true labels of the clip. Defaults to the labels of the ungated run.")
+    gating_parser.add_argument("--frames", type=int, default=None, help="Only label the first frames of the video.")
+    gating_parser.add_argument("--thresholds", type=float, nargs="+", default=[2, 4, 8, 16], help="Motion thresholds to compare.")
+    gating_parser.add_argument("--refresh", type=int, default=DEFAULT_MOTION_REFRESH, help="Forced refresh interval, in frames.")
+    gating_parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE, help="Inference batch size.")
+    gating_parser.set_defaults(func=benchmark_gating)
+
+    roi_parser = subparsers.add_parser("roi", help="Time per keypoint of the ROI lookups for growing numbers of ROIs.")
+    roi_parser.add_argument("--rois", type=int, nargs="+", default=[5, 10, 20, 50, 100, 200, 500], help="ROI counts to compare.")
+    roi_parser.add_argument("--points", type=int, default=200000, help="Number of keypoints located per run.")
+    roi_parser.add_argument("--width", type=int, default=1920, help="Frame width.")
+    roi_parser.add_argument("--height", type=int, default=1080, help="Frame height.")
+    roi_parser.set_defaults(func=benchmark_roi)
+
+    tracking_parser = subparsers.add_parser("tracking", help="Per-track labeling vs single-label throughput on synthetic trajectories.")
+    tracking_parser.add_argument("--frames", type=int, default=50000, help="Number of frames.")
+    tracking_parser.add_argument("--instances", type=int, default=4, help="Number of bats.")
+    tracking_parser.add_argument("--rois", type=int, default=20, help="Number of ROIs.")
+    tracking_parser.add_argument("--width", type=int, default=1920, help="Frame width.")
+    tracking_parser.add_argument("--height", type=int, default=1080, help="Frame height.")
+    tracking_parser.set_defaults(func=benchmark_tracking)
+
+    metrics_parser = subparsers.add_parser("metrics", help="Rescoring time of the array metrics engine, checked against sleap.nn.evals.evaluate.")
+    metrics_parser.add_argument("--project", default=None, help="Ground truth .slp file. Defaults to synthetic keypoints.")
+    metrics_parser.add_argument("--predictions", default=None, help="Predictions .slp file of the project (e.g. from the evaluation cache).")
+    metrics_parser.add_argument("--frames", type=int, default=10000, help="Number of synthetic labeled frames.")
+    metrics_parser.add_argument("--instances", type=int, default=4, help="Largest number of synthetic bats per frame.")
+    metrics_parser.add_argument("--nodes", type=int, default=2, help="Number of synthetic nodes.")
+    metrics_parser.add_argument("--repeats", type=int, default=5, help="Number of timed runs of the array engine.")
+    metrics_parser.set_defaults(func=benchmark_metrics)
+
+    suite_parser = subparsers.add_parser("suite", help="Headless timing of the pipeline stages on synthetic videos, with a stub predictor, as JSON.")
+    suite_parser.add_argument("--frames", type=int, nargs="+", default=[500, 2000], help="Video lengths.")
+    suite_parser.add_argument("--resolutions", nargs="+", default=["640x360", "1920x1080"], help="Resolutions, as WIDTHxHEIGHT.")
+    suite_parser.add_argument("--rois", type=int, nargs="+", default=[5, 50], help="ROI counts.")
+    suite_parser.add_argument("--instances", type=int, nargs="+", default=[1, 4], help="Largest numbers of bats per frame.")
+    suite_parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE, help="Inference batch size.")
+    suite_parser.add_argument("--render_frames", type=int, default=200, help="Number of frames rendered by the show_frame stage.")
+    suite_parser.add_argument("--output", default=None, help="JSON file for the results. Defaults to printing them.")
+    suite_parser.add_argument("--baseline", default=None, help="Results of an earlier run (e.g. another commit) to compare with.")
+    suite_parser.set_defaults(func=benchmark_suite)
+
+    startup_parser = subparsers.add_parser("startup", help="Time to the first window and memory of the app, with sleap imported lazily and eagerly.")
+    startup_parser.add_argument("--runs", type=int, default=3, help="Number of app starts per mode.")
+    startup_parser.add_argument("--output", default=None, help="JSON file for the results.")
+    startup_parser.set_defaults(func=benchmark_startup)
+
+    streaming_parser = subparsers.add_parser("streaming", help="Labels, dropped frames and latency of the streaming mode with a stub predictor.")
+    streaming_parser.add_argument("--frames", type=int, default=600, help="Number of camera frames per run.")
+    streaming_parser.add_argument("--width", type=int, default=1280, help="Frame width.")
+    streaming_parser.add_argument("--height", type=int, default=720, help="Frame height.")
+    streaming_parser.add_argument("--fps", type=float, nargs="+", default=[30, 60, 120], help="Camera frame rates to compare.")
+    streaming_parser.add_argument("--policies", nargs="+", default=["oldest", "newest"], help="Drop policies to compare.")
+    streaming_parser.add_argument("--inference_ms", type=float, default=10, help="Stub inference time per frame.")
+    streaming_parser.add_argument("--latency_budget_ms", type=float, default=50, help="Capture-to-label latency budget.")
+    streaming_parser.add_argument("--queue_size", type=int, default=2, help="Number of frames waiting between stages.")
+    streaming_parser.add_argument("--batch_size", type=int, default=1, help="Largest number of waiting frames inferred at once.")
+    streaming_parser.add_argument("--rois", type=int, default=20, help="Number of ROIs.")
+    streaming_parser.add_argument("--instances", type=int, default=4, help="Largest number of bats per frame.")
+    streaming_parser.add_argument("--output", default=None, help="JSON file for the results.")
+    streaming_parser.set_defaults(func=benchmark_streaming)
+
+    args = parser.parse_args()
+    args.func(args)
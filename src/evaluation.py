@@ -1,17 +1,95 @@
-import sleap
 import numpy as np
-import pandas as pd
 import matplotlib as mpl
-import matplotlib.pyplot as plt
-import seaborn as sns
 import argparse
+import csv
+import gc
+import glob
+import hashlib
+import json
+import multiprocessing
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import plots
+from models import load_sleap
+from metrics import concat_keypoints, evaluate_keypoints, load_keypoints, pad_instances, save_keypoints
+from predictions import file_checksum, model_checksum
+from profiling import DISABLED_PROFILER, Profiler, print_stage_stats
+
+# State of each sweep worker process, set up once by `init_sweep_worker`
+_sweep_worker = {}
+
+# Columns of the sweep comparison table: (metric key, header)
+SWEEP_COLUMNS = [
+    ("oks_voc.mAP", "mAP"),
+    ("oks_voc.mAR", "mAR"),
+    ("dist.p50", "dist p50"),
+    ("dist.p90", "dist p90"),
+    ("dist.p95", "dist p95"),
+    ("wall_time", "time (s)"),
+    ("peak_rss_mb", "peak RSS (MB)"),
+]
+
+
+def evaluation_cache_dir(project_path, model_path):
+    """
+    Directory next to the project holding the predictions of a model on it.
+
+    The key combines the project content hash with the path and checksum of the
+    model, so relabeled projects or retrained models never reuse stale predictions.
+    """
+    key_data = {
+        "project": file_checksum(project_path),
+        "model": [os.path.abspath(model_path), model_checksum(model_path)],
+    }
+    key = hashlib.sha1(json.dumps(key_data).encode("utf-8")).hexdigest()
+    return os.path.join(f"{project_path}.predictions", key[:16])
+
+
+def save_labels(labels, file_path):
+    """Saves labels to a .slp file, through a temporary file so an interrupted save never leaves a partial cache entry."""
+    tmp_path = file_path[:-len(".slp")] + ".tmp.slp"
+    labels.save(tmp_path)
+    os.replace(tmp_path, file_path)
+
+
+def keypoint_arrays(labels_gt, labels_pr):
+    """
+    Pairs the GT and predicted frames like `sleap.nn.evals.evaluate` and converts them to the
+    keypoint arrays scored by `metrics.evaluate_keypoints`.
+
+    Args:
+        labels_gt (sleap.Labels): Ground truth labels; only user instances count.
+        labels_pr (sleap.Labels): Predicted labels.
+
+    Returns:
+        dict: Keypoint arrays, with the node names and the frame index of each paired frame.
+    """
+    frame_pairs = load_sleap().nn.evals.find_frame_pairs(labels_gt, labels_pr)
+    node_names = labels_gt.skeletons[0].node_names
+    points_gt, num_gt = pad_instances([[instance.numpy() for instance in frame_gt.user_instances] for frame_gt, _ in frame_pairs], len(node_names))
+    points_pr, num_pr = pad_instances([[instance.numpy() for instance in frame_pr.instances] for _, frame_pr in frame_pairs], len(node_names))
+    scores_pr = np.full(points_pr.shape[:2], np.nan)
+    for frame, (_, frame_pr) in enumerate(frame_pairs):
+        scores_pr[frame, :len(frame_pr.instances)] = [instance.score for instance in frame_pr.instances]
+    return {
+        "points_gt": points_gt,
+        "num_gt": num_gt,
+        "points_pr": points_pr,
+        "scores_pr": scores_pr,
+        "num_pr": num_pr,
+        "frame_idxs": np.array([frame_gt.frame_idx for frame_gt, _ in frame_pairs], dtype=np.int64),
+        "node_names": np.array(node_names),
+    }
+
 
 class SleapEvaluator:
     """
     A class to encapsulate the SLEAP evaluation process, including metric computation and visualization.
     """
-    def __init__(self, centroid_model_path, centered_instance_model_path, project_path):
+    def __init__(self, centroid_model_path, centered_instance_model_path, project_path, chunk_size=None, cache_predictions=True,
+                 nodes=None, profiler=None):
         """
         Initializes the SleapEvaluator with paths to the centroid model, centered instance model, and project.
 
@@ -19,37 +97,194 @@ class SleapEvaluator:
             centroid_model_path (str): Path to the SLEAP centroid model.
             centered_instance_model_path (str): Path to the centered instance model.
             project_path (str): Path to the .slp file containing ground truth labels.
+            chunk_size (int): If set, labeled frames are predicted in chunks of this many frames,
+                so memory use depends on the chunk size rather than on the project size.
+            cache_predictions (bool): If True, predictions are saved next to the project and reused by
+                later runs with the same project and models, which then skip inference.
+            nodes (list): Names of the nodes to score (e.g. ["head"]). Defaults to all nodes.
+            profiler (Profiler): If set, times the loading, inference, caching and scoring stages.
         """
         self.centroid_model_path = centroid_model_path
         self.centered_instance_model_path = centered_instance_model_path
         self.project_path = project_path
-        self.centroid_predictor = None
-        self.centered_instance_predictor = None
+        self.chunk_size = chunk_size
+        self.cache_predictions = cache_predictions
+        self.nodes = nodes
+        self.profiler = profiler if profiler is not None else DISABLED_PROFILER
+        self.predictors = {}
+        self.cache_dirs = {}
         self.labels_gt = None
+        # Serializes model loading, which is not safe to run from two threads at once
+        self._load_lock = threading.Lock()
+        # Thread predicting on the frames of `labels_gt` (see `frame_labels`)
+        self._labels_gt_reader = None
         self.metrics_centroid = None
         self.metrics_centered = None
 
     def load_model_and_data(self):
         """
-        Loads the SLEAP models (centroid and centered instance) and ground truth labels.
+        Loads the ground truth labels. The models are only loaded when a prediction
+        is missing from the cache.
+        """
+        with self.profiler.stage("load_labels"):
+            self.labels_gt = load_sleap().load_file(self.project_path)
+        print("Data loaded successfully.")
+
+    def get_predictor(self, model_path):
+        """Returns the predictor of a model, loading it on first use."""
+        with self._load_lock:
+            if model_path not in self.predictors:
+                with self.profiler.stage("load_model"):
+                    self.predictors[model_path] = load_sleap().load_model(model_path)
+                print(f"Loaded model {model_path}")
+            return self.predictors[model_path]
+
+    def frame_labels(self):
         """
-        self.centroid_predictor = sleap.load_model(self.centroid_model_path)
-        self.centered_instance_predictor = sleap.load_model(self.centered_instance_model_path)
-        self.labels_gt = sleap.load_file(self.project_path)
-        print("Models and data loaded successfully.")
+        Returns a copy of the project for the calling thread to predict on.
+
+        Video readers are not thread-safe, so each model thread reads frames from its own copy.
+        The first thread to ask gets the already loaded GT labels; only another thread loads a
+        second copy.
+        """
+        with self._load_lock:
+            if self._labels_gt_reader in (None, threading.get_ident()):
+                self._labels_gt_reader = threading.get_ident()
+                return self.labels_gt
+        with self.profiler.stage("load_labels"):
+            return load_sleap().load_file(self.project_path)
 
     def evaluate(self):
         """
         Computes evaluation metrics between the ground truth and predicted labels for both models.
-        """
-        labels_pr_centroid = self.centroid_predictor.predict(self.labels_gt)
-        self.metrics_centroid = sleap.nn.evals.evaluate(self.labels_gt, labels_pr_centroid)
 
-        labels_pr_centered = self.centered_instance_predictor.predict(self.labels_gt)
-        self.metrics_centered = sleap.nn.evals.evaluate(self.labels_gt, labels_pr_centered)
+        The two models run concurrently, each in its own thread.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            centroid = executor.submit(self.evaluate_model, self.centroid_model_path)
+            centered = executor.submit(self.evaluate_model, self.centered_instance_model_path)
+            self.metrics_centroid = centroid.result()
+            self.metrics_centered = centered.result()
 
         print("Evaluation completed for both models.")
 
+    def evaluate_model(self, model_path):
+        """
+        Predicts the ground truth labels with a model, or loads its cached predictions, and scores them.
+
+        The paired GT and predicted keypoints are cached as arrays, so later runs rescore them
+        (e.g. with other nodes) without loading any labels.
+
+        Args:
+            model_path (str): Path to the SLEAP model.
+
+        Returns:
+            dict: Evaluation metrics.
+        """
+        keypoints_path = self.cache_path(model_path, "keypoints.npz")
+        if keypoints_path is not None and os.path.exists(keypoints_path):
+            print(f"Using cached keypoints {keypoints_path}")
+            with self.profiler.stage("load_keypoints"):
+                keypoints = load_keypoints(keypoints_path)
+            return self.score(keypoints)
+
+        if self.chunk_size:
+            keypoints = self.predict_chunked(model_path)
+        else:
+            cache_path = self.cache_path(model_path, "predictions.slp")
+            if cache_path is not None and os.path.exists(cache_path):
+                print(f"Using cached predictions {cache_path}")
+                with self.profiler.stage("load_predictions"):
+                    labels_pr = load_sleap().load_file(cache_path)
+            else:
+                labels = self.frame_labels()
+                predictor = self.get_predictor(model_path)
+                with self.profiler.stage("inference", frames=len(labels)):
+                    labels_pr = predictor.predict(labels)
+                if cache_path is not None:
+                    with self.profiler.stage("save_predictions"):
+                        save_labels(labels_pr, cache_path)
+            with self.profiler.stage("keypoint_arrays"):
+                keypoints = keypoint_arrays(self.labels_gt, labels_pr)
+
+        if keypoints_path is not None:
+            with self.profiler.stage("save_keypoints"):
+                save_keypoints(keypoints_path, keypoints)
+        return self.score(keypoints)
+
+    def predict_chunked(self, model_path):
+        """
+        Predicts the ground truth labels chunk by chunk.
+
+        Only the keypoint arrays of each chunk are kept, not the predicted labels. Each
+        chunk's predictions are cached on their own, so an interrupted run resumes at the
+        first missing chunk.
+
+        Args:
+            model_path (str): Path to the SLEAP model.
+
+        Returns:
+            dict: Keypoint arrays of the whole project (see `keypoint_arrays`).
+        """
+        chunks = []
+        num_frames = len(self.labels_gt)
+        labels = None
+        for start in range(0, num_frames, self.chunk_size):
+            stop = min(start + self.chunk_size, num_frames)
+            frame_indices = list(range(start, stop))
+            labels_gt_chunk = self.labels_gt.extract(frame_indices)
+
+            cache_path = self.cache_path(model_path, f"chunk-{start:06d}-{stop:06d}.slp")
+            if cache_path is not None and os.path.exists(cache_path):
+                with self.profiler.stage("load_predictions"):
+                    labels_pr_chunk = load_sleap().load_file(cache_path)
+            else:
+                if labels is None:
+                    labels = self.frame_labels()
+                labels_chunk = labels_gt_chunk if labels is self.labels_gt else labels.extract(frame_indices)
+                predictor = self.get_predictor(model_path)
+                with self.profiler.stage("inference", frames=stop - start):
+                    labels_pr_chunk = predictor.predict(labels_chunk)
+                if cache_path is not None:
+                    with self.profiler.stage("save_predictions"):
+                        save_labels(labels_pr_chunk, cache_path)
+
+            with self.profiler.stage("keypoint_arrays"):
+                chunks.append(keypoint_arrays(labels_gt_chunk, labels_pr_chunk))
+            print(f"Predicted frames {start}-{stop - 1} of {num_frames} ({os.path.basename(os.path.normpath(model_path))})")
+
+        return concat_keypoints(chunks)
+
+    def score(self, keypoints):
+        """
+        Scores keypoint arrays, on the nodes selected by `nodes`.
+
+        Args:
+            keypoints (dict): Keypoint arrays (see `keypoint_arrays`).
+
+        Returns:
+            dict: Evaluation metrics.
+        """
+        nodes = None
+        if self.nodes:
+            node_names = keypoints["node_names"].tolist()
+            unknown = [node for node in self.nodes if node not in node_names]
+            if unknown:
+                raise ValueError(f"Unknown nodes {unknown}, the skeleton has {node_names}")
+            nodes = [node_names.index(node) for node in self.nodes]
+        with self.profiler.stage("scoring", frames=len(keypoints["num_gt"])):
+            return evaluate_keypoints(keypoints, nodes=nodes)
+
+    def cache_path(self, model_path, file_name):
+        """Path of a cached prediction file of a model, or None if predictions are not cached."""
+        if not self.cache_predictions:
+            return None
+        # Hashing the project and the model takes a while, so it is done once per model
+        if model_path not in self.cache_dirs:
+            self.cache_dirs[model_path] = evaluation_cache_dir(self.project_path, model_path)
+            os.makedirs(self.cache_dirs[model_path], exist_ok=True)
+        return os.path.join(self.cache_dirs[model_path], file_name)
+
     def display_metrics(self, metrics, model_name):
         """
         Displays key evaluation metrics for a given model.
@@ -65,70 +300,52 @@ class SleapEvaluator:
         print("mAP:", metrics["oks_voc.mAP"])
         print("mAR:", metrics["oks_voc.mAR"])
 
-    def plot_error_distribution(self, metrics, model_name):
+    def plot_error_distribution(self, metrics, model_name, output_path=None):
         """
         Plots the localization error distribution for a given model.
 
         Args:
             metrics (dict): Evaluation metrics.
             model_name (str): Name of the model being evaluated.
+            output_path (str): If set, the figure is saved there instead of shown.
         """
-        plt.figure(figsize=(6, 3), dpi=150, facecolor="w")
-        sns.histplot(metrics["dist.dists"].flatten(), binrange=(0, 20), kde=True, kde_kws={"clip": (0, 20)}, stat="probability")
-        plt.xlabel(f"Localization error (px) - {model_name}")
-        plt.show()
+        plots.plot_error_distribution(metrics["dist.dists"], model_name, output_path)
 
-    def plot_keypoint_similarity(self, metrics, model_name):
+    def plot_keypoint_similarity(self, metrics, model_name, output_path=None):
         """
         Plots the Object Keypoint Similarity (OKS) distribution for a given model.
 
         Args:
             metrics (dict): Evaluation metrics.
             model_name (str): Name of the model being evaluated.
+            output_path (str): If set, the figure is saved there instead of shown.
         """
-        plt.figure(figsize=(6, 3), dpi=150, facecolor="w")
-        sns.histplot(metrics["oks_voc.match_scores"].flatten(), binrange=(0, 1), kde=True, kde_kws={"clip": (0, 1)}, stat="probability")
-        plt.xlabel(f"Object Keypoint Similarity - {model_name}")
-        plt.show()
+        plots.plot_keypoint_similarity(metrics["oks_voc.match_scores"], model_name, output_path)
 
-    def plot_precision_recall(self, metrics, model_name):
+    def plot_precision_recall(self, metrics, model_name, output_path=None):
         """
         Plots the Precision-Recall curve for various OKS thresholds for a given model.
 
         Args:
             metrics (dict): Evaluation metrics.
             model_name (str): Name of the model being evaluated.
+            output_path (str): If set, the figure is saved there instead of shown.
         """
-        plt.figure(figsize=(4, 4), dpi=150, facecolor="w")
-        for precision, thresh in zip(metrics["oks_voc.precisions"][::2], metrics["oks_voc.match_score_thresholds"][::2]):
-            plt.plot(metrics["oks_voc.recall_thresholds"], precision, "-", label=f"OKS @ {thresh:.2f}")
-        plt.xlabel(f"Recall - {model_name}")
-        plt.ylabel("Precision")
-        plt.legend(loc="lower left")
-        plt.show()
+        plots.plot_precision_recall(*self._precision_recall_args(metrics), model_name, output_path)
 
-    def plot_training_log(self, model_dir):
+    def plot_training_log(self, model_dir, output_path=None):
         """
         Searches for a training_log.csv file in the model directory and plots it.
 
         Args:
             model_dir (str): Path to the directory containing the training log.
+            output_path (str): If set, the figure is saved there instead of shown.
         """
-        training_log_path = os.path.join(model_dir, "training_log.csv")
-        if os.path.exists(training_log_path):
-            print(f"Found training log: {training_log_path}")
-            # Load and plot the training log
-            training_log = pd.read_csv(training_log_path)
-            plt.figure(figsize=(10, 6))
-            plt.plot(training_log["epoch"], training_log["train_loss"], "o-", label="Training Loss")
-            plt.plot(training_log["epoch"], training_log["val_loss"], "x-", label="Validation Loss")
-            plt.xlabel("Epoch")
-            plt.ylabel("Loss")
-            plt.title(f"Training and Validation Loss - {model_dir}")
-            plt.legend()
-            plt.show()
-        else:
-            print(f"No training log found in {model_dir}")
+        plots.plot_training_log(model_dir, output_path)
+
+    @staticmethod
+    def _precision_recall_args(metrics):
+        return metrics["oks_voc.precisions"], metrics["oks_voc.match_score_thresholds"], metrics["oks_voc.recall_thresholds"]
 
     def evaluate_and_visualize(self):
         """
@@ -151,17 +368,337 @@ class SleapEvaluator:
         self.plot_precision_recall(self.metrics_centered, "Centered Instance Model")
         self.plot_training_log(os.path.dirname(self.centered_instance_model_path))
 
+    def models(self):
+        """(file name prefix, display name, metrics, model path) of each evaluated model."""
+        return [
+            ("centroid", "Centroid Model", self.metrics_centroid, self.centroid_model_path),
+            ("centered_instance", "Centered Instance Model", self.metrics_centered, self.centered_instance_model_path),
+        ]
+
+    def write_report(self, report_dir, workers=None):
+        """
+        Writes all the figures and a metrics summary to a directory, without opening any window.
+
+        Figures are rendered off-screen in a pool of worker processes.
+
+        Args:
+            report_dir (str): Output directory.
+            workers (int): Number of worker processes. Defaults to the number of CPUs.
+
+        Returns:
+            list: Paths of the written files.
+        """
+        os.makedirs(report_dir, exist_ok=True)
+
+        tasks = []
+        for prefix, model_name, metrics, model_path in self.models():
+            output_prefix = os.path.join(report_dir, prefix)
+            tasks += [
+                ("plot_error_distribution", (np.asarray(metrics["dist.dists"]), model_name), f"{output_prefix}_error_distribution.png"),
+                ("plot_keypoint_similarity", (np.asarray(metrics["oks_voc.match_scores"]), model_name),
+                 f"{output_prefix}_keypoint_similarity.png"),
+                ("plot_precision_recall", (*map(np.asarray, self._precision_recall_args(metrics)), model_name),
+                 f"{output_prefix}_precision_recall.png"),
+                ("plot_training_log", (os.path.dirname(model_path),), f"{output_prefix}_training_log.png"),
+            ]
+
+        # TensorFlow does not survive a fork, so workers are spawned. They only import plots and
+        # the top of this module, which has no sleap import, and get plain arrays and paths.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            written = [path for path in executor.map(plots.render_plot, tasks) if path is not None]
+
+        written += self.write_metrics_summary(report_dir)
+        return written
+
+    def write_metrics_summary(self, report_dir):
+        """
+        Writes the scalar metrics of both models to metrics_summary.json and metrics_summary.csv.
+
+        Returns:
+            list: Paths of the written files.
+        """
+        summary = {}
+        for prefix, model_name, metrics, model_path in self.models():
+            summary[prefix] = {"model_path": model_path}
+            summary[prefix].update({key: float(value) for key, value in metrics.items() if np.ndim(value) == 0})
+
+        json_path = os.path.join(report_dir, "metrics_summary.json")
+        with open(json_path, "w") as json_file:
+            json.dump(summary, json_file, indent=4)
+
+        csv_path = os.path.join(report_dir, "metrics_summary.csv")
+        fieldnames = ["model"] + sorted({key for row in summary.values() for key in row})
+        with open(csv_path, mode='w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+            writer.writeheader()
+            for prefix, row in summary.items():
+                writer.writerow({"model": prefix, **row})
+        return [json_path, csv_path]
+
+    def evaluate_and_report(self, report_dir, workers=None):
+        """
+        Runs the evaluation for both models and writes the report, for headless runs.
+        """
+        start_time = time.time()
+        self.load_model_and_data()
+        self.evaluate()
+        for _, model_name, metrics, _ in self.models():
+            self.display_metrics(metrics, model_name)
+
+        report_start_time = time.time()
+        with self.profiler.stage("report"):
+            written = self.write_report(report_dir, workers)
+        print(f"\nWrote {len(written)} report files to {report_dir} in {time.time() - report_start_time:.1f}s")
+        print(f"Total time: {time.time() - start_time:.1f}s")
+
+
+def expand_model_paths(patterns):
+    """Expands glob patterns into a sorted list of unique model directories."""
+    model_paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            path = os.path.normpath(path)
+            if os.path.isdir(path) and path not in model_paths:
+                model_paths.append(path)
+    return model_paths
+
+
+def current_rss_mb():
+    """Resident memory of this process, in MB."""
+    try:
+        with open("/proc/self/statm") as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        # No procfs: fall back to the peak of the whole process (KB on Linux, bytes on macOS)
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / 2**20 if os.uname().sysname == "Darwin" else max_rss / 2**10
+
+
+class PeakMemorySampler:
+    """
+    Context manager sampling the resident memory of the process in a background thread,
+    to get the peak of a block of code rather than of the whole process lifetime.
+
+    Attributes:
+        interval: Time between samples, in seconds.
+        peak_mb: Largest resident memory seen, in MB.
+    """
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak_mb = current_rss_mb()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+        return False
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+
+def init_sweep_worker(project_path, chunk_size, cache_predictions, nodes=None, profile=False, trace=False):
+    """
+    Loads the ground truth labels once per sweep worker process.
+
+    With `profile` (or `trace`), the worker times its stages and returns their statistics (and
+    trace events) with the results of each checkpoint.
+    """
+    # Imports sleap, with GPU memory preallocation turned off
+    load_sleap()
+    profiler = Profiler(trace=trace) if profile or trace else None
+    evaluator = SleapEvaluator(None, None, project_path, chunk_size=chunk_size, cache_predictions=cache_predictions, nodes=nodes,
+                               profiler=profiler)
+    evaluator.load_model_and_data()
+    _sweep_worker["evaluator"] = evaluator
+    _sweep_worker["profiler"] = profiler
+
+
+def evaluate_checkpoint(model_path):
+    """
+    Evaluates one checkpoint in a sweep worker, recording its wall time and peak memory.
+
+    Returns:
+        dict: The scalar metrics, plus `model_path`, `wall_time` and `peak_rss_mb`, or
+        `model_path` and `error` if the evaluation failed. When profiling, also `stages` (the
+        statistics of each stage for this checkpoint) and, when tracing, `trace` (the events to
+        merge into the trace of the main process).
+    """
+    evaluator = _sweep_worker["evaluator"]
+    profiler = _sweep_worker["profiler"]
+    start_time = time.time()
+    try:
+        with PeakMemorySampler() as memory:
+            metrics = evaluator.evaluate_model(model_path)
+        result = {key: float(value) for key, value in metrics.items() if np.ndim(value) == 0}
+        result.update(model_path=model_path, wall_time=time.time() - start_time, peak_rss_mb=memory.peak_mb)
+    except Exception as e:
+        result = {"model_path": model_path, "error": str(e)}
+    finally:
+        # Free the model before the next checkpoint of this worker
+        if evaluator.predictors.pop(model_path, None) is not None:
+            import tensorflow as tf
+            tf.keras.backend.clear_session()
+        gc.collect()
+
+    if profiler is not None:
+        # The first checkpoint of a worker also holds the loading of the labels
+        result["stages"] = {name: profiler.stats(name) for name in profiler.stages()}
+        if profiler.trace:
+            result["trace"] = profiler.export_trace()
+        profiler.reset(trace=True)
+    return result
+
+
+def rank_sweep_results(results):
+    """Sorts the evaluated checkpoints by mAP, then mAR, best first; failed ones are dropped."""
+    done = [result for result in results if "error" not in result]
+    return sorted(done, key=lambda result: (-result.get("oks_voc.mAP", -np.inf), -result.get("oks_voc.mAR", -np.inf)))
+
+
+def print_sweep_table(ranked):
+    """Prints the ranked comparison table of a sweep."""
+    names = [os.path.basename(result["model_path"]) for result in ranked]
+    name_width = max([len("model")] + [len(name) for name in names])
+    headers = ["rank", "model".ljust(name_width)] + [header.rjust(max(len(header), 8)) for _, header in SWEEP_COLUMNS]
+    print("\n--- Sweep results ---")
+    print("  ".join(headers))
+    for rank, (name, result) in enumerate(zip(names, ranked), start=1):
+        cells = [str(rank).rjust(4), name.ljust(name_width)]
+        for (key, _), header in zip(SWEEP_COLUMNS, headers[2:]):
+            value = result.get(key)
+            cells.append(("-" if value is None else f"{value:.{1 if key in ('wall_time', 'peak_rss_mb') else 3}f}").rjust(len(header)))
+        print("  ".join(cells))
+
+
+def write_sweep_results(ranked, output_path):
+    """Writes the ranked sweep table to a CSV file, or to JSON if the path ends with .json."""
+    rows = [{"rank": rank, **result} for rank, result in enumerate(ranked, start=1)]
+    if output_path.endswith(".json"):
+        with open(output_path, "w") as json_file:
+            json.dump(rows, json_file, indent=4)
+        return
+
+    fieldnames = ["rank", "model_path"] + [key for key, _ in SWEEP_COLUMNS]
+    fieldnames += sorted({key for row in rows for key in row} - set(fieldnames))
+    with open(output_path, mode='w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_sweep(model_paths, project_path, workers=1, chunk_size=None, cache_predictions=True, nodes=None, output_path=None,
+              profiler=None):
+    """
+    Evaluates many checkpoints on the same project, spread across a pool of worker processes.
+
+    Each worker loads the ground truth labels once and then evaluates checkpoints until none
+    are left, one at a time, so `workers` bounds the number of models in memory at once.
+
+    Args:
+        model_paths (list): Model directories to evaluate.
+        project_path (str): Path to the .slp file with ground truth labels.
+        workers (int): Number of worker processes.
+        chunk_size (int): See `SleapEvaluator`.
+        cache_predictions (bool): See `SleapEvaluator`.
+        nodes (list): See `SleapEvaluator`.
+        output_path (str): If set, the ranked table is also written there (CSV, or JSON for a .json path).
+        profiler (Profiler): If set, the workers time their stages, which are printed for each
+            checkpoint, and with `profiler.trace` their events are merged into its trace.
+
+    Returns:
+        list: Results of the evaluated checkpoints, best first.
+    """
+    start_time = time.time()
+    results = []
+    # TensorFlow does not survive a fork, so workers are always spawned
+    context = multiprocessing.get_context("spawn")
+    profile = profiler is not None and profiler.enabled
+    initargs = (project_path, chunk_size, cache_predictions, nodes, profile, profile and profiler.trace)
+    with context.Pool(processes=workers, initializer=init_sweep_worker, initargs=initargs) as pool:
+        for result in pool.imap_unordered(evaluate_checkpoint, model_paths):
+            stages = result.pop("stages", None)
+            trace = result.pop("trace", None)
+            if trace is not None:
+                profiler.import_trace(trace)
+            if "error" in result:
+                print(f"[failed] {result['model_path']}: {result['error']}")
+            else:
+                print(f"[done] {result['model_path']}: mAP {result.get('oks_voc.mAP', float('nan')):.3f} "
+                      f"in {result['wall_time']:.1f}s, peak {result['peak_rss_mb']:.0f} MB")
+            if stages:
+                print_stage_stats(stages, f"Stage timings of {result['model_path']}")
+            results.append(result)
+
+    ranked = rank_sweep_results(results)
+    print_sweep_table(ranked)
+    print(f"\nEvaluated {len(ranked)} of {len(model_paths)} checkpoints in {time.time() - start_time:.1f}s")
+    if output_path:
+        write_sweep_results(ranked, output_path)
+        print(f"Wrote {output_path}")
+    return ranked
+
 
 if __name__ == "__main__":
     # Set up argument parsing
     parser = argparse.ArgumentParser(description="Evaluate two SLEAP models (centroid and centered instance) on a given project.")
-    parser.add_argument("--centroid_model_path", required=True, help="Path to the centroid SLEAP model.")
-    parser.add_argument("--centered_instance_model_path", required=True, help="Path to the centered instance model.")
+    parser.add_argument("--centroid_model_path", help="Path to the centroid SLEAP model.")
+    parser.add_argument("--centered_instance_model_path", help="Path to the centered instance model.")
     parser.add_argument("--project_path", required=True, help="Path to the .slp file with ground truth labels.")
+    parser.add_argument("--chunk_size", type=int, default=None, help="Predict the labeled frames in chunks of this many frames to bound memory use.")
+    parser.add_argument("--nodes", nargs="+", default=None, help="Only score these nodes (e.g. head). Cached keypoints are rescored without inference.")
+    parser.add_argument("--no_cache", action="store_true", help="Do not read or write the predictions cached next to the project.")
+    parser.add_argument("--report_dir", default=None, help="Write the figures and a metrics summary to this directory instead of showing them (works without a display).")
+    parser.add_argument("--report_workers", type=int, default=None, help="Number of processes rendering the report figures. Defaults to the number of CPUs.")
+    parser.add_argument("--profile", action="store_true", help="Print the time spent in each stage (loading, inference, caching, scoring).")
+    parser.add_argument("--trace", default=None, help="Write the stage timings to this Chrome trace-event JSON file (implies --profile).")
+    parser.add_argument("--sweep", nargs="+", default=None, help="Compare many model directories or glob patterns (quote them) instead of evaluating a centroid/centered instance pair.")
+    parser.add_argument("--sweep_workers", type=int, default=1, help="Number of checkpoints evaluated at once in sweep mode.")
+    parser.add_argument("--sweep_output", default=None, help="Write the sweep comparison table to this CSV (or .json) file.")
     args = parser.parse_args()
 
+    profiler = Profiler(trace=args.trace is not None) if args.profile or args.trace else None
+    if args.sweep:
+        model_paths = expand_model_paths(args.sweep)
+        if not model_paths:
+            parser.error("No model directories match --sweep.")
+        run_sweep(model_paths, args.project_path, workers=args.sweep_workers, chunk_size=args.chunk_size,
+                  cache_predictions=not args.no_cache, nodes=args.nodes, output_path=args.sweep_output, profiler=profiler)
+        if args.trace:
+            num_events = profiler.save_trace(args.trace)
+            print(f"Wrote {num_events} trace events to {args.trace}")
+        raise SystemExit
+    if not args.centroid_model_path or not args.centered_instance_model_path:
+        parser.error("--centroid_model_path and --centered_instance_model_path are required unless --sweep is given.")
+
+    if args.report_dir:
+        # Render off-screen, so no display is needed
+        mpl.use("Agg")
+
     # Initialize evaluator
-    evaluator = SleapEvaluator(args.centroid_model_path, args.centered_instance_model_path, args.project_path)
+    evaluator = SleapEvaluator(args.centroid_model_path, args.centered_instance_model_path, args.project_path, chunk_size=args.chunk_size,
+                               cache_predictions=not args.no_cache, nodes=args.nodes, profiler=profiler)
 
     # Run the evaluation and visualization
-    evaluator.evaluate_and_visualize()
+    if args.report_dir:
+        evaluator.evaluate_and_report(args.report_dir, workers=args.report_workers)
+    else:
+        evaluator.evaluate_and_visualize()
+
+    if profiler is not None:
+        profiler.print_summary()
+        if args.trace:
+            num_events = profiler.save_trace(args.trace)
+            print(f"Wrote {num_events} trace events to {args.trace}")
@@ -0,0 +1,188 @@
+import threading
+
+import cv2
+import numpy as np
+
+from profiling import DISABLED_PROFILER
+from utils import iter_frame_batches, predict_peaks
+
+# Number of frames sent to the network per inference call during auto-labeling
+DEFAULT_BATCH_SIZE = 8
+
+# Maximum number of frames classified at once
+LABEL_CHUNK_SIZE = 4096
+
+# Motion gating: width of the thumbnails that are compared, and the default number of
+# frames after which inference runs again even if nothing moved
+MOTION_THUMBNAIL_WIDTH = 64
+DEFAULT_MOTION_REFRESH = 30
+
+
+class MotionGate:
+    """
+    Decides which frames need inference, by comparing each frame with the last inferred one.
+
+    Frames are compared as small grayscale thumbnails, so the cost is a resize and a
+    difference of a few thousand pixels. The difference is the largest change of a
+    thumbnail pixel: a thumbnail pixel averages a block of the frame, so a moving bat
+    changes the blocks it crosses even though it covers a small part of the frame.
+
+    Attributes:
+        threshold: Largest thumbnail change (in gray levels) for which a frame reuses the
+            peaks of the last inferred frame.
+        refresh_interval: Frames are inferred at least once every `refresh_interval` frames.
+        num_inferred: Number of frames sent to inference since the last reset.
+        num_skipped: Number of frames that reused earlier peaks since the last reset.
+    """
+    def __init__(self, threshold, refresh_interval=DEFAULT_MOTION_REFRESH, thumbnail_width=MOTION_THUMBNAIL_WIDTH):
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.thumbnail_width = thumbnail_width
+        self.reset()
+
+    def reset(self):
+        """Forgets the reference frame and the counts."""
+        self._reference = None
+        self._reference_idx = None
+        self._last_idx = None
+        self.num_inferred = 0
+        self.num_skipped = 0
+
+    def thumbnail(self, frame):
+        """Downsamples a frame to a grayscale float32 thumbnail."""
+        if frame.ndim == 3 and frame.shape[-1] == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        elif frame.ndim == 3:
+            frame = frame[..., 0]
+        height, width = frame.shape
+        thumbnail_width = min(self.thumbnail_width, width)
+        thumbnail_height = max(1, round(height * thumbnail_width / width))
+        thumbnail = cv2.resize(frame, (thumbnail_width, thumbnail_height), interpolation=cv2.INTER_AREA)
+        return thumbnail.astype(np.float32)
+
+    def should_infer(self, frame_idx, frame):
+        """
+        Returns True if the frame needs inference, False if it can reuse the peaks of the last inferred frame.
+
+        Frames must be passed in increasing order. A frame that does not directly follow
+        the previous one is always inferred, since the frames in between were not seen.
+        """
+        thumbnail = self.thumbnail(frame)
+        follows_previous = self._last_idx is not None and frame_idx == self._last_idx + 1
+        self._last_idx = frame_idx
+
+        if (follows_previous
+                and frame_idx - self._reference_idx < self.refresh_interval
+                and np.abs(thumbnail - self._reference).max() <= self.threshold):
+            self.num_skipped += 1
+            return False
+
+        self._reference = thumbnail
+        self._reference_idx = frame_idx
+        self.num_inferred += 1
+        return True
+
+
+class AutoLabeler:
+    """
+    Auto-labels a video: runs inference on the frames missing from the prediction
+    store, then labels the frames from their keypoints and the ROIs.
+
+    Attributes:
+        frames: Indexable frame container (array or `VideoFrameSource`).
+        predictor: Loaded SLEAP predictor.
+        roi_classifier: `RoiClassifier` built from the ROI config.
+        prediction_store: `PredictionStore` for the video and models.
+        batch_size: Number of frames per inference call.
+        inference_lock: Lock held while the predictor runs, so other threads can share it.
+        motion_gate: Optional `MotionGate`; frames it skips reuse the peaks of the last inferred frame.
+        profiler: `Profiler` timing the "decode", "inference" and "roi" stages (disabled by default).
+    """
+    def __init__(self, frames, predictor, roi_classifier, prediction_store, batch_size=DEFAULT_BATCH_SIZE, inference_lock=None,
+                 motion_gate=None, profiler=None):
+        self.frames = frames
+        self.predictor = predictor
+        self.roi_classifier = roi_classifier
+        self.prediction_store = prediction_store
+        self.batch_size = batch_size
+        self.inference_lock = inference_lock if inference_lock is not None else threading.Lock()
+        self.motion_gate = motion_gate
+        self.profiler = profiler if profiler is not None else DISABLED_PROFILER
+
+    def run(self):
+        """
+        Labels the video, in frame order.
+
+        Labels are yielded as soon as a range of frames is predicted, so callers can
+        use the first frames while the rest of the video is processed. Stopping the
+        iteration early stops the labeling; the predictions made so far stay in the
+        store.
+
+        Yields:
+            tuple: (index of the first frame, label codes of consecutive frames).
+        """
+        store = self.prediction_store
+        gate = self.motion_gate
+        # Without gating, frames that an earlier gated run skipped are predicted now
+        missing = store.missing(include_reused=gate is None)
+        if gate is not None:
+            gate.reset()
+        last_peaks = None
+        labeled_until = 0
+        try:
+            # Frames are decoded in a producer thread while the previous batch goes through
+            # the network, and only the frames that were not predicted yet are decoded
+            for frame_indices, frames in iter_frame_batches(self.frames, self.batch_size, indices=missing, profiler=self.profiler):
+                if gate is None:
+                    with self.inference_lock, self.profiler.stage("inference", frames=len(frames)):
+                        frame_peaks = predict_peaks(self.predictor, frames)
+                    store.put_batch(frame_indices, frame_peaks)
+                else:
+                    last_peaks = self._predict_gated(frame_indices, frames, last_peaks)
+
+                # Missing frames come in order, so every frame up to this batch is predicted now
+                batch_stop = int(frame_indices[-1]) + 1
+                yield from self.label_range(labeled_until, batch_stop)
+                labeled_until = batch_stop
+
+            yield from self.label_range(labeled_until, len(store))
+        finally:
+            store.flush()
+
+    def _predict_gated(self, frame_indices, frames, last_peaks):
+        """
+        Predicts the frames of a batch that the motion gate lets through, and stores the peaks
+        of the last inferred frame for the others.
+
+        Returns:
+            np.ndarray: Peaks of the last inferred frame, for the next batch.
+        """
+        infer = np.array([self.motion_gate.should_infer(frame_idx, frame) for frame_idx, frame in zip(frame_indices, frames)])
+        predicted = []
+        if infer.any():
+            with self.inference_lock, self.profiler.stage("inference", frames=int(infer.sum())):
+                predicted = predict_peaks(self.predictor, frames[infer])
+
+        predicted = iter(predicted)
+        for frame_idx, inferred in zip(frame_indices, infer):
+            if inferred:
+                last_peaks = next(predicted)
+                self.prediction_store.put(frame_idx, last_peaks)
+            else:
+                # The gate always infers the first frame, so there are peaks to reuse
+                self.prediction_store.put(frame_idx, last_peaks, reused=True)
+        return last_peaks
+
+    def label_range(self, start, stop):
+        """
+        Labels a range of frames that are already in the prediction store.
+
+        Yields:
+            tuple: (index of the first frame, label codes of consecutive frames).
+        """
+        for chunk_start in range(start, stop, LABEL_CHUNK_SIZE):
+            chunk_stop = min(chunk_start + LABEL_CHUNK_SIZE, stop)
+            with self.profiler.stage("roi", frames=chunk_stop - chunk_start):
+                peaks, num_instances = self.prediction_store.stack(chunk_start, chunk_stop)
+                codes = self.roi_classifier.classify(peaks, num_instances)
+            yield chunk_start, codes
@@ -0,0 +1,265 @@
+import csv
+import json
+import os
+import numpy as np
+
+# Code of the frames without a label
+UNLABELED = -1
+
+
+def categories_path(labels_path):
+    """Sidecar file holding the category table of a binary label file."""
+    return os.path.splitext(labels_path)[0] + ".categories.json"
+
+
+def binary_labels_path(csv_path):
+    """Binary label file an edited CSV label file is converted to."""
+    return os.path.splitext(csv_path)[0] + ".npy"
+
+
+class LabelStore:
+    """
+    Per-frame labels of a video, stored as one small integer code per frame.
+
+    Codes index a category table, which starts with the labels of the `RoiClassifier`
+    ("Explore", "None", then the ROI names) so its codes can be stored as they are.
+    The store reads like the {frame: label} dict it replaces: `store[frame]`,
+    `store.get(frame)`, `frame in store`, `store.items()` and `len(store)` only see
+    labeled frames.
+
+    Labels are saved either as one row per frame (Frame, Label) or as segments of
+    consecutive frames with the same label (Start, End, Label, with End inclusive).
+    For editing, they are also saved as a binary .npy file of codes, with the
+    categories in a JSON sidecar. It opens memory-mapped, and saving it back only
+    writes the frames changed since it was opened.
+
+    Attributes:
+        categories: Label of each code.
+        codes: Code of each frame, `UNLABELED` for frames without a label.
+        path: Binary label file the store was opened from or saved to, if any.
+    """
+    def __init__(self, num_frames, categories=(), codes=None):
+        self.categories = list(categories)
+        self.codes = codes if codes is not None else np.full(num_frames, UNLABELED, dtype=np.int16)
+        self.path = None
+        self._category_codes = {label: code for code, label in enumerate(self.categories)}
+        # Ranges of frames changed since the binary file was opened or saved
+        self._dirty = []
+
+    @property
+    def num_frames(self):
+        return len(self.codes)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.codes != UNLABELED))
+
+    def __bool__(self):
+        return bool((self.codes != UNLABELED).any())
+
+    def __contains__(self, frame_idx):
+        return 0 <= frame_idx < len(self.codes) and self.codes[frame_idx] != UNLABELED
+
+    def __getitem__(self, frame_idx):
+        if frame_idx not in self:
+            raise KeyError(frame_idx)
+        return self.categories[self.codes[frame_idx]]
+
+    def __setitem__(self, frame_idx, label):
+        self.codes[frame_idx] = self.category_code(label)
+        self._dirty.append((frame_idx, frame_idx + 1))
+
+    def get(self, frame_idx, default=None):
+        return self[frame_idx] if frame_idx in self else default
+
+    def items(self):
+        """Yields (frame, label) for the labeled frames, in frame order."""
+        for frame_idx in np.flatnonzero(self.codes != UNLABELED):
+            yield int(frame_idx), self.categories[self.codes[frame_idx]]
+
+    def category_code(self, label):
+        """Returns the code of a label, adding it to the category table if it is new."""
+        code = self._category_codes.get(label)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(label)
+            self._category_codes[label] = code
+        return code
+
+    def set_codes(self, start, codes):
+        """Labels consecutive frames, starting at `start`, from their codes."""
+        self.codes[start:start + len(codes)] = codes
+        self._dirty.append((start, start + len(codes)))
+
+    def counts(self):
+        """Number of frames per category."""
+        labeled = self.codes[self.codes != UNLABELED]
+        return np.bincount(labeled, minlength=len(self.categories))
+
+    def next_change(self, frame_idx, direction=1):
+        """
+        Returns the next frame after `frame_idx` (or before it, with direction=-1) whose label
+        differs from the label of `frame_idx`, or None if there is none.
+        """
+        if direction > 0:
+            changes = np.flatnonzero(self.codes[frame_idx + 1:] != self.codes[frame_idx])
+            return frame_idx + 1 + int(changes[0]) if len(changes) else None
+        changes = np.flatnonzero(self.codes[:frame_idx] != self.codes[frame_idx])
+        return int(changes[-1]) if len(changes) else None
+
+    def segments(self):
+        """
+        Splits the labeled frames into runs of consecutive frames with the same label.
+
+        Returns:
+            tuple: (start frames, end frames (inclusive), codes) of the segments.
+        """
+        boundaries = np.flatnonzero(np.diff(self.codes)) + 1
+        starts = np.concatenate(([0], boundaries)) if len(self.codes) else np.empty(0, dtype=np.int64)
+        ends = np.append(boundaries, len(self.codes)) - 1
+        codes = self.codes[starts]
+        labeled = codes != UNLABELED
+        return starts[labeled], ends[labeled], codes[labeled]
+
+    def save_frames(self, file_path):
+        """Writes one (Frame, Label) row per labeled frame."""
+        frames = np.flatnonzero(self.codes != UNLABELED)
+        labels = np.array(self.categories, dtype=object)[self.codes[frames]]
+        with open(file_path, mode='w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['Frame', 'Label'])
+            writer.writerows(zip(frames.tolist(), labels))
+
+    def save_segments(self, file_path):
+        """Writes one (Start, End, Label) row per segment of consecutive frames with the same label."""
+        starts, ends, codes = self.segments()
+        labels = np.array(self.categories, dtype=object)[codes]
+        with open(file_path, mode='w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['Start', 'End', 'Label'])
+            writer.writerows(zip(starts.tolist(), ends.tolist(), labels))
+
+    def save(self, file_path, segments=False):
+        """Writes the labels as segments or as one row per frame."""
+        if segments:
+            self.save_segments(file_path)
+        else:
+            self.save_frames(file_path)
+
+    def dirty_ranges(self):
+        """Merged, sorted (start, stop) ranges of the frames changed since the last binary save."""
+        merged = []
+        for start, stop in sorted(self._dirty):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+        return [(start, stop) for start, stop in merged]
+
+    def save_binary(self, file_path=None):
+        """
+        Saves the codes to a binary .npy file and the categories to its sidecar.
+
+        Saving back to the file the store was opened from only writes the changed frames.
+
+        Args:
+            file_path (str): Path to the .npy file. Defaults to the file the store was opened from.
+
+        Returns:
+            int: Number of frames written.
+        """
+        file_path = file_path or self.path
+        if file_path == self.path and os.path.exists(file_path):
+            ranges = self.dirty_ranges()
+            codes = np.load(file_path, mmap_mode="r+")
+            for start, stop in ranges:
+                codes[start:stop] = self.codes[start:stop]
+            codes.flush()
+            del codes
+            num_written = sum(stop - start for start, stop in ranges)
+        else:
+            np.save(file_path, np.asarray(self.codes))
+            num_written = len(self.codes)
+
+        # The category table only grows, and is small enough to rewrite
+        with open(categories_path(file_path), "w") as json_file:
+            json.dump(self.categories, json_file, indent=4)
+        self.path = file_path
+        self._dirty.clear()
+        return num_written
+
+    @classmethod
+    def open(cls, file_path):
+        """
+        Opens a binary label file without reading it: the codes are memory-mapped copy-on-write,
+        so edits stay in memory until `save_binary`.
+        """
+        with open(categories_path(file_path)) as json_file:
+            categories = json.load(json_file)
+        codes = np.load(file_path, mmap_mode="c")
+        store = cls(len(codes), categories, codes=codes)
+        store.path = file_path
+        return store
+
+    @classmethod
+    def open_for_editing(cls, file_path, num_frames, categories=()):
+        """
+        Opens a label file of any format for editing.
+
+        Binary files open memory-mapped. CSV files are converted once to a binary file next to
+        them, which later sessions open directly unless the CSV is newer.
+
+        Args:
+            file_path (str): Path to a binary (.npy) or CSV label file.
+            num_frames (int): Number of frames of the video.
+            categories (list): Initial category table for CSV files (e.g. `RoiClassifier.labels`).
+
+        Returns:
+            LabelStore: The labels, backed by a binary label file.
+        """
+        if file_path.endswith(".npy"):
+            store = cls.open(file_path)
+        else:
+            binary_path = binary_labels_path(file_path)
+            if os.path.exists(binary_path) and os.path.getmtime(binary_path) >= os.path.getmtime(file_path):
+                store = cls.open(binary_path)
+            else:
+                cls.load(file_path, num_frames, categories).save_binary(binary_path)
+                store = cls.open(binary_path)
+
+        if store.num_frames != num_frames:
+            raise ValueError(f"Label file {store.path} has {store.num_frames} frames, expected {num_frames}")
+        return store
+
+    @classmethod
+    def load(cls, file_path, num_frames=None, categories=()):
+        """
+        Reads labels saved by `save_frames` or `save_segments`; the format is detected from the header.
+
+        Args:
+            file_path (str): Path to the CSV file.
+            num_frames (int): Number of frames of the video. Defaults to one past the last labeled frame.
+            categories (list): Initial category table (e.g. `RoiClassifier.labels`), so codes match
+                the classifier; labels missing from it are appended.
+
+        Returns:
+            LabelStore: The labels.
+        """
+        with open(file_path, newline='') as csv_file:
+            reader = csv.reader(csv_file)
+            header = next(reader, None)
+            rows = list(reader)
+
+        if header == ['Frame', 'Label']:
+            frames = np.array([int(frame) for frame, _ in rows], dtype=np.int64)
+            store = cls(num_frames if num_frames is not None else int(frames.max(initial=-1)) + 1, categories)
+            store.codes[frames] = [store.category_code(label) for _, label in rows]
+        elif header == ['Start', 'End', 'Label']:
+            segments = [(int(start), int(end), label) for start, end, label in rows]
+            if num_frames is None:
+                num_frames = max((end for _, end, _ in segments), default=-1) + 1
+            store = cls(num_frames, categories)
+            for start, end, label in segments:
+                store.codes[start:end + 1] = store.category_code(label)
+        else:
+            raise ValueError(f"Unknown label file format in {file_path}: header {header}")
+        return store
@@ -0,0 +1,267 @@
+import os
+import numpy as np
+
+# OKS thresholds and recall grid of the VOC-style precision/recall curves, as in sleap.nn.evals
+MATCH_SCORE_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_THRESHOLDS = np.linspace(0, 1, 101)
+
+# Spread of the keypoint localization in the OKS, as in sleap.nn.evals
+OKS_STDDEV = 0.025
+
+
+def dist_metrics(dists):
+    """
+    Localization error metrics, matching the `dist.*` entries of `sleap.nn.evals.evaluate`.
+
+    Args:
+        dists (np.ndarray): Distances between matched GT and predicted points, with shape
+            (matched pairs, nodes). NaN for points missing from either instance.
+
+    Returns:
+        dict: Distances and their mean and percentiles.
+    """
+    dists = np.asarray(dists, dtype=np.float64)
+    metrics = {"dist.dists": dists}
+    all_missing = dists.size == 0 or np.isnan(dists).all()
+    metrics["dist.avg"] = np.nan if all_missing else np.nanmean(dists)
+    for percentile in (50, 75, 90, 95, 99):
+        metrics[f"dist.p{percentile}"] = np.nan if all_missing else np.nanpercentile(dists, percentile)
+    return metrics
+
+
+def voc_metrics(match_scores, detection_scores, num_false_negatives, match_score_thresholds=MATCH_SCORE_THRESHOLDS,
+                recall_thresholds=RECALL_THRESHOLDS, name="oks_voc"):
+    """
+    VOC-style precision/recall metrics, matching `sleap.nn.evals.compute_generalized_voc_metrics`.
+
+    Args:
+        match_scores (np.ndarray): Match score (e.g. OKS) of each matched pair.
+        detection_scores (np.ndarray): Score of the predicted instance of each matched pair.
+        num_false_negatives (int): Number of GT instances without a matching prediction.
+        match_score_thresholds (np.ndarray): Match scores above which a pair counts as a true positive.
+        recall_thresholds (np.ndarray): Recall grid the precisions are interpolated at.
+        name (str): Prefix of the metric names.
+
+    Returns:
+        dict: Precision/recall curves, AP/AR per threshold and their means.
+    """
+    match_scores = np.asarray(match_scores, dtype=np.float64)
+    detection_scores = np.asarray(detection_scores, dtype=np.float64)
+
+    # Rank the pairs by decreasing detection score (stable, as in SLEAP)
+    order = np.argsort(-detection_scores, kind="mergesort")
+    match_scores = match_scores[order]
+    num_gt = len(match_scores) + num_false_negatives
+
+    precisions = []
+    recalls = []
+    for match_score_threshold in match_score_thresholds:
+        tp = np.cumsum(match_scores >= match_score_threshold)
+        fp = np.cumsum(match_scores < match_score_threshold)
+        rc = tp / num_gt
+        pr = tp / (fp + tp + np.spacing(1))
+
+        # Make the precision monotonically decreasing
+        pr = np.maximum.accumulate(pr[::-1])[::-1]
+
+        # Best precision at each recall threshold
+        rc_inds = np.searchsorted(rc, recall_thresholds, side="left")
+        precision = np.zeros(rc_inds.shape)
+        valid = rc_inds < len(pr)
+        precision[valid] = pr[rc_inds[valid]]
+
+        precisions.append(precision)
+        recalls.append(rc[-1] if len(rc) else 0.0)
+
+    precisions = np.array(precisions)
+    recalls = np.array(recalls)
+    return {
+        f"{name}.match_score_thresholds": match_score_thresholds,
+        f"{name}.recall_thresholds": recall_thresholds,
+        f"{name}.match_scores": match_scores,
+        f"{name}.precisions": precisions,
+        f"{name}.recalls": recalls,
+        f"{name}.AP": precisions.mean(axis=1),
+        f"{name}.AR": recalls,
+        f"{name}.mAP": precisions.mean(),
+        f"{name}.mAR": recalls.mean(),
+    }
+
+
+def pad_instances(frame_instances, num_nodes):
+    """
+    Stacks the instances of each frame into one array padded with NaN.
+
+    Args:
+        frame_instances (list): Per frame, a list of (nodes, 2) point arrays.
+        num_nodes (int): Number of nodes of the skeleton.
+
+    Returns:
+        tuple: (points with shape (frames, max instances, nodes, 2), number of instances per frame).
+    """
+    num_instances = np.array([len(instances) for instances in frame_instances], dtype=np.int64)
+    points = np.full((len(frame_instances), num_instances.max(initial=0), num_nodes, 2), np.nan)
+    for frame, instances in enumerate(frame_instances):
+        if len(instances):
+            points[frame, :len(instances)] = np.stack(instances)
+    return points, num_instances
+
+
+def concat_keypoints(chunks):
+    """Concatenates keypoint arrays (see `evaluate_keypoints`) along frames, padding the instances to the largest chunk."""
+    keypoints = {"node_names": chunks[0]["node_names"]}
+    for key, per_frame_key in (("points_gt", "num_gt"), ("points_pr", "num_pr"), ("scores_pr", None)):
+        max_instances = max(chunk[key].shape[1] for chunk in chunks)
+        padded = []
+        for chunk in chunks:
+            pad_width = [(0, 0)] * chunk[key].ndim
+            pad_width[1] = (0, max_instances - chunk[key].shape[1])
+            padded.append(np.pad(chunk[key], pad_width, constant_values=np.nan))
+        keypoints[key] = np.concatenate(padded)
+        if per_frame_key:
+            keypoints[per_frame_key] = np.concatenate([chunk[per_frame_key] for chunk in chunks])
+    keypoints["frame_idxs"] = np.concatenate([chunk["frame_idxs"] for chunk in chunks])
+    return keypoints
+
+
+def save_keypoints(file_path, keypoints):
+    """Saves keypoint arrays to a .npz file, through a temporary file so an interrupted save leaves no partial file."""
+    tmp_path = file_path[:-len(".npz")] + ".tmp.npz"
+    np.savez(tmp_path, **keypoints)
+    os.replace(tmp_path, file_path)
+
+
+def load_keypoints(file_path):
+    """Loads keypoint arrays saved by `save_keypoints`."""
+    with np.load(file_path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def instance_area(points):
+    """
+    Area of the bounding box of the points of each instance, ignoring missing points.
+
+    Args:
+        points (np.ndarray): Points with shape (..., nodes, 2), NaN for missing points.
+
+    Returns:
+        np.ndarray: Areas with shape (...), NaN for instances without points.
+    """
+    return np.prod(np.fmax.reduce(points, axis=-2) - np.fmin.reduce(points, axis=-2), axis=-1)
+
+
+def pairwise_oks(points_gt, points_pr, stddev=OKS_STDDEV, scale=None):
+    """
+    Object keypoint similarity between every GT and predicted instance of each frame, with the
+    cocoeval normalization of `sleap.nn.evals.compute_oks`.
+
+    Args:
+        points_gt (np.ndarray): GT points with shape (frames, GT instances, nodes, 2), NaN for missing points.
+        points_pr (np.ndarray): Predicted points with shape (frames, predicted instances, nodes, 2).
+        stddev (float): Spread of the localization, per node or for all nodes.
+        scale (float): Size of the GT instances. Defaults to the area of their bounding boxes.
+
+    Returns:
+        np.ndarray: OKS with shape (frames, GT instances, predicted instances).
+    """
+    num_nodes = points_gt.shape[2]
+    scale = instance_area(points_gt) if scale is None else np.broadcast_to(scale, points_gt.shape[:2])
+    stddev = np.broadcast_to(stddev, (num_nodes,))
+
+    distance = ((points_gt[:, :, None] - points_pr[:, None]) ** 2).sum(axis=-1)
+    normalization = (2 * stddev) ** 2 * (2 * (scale + np.spacing(1)))[:, :, None, None]
+
+    # Missing predicted points are misses, missing GT points do not count
+    distance = np.where(np.isnan(points_pr).any(axis=-1)[:, None], np.inf, distance)
+    missing_gt = np.isnan(points_gt).any(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ks = np.where(missing_gt[:, :, None], 0.0, np.exp(-distance / normalization))
+        return ks.sum(axis=-1) / (~missing_gt).sum(axis=-1)[:, :, None]
+
+
+def match_instances(oks, scores_pr, num_gt, num_pr, threshold=0):
+    """
+    Matches GT and predicted instances in every frame at once, like `sleap.nn.evals.match_instances`:
+    predictions are taken by decreasing score and each takes the available GT instance with the
+    best OKS above `threshold`.
+
+    The loop runs over prediction ranks, not frames, so its length is the largest number of
+    predictions in a frame.
+
+    Args:
+        oks (np.ndarray): OKS with shape (frames, GT instances, predicted instances).
+        scores_pr (np.ndarray): Score of each predicted instance, with shape (frames, predicted instances).
+        num_gt (np.ndarray): Number of GT instances per frame.
+        num_pr (np.ndarray): Number of predicted instances per frame.
+        threshold (float): Smallest OKS of a match, exclusive.
+
+    Returns:
+        tuple: (frame, GT instance, predicted instance, OKS) arrays of the matched pairs, ordered by
+        frame then by decreasing prediction score.
+    """
+    num_frames, max_gt, max_pr = oks.shape
+    frames = np.arange(num_frames)
+    order = np.argsort(-np.where(np.arange(max_pr) < num_pr[:, None], scores_pr, -np.inf), axis=1, kind="stable")
+    gt_available = np.arange(max_gt) < num_gt[:, None]
+
+    matched_gt = np.full((num_frames, max_pr), -1, dtype=np.int64)
+    matched_oks = np.zeros((num_frames, max_pr))
+    for rank in range(max_pr):
+        instance_pr = order[:, rank]
+        candidates = oks[frames, :, instance_pr]
+        candidates = np.where(gt_available & (candidates > threshold), candidates, -np.inf)
+        best_gt = candidates.argmax(axis=1)
+        best_oks = candidates[frames, best_gt]
+        matched = (rank < num_pr) & (best_oks > -np.inf)
+        gt_available[frames[matched], best_gt[matched]] = False
+        matched_gt[matched, rank] = best_gt[matched]
+        matched_oks[matched, rank] = best_oks[matched]
+
+    pair_frames, pair_ranks = np.nonzero(matched_gt >= 0)
+    return (pair_frames, matched_gt[pair_frames, pair_ranks], order[pair_frames, pair_ranks],
+            matched_oks[pair_frames, pair_ranks])
+
+
+def evaluate_keypoints(keypoints, nodes=None, frames=None, stddev=OKS_STDDEV, scale=None, match_threshold=0,
+                       match_score_thresholds=MATCH_SCORE_THRESHOLDS, recall_thresholds=RECALL_THRESHOLDS):
+    """
+    Scores predicted keypoints against GT keypoints, with the same metric names and values as
+    `sleap.nn.evals.evaluate` for the `dist.*`, `oks.mOKS` and `oks_voc.*` metrics.
+
+    Args:
+        keypoints (dict): Keypoint arrays of the paired GT and predicted frames:
+            points_gt (frames, GT instances, nodes, 2) and num_gt (frames,): GT instances, NaN padded.
+            points_pr (frames, predicted instances, nodes, 2), scores_pr (frames, predicted instances)
+            and num_pr (frames,): predicted instances, NaN padded.
+        nodes (list): Indices of the nodes to score. Defaults to all nodes. The OKS scale still
+            comes from all the nodes, so scoring a single node does not shrink the instances to points.
+        frames (np.ndarray): Indices (or boolean mask) of the frames to score. Defaults to all frames.
+        stddev (float): OKS spread, see `pairwise_oks`.
+        scale (float): OKS instance size, see `pairwise_oks`.
+        match_threshold (float): Smallest OKS of a match, see `match_instances`.
+        match_score_thresholds (np.ndarray): OKS thresholds of the precision/recall curves.
+        recall_thresholds (np.ndarray): Recall grid of the precision/recall curves.
+
+    Returns:
+        dict: Evaluation metrics, empty if there are no frames to score.
+    """
+    points_gt, num_gt = keypoints["points_gt"], keypoints["num_gt"]
+    points_pr, scores_pr, num_pr = keypoints["points_pr"], keypoints["scores_pr"], keypoints["num_pr"]
+    if frames is not None:
+        points_gt, num_gt, points_pr, scores_pr, num_pr = (array[frames] for array in (points_gt, num_gt, points_pr, scores_pr, num_pr))
+    if len(points_gt) == 0:
+        return {}
+    if nodes is not None:
+        if scale is None:
+            scale = instance_area(points_gt)
+        points_gt, points_pr = points_gt[:, :, nodes], points_pr[:, :, nodes]
+
+    oks = pairwise_oks(points_gt, points_pr, stddev=stddev, scale=scale)
+    pair_frames, pair_gt, pair_pr, pair_oks = match_instances(oks, scores_pr, num_gt, num_pr, threshold=match_threshold)
+
+    metrics = dist_metrics(np.linalg.norm(points_pr[pair_frames, pair_pr] - points_gt[pair_frames, pair_gt], axis=-1))
+    metrics["oks.mOKS"] = pair_oks.mean() if len(pair_oks) else np.nan
+    num_false_negatives = int(num_gt.sum()) - len(pair_oks)
+    metrics.update(voc_metrics(pair_oks, scores_pr[pair_frames, pair_pr], num_false_negatives,
+                               match_score_thresholds, recall_thresholds, name="oks_voc"))
+    return metrics
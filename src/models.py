@@ -0,0 +1,180 @@
+import gc
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import predict_peaks
+
+# Number of loaded predictors kept by the registry by default; each holds its models in
+# (GPU) memory, so lower it when memory is tight
+DEFAULT_MAX_PREDICTORS = 2
+
+# sleap (and TensorFlow with it) takes seconds and hundreds of MB to import, so it is only
+# imported when a page needs it; `preload_sleap` starts the import in the background
+_sleap = None
+_sleap_lock = threading.Lock()
+_preload_thread = None
+
+
+def load_sleap():
+    """
+    Returns the sleap module, importing it on first use.
+
+    The first import also turns off TensorFlow's GPU memory preallocation. If a background
+    preload is running, this waits for it instead of importing twice.
+    """
+    global _sleap
+    with _sleap_lock:
+        if _sleap is None:
+            import sleap
+            sleap.disable_preallocation()
+            _sleap = sleap
+    return _sleap
+
+
+def sleap_loaded():
+    """True once sleap is imported."""
+    return _sleap is not None
+
+
+def preload_sleap():
+    """
+    Starts importing sleap in a background thread, if it is not imported or importing yet.
+
+    Returns:
+        threading.Thread: The import thread, or None if sleap is already imported.
+    """
+    global _preload_thread
+    if _sleap is not None:
+        return None
+    if _preload_thread is None or not _preload_thread.is_alive():
+        _preload_thread = threading.Thread(target=_preload, name="sleap-preload", daemon=True)
+        _preload_thread.start()
+    return _preload_thread
+
+
+def _preload():
+    try:
+        load_sleap()
+    except Exception as e:
+        # The page that needs sleap imports it again and reports the error
+        print(f"Failed to preload sleap: {e}")
+
+
+def model_mtime(model_path):
+    """Latest modification time (ns) of the files of a model directory (or of a model file)."""
+    if not os.path.isdir(model_path):
+        return os.stat(model_path).st_mtime_ns
+    mtimes = [os.stat(model_path).st_mtime_ns]
+    for dir_path, _, file_names in os.walk(model_path):
+        mtimes += [os.stat(os.path.join(dir_path, file_name)).st_mtime_ns for file_name in file_names]
+    return max(mtimes)
+
+
+class PredictorRegistry:
+    """
+    Process-wide cache of loaded SLEAP predictors.
+
+    Predictors are keyed by their model paths, the modification times of the models and
+    the batch size, so a retrained model is reloaded while labeling more videos with the
+    same models reuses the loaded predictor. Beyond `max_predictors`, the least recently
+    used predictor is dropped.
+
+    A predictor can also be warmed up on blank frames of a video's shape, which traces its
+    graphs for single frames (display) and full batches (auto-labeling) before the first
+    real frame comes.
+
+    Since a predictor outlives the video it was loaded for, each one comes with an inference
+    lock, handed out with it: every thread running the predictor (display, auto-labeling, a
+    labeler of the previous video that is still finishing its batch, the warm-up) holds it.
+
+    Attributes:
+        max_predictors: Largest number of predictors kept loaded; 0 keeps none.
+    """
+    def __init__(self, max_predictors=DEFAULT_MAX_PREDICTORS):
+        self.max_predictors = max_predictors
+        # Registry key -> (predictor, inference lock)
+        self._predictors = OrderedDict()
+        self._warmed_up = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._predictors)
+
+    @staticmethod
+    def key(model_paths, batch_size):
+        """Registry key of a set of models: their paths and modification times, and the batch size."""
+        model_paths = [os.path.abspath(model_path) for model_path in model_paths]
+        return tuple(model_paths), tuple(model_mtime(model_path) for model_path in model_paths), batch_size
+
+    def get(self, model_paths, batch_size=1, frame_shape=None):
+        """
+        Returns the predictor of a set of models and its inference lock, loading it if it is not in the registry.
+
+        Args:
+            model_paths (list): Paths of the models (e.g. centroid and centered instance).
+            batch_size (int): Inference batch size.
+            frame_shape (tuple): If set, (height, width, channels) of the frames to warm the predictor up on.
+
+        Returns:
+            tuple: (loaded predictor, lock to hold while running it).
+        """
+        key = self.key(model_paths, batch_size)
+        with self._lock:
+            entry = self._predictors.get(key)
+            if entry is not None:
+                self._predictors.move_to_end(key)
+            else:
+                # Drop the predictors of older versions of the same models
+                for stale_key in [other for other in self._predictors if other[0] == key[0] and other[2] == batch_size]:
+                    self._remove(stale_key)
+                predictor = load_sleap().load_model(list(model_paths), batch_size=batch_size)
+                print(f"Loaded models {', '.join(model_paths)} (batch size {batch_size})")
+                entry = (predictor, threading.Lock())
+                self._predictors[key] = entry
+                self._evict()
+
+            if frame_shape is not None and (key, tuple(frame_shape)) not in self._warmed_up:
+                self.warm_up(*entry, frame_shape, batch_size)
+                if key in self._predictors:
+                    self._warmed_up.add((key, tuple(frame_shape)))
+        return entry
+
+    @staticmethod
+    def warm_up(predictor, inference_lock, frame_shape, batch_size=1):
+        """Runs a predictor on blank frames, one alone and a full batch, so their graphs are traced."""
+        for num_frames in sorted({1, batch_size}):
+            with inference_lock:
+                predict_peaks(predictor, np.zeros((num_frames, *frame_shape), dtype=np.uint8))
+
+    def set_max_predictors(self, max_predictors):
+        """Changes the number of predictors kept, dropping the least recently used ones beyond it."""
+        with self._lock:
+            self.max_predictors = max_predictors
+            self._evict()
+
+    def clear(self):
+        """Drops every predictor."""
+        with self._lock:
+            for key in list(self._predictors):
+                self._remove(key)
+
+    def _evict(self):
+        while len(self._predictors) > max(self.max_predictors, 0):
+            self._remove(next(iter(self._predictors)))
+
+    def _remove(self, key):
+        del self._predictors[key]
+        self._warmed_up = {warmed for warmed in self._warmed_up if warmed[0] != key}
+        gc.collect()
+
+
+# Registry shared by the whole process
+predictor_registry = PredictorRegistry()
+
+
+def get_predictor(model_paths, batch_size=1, frame_shape=None):
+    """Returns a predictor and its inference lock from the process-wide registry (see `PredictorRegistry.get`)."""
+    return predictor_registry.get(model_paths, batch_size, frame_shape)
@@ -0,0 +1,111 @@
+import os
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+
+def finish_figure(output_path=None):
+    """Shows the current figure, or saves it to `output_path` and closes it."""
+    if output_path is None:
+        plt.show()
+    else:
+        plt.savefig(output_path, bbox_inches="tight")
+        plt.close()
+
+
+def plot_error_distribution(dists, model_name, output_path=None):
+    """
+    Plots the localization error distribution for a given model.
+
+    Args:
+        dists (np.ndarray): Localization errors (`dist.dists` metric).
+        model_name (str): Name of the model being evaluated.
+        output_path (str): If set, the figure is saved there instead of shown.
+    """
+    plt.figure(figsize=(6, 3), dpi=150, facecolor="w")
+    sns.histplot(dists.flatten(), binrange=(0, 20), kde=True, kde_kws={"clip": (0, 20)}, stat="probability")
+    plt.xlabel(f"Localization error (px) - {model_name}")
+    finish_figure(output_path)
+
+
+def plot_keypoint_similarity(match_scores, model_name, output_path=None):
+    """
+    Plots the Object Keypoint Similarity (OKS) distribution for a given model.
+
+    Args:
+        match_scores (np.ndarray): OKS of the matched instances (`oks_voc.match_scores` metric).
+        model_name (str): Name of the model being evaluated.
+        output_path (str): If set, the figure is saved there instead of shown.
+    """
+    plt.figure(figsize=(6, 3), dpi=150, facecolor="w")
+    sns.histplot(match_scores.flatten(), binrange=(0, 1), kde=True, kde_kws={"clip": (0, 1)}, stat="probability")
+    plt.xlabel(f"Object Keypoint Similarity - {model_name}")
+    finish_figure(output_path)
+
+
+def plot_precision_recall(precisions, match_score_thresholds, recall_thresholds, model_name, output_path=None):
+    """
+    Plots the Precision-Recall curve for various OKS thresholds for a given model.
+
+    Args:
+        precisions (np.ndarray): Precision at each recall threshold, per OKS threshold.
+        match_score_thresholds (np.ndarray): OKS thresholds.
+        recall_thresholds (np.ndarray): Recall thresholds.
+        model_name (str): Name of the model being evaluated.
+        output_path (str): If set, the figure is saved there instead of shown.
+    """
+    plt.figure(figsize=(4, 4), dpi=150, facecolor="w")
+    for precision, thresh in zip(precisions[::2], match_score_thresholds[::2]):
+        plt.plot(recall_thresholds, precision, "-", label=f"OKS @ {thresh:.2f}")
+    plt.xlabel(f"Recall - {model_name}")
+    plt.ylabel("Precision")
+    plt.legend(loc="lower left")
+    finish_figure(output_path)
+
+
+def plot_training_log(model_dir, output_path=None):
+    """
+    Searches for a training_log.csv file in the model directory and plots it.
+
+    Args:
+        model_dir (str): Path to the directory containing the training log.
+        output_path (str): If set, the figure is saved there instead of shown.
+
+    Returns:
+        bool: True if a training log was found.
+    """
+    training_log_path = os.path.join(model_dir, "training_log.csv")
+    if not os.path.exists(training_log_path):
+        print(f"No training log found in {model_dir}")
+        return False
+
+    print(f"Found training log: {training_log_path}")
+    # Load and plot the training log
+    training_log = pd.read_csv(training_log_path)
+    plt.figure(figsize=(10, 6))
+    plt.plot(training_log["epoch"], training_log["train_loss"], "o-", label="Training Loss")
+    plt.plot(training_log["epoch"], training_log["val_loss"], "x-", label="Validation Loss")
+    plt.xlabel("Epoch")
+    plt.ylabel("Loss")
+    plt.title(f"Training and Validation Loss - {model_dir}")
+    plt.legend()
+    finish_figure(output_path)
+    return True
+
+
+def render_plot(task):
+    """
+    Renders one figure of a report to a file, in a worker process.
+
+    Args:
+        task (tuple): (name of a plot function of this module, its arguments, output path).
+
+    Returns:
+        str: The output path, or None if there was nothing to plot.
+    """
+    plot_name, args, output_path = task
+    # Workers never open windows
+    mpl.use("Agg")
+    found = globals()[plot_name](*args, output_path=output_path)
+    return None if found is False else output_path
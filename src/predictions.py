@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+# Number of evenly spaced blocks, and their size, read to fingerprint a video file
+VIDEO_HASH_BLOCKS = 16
+VIDEO_HASH_BLOCK_BYTES = 1024 ** 2
+
+# Files that define a trained SLEAP model; other files in the model directory are ignored
+MODEL_FILES = ("best_model.h5", "training_config.json")
+
+
+def video_fingerprint(video_path):
+    """
+    Hashes the content of a video file.
+
+    Hashing a multi-GB recording completely would take longer than opening it, so
+    the hash covers the file size and evenly spaced blocks of the file (always
+    including the first and last ones).
+
+    Args:
+        video_path (str): Path to the video file.
+
+    Returns:
+        str: Hex digest of the video content.
+    """
+    file_size = os.path.getsize(video_path)
+    digest = hashlib.sha1(str(file_size).encode("utf-8"))
+    with open(video_path, "rb") as f:
+        last_offset = max(file_size - VIDEO_HASH_BLOCK_BYTES, 0)
+        for i in range(VIDEO_HASH_BLOCKS):
+            f.seek(last_offset * i // (VIDEO_HASH_BLOCKS - 1))
+            digest.update(f.read(VIDEO_HASH_BLOCK_BYTES))
+    return digest.hexdigest()
+
+
+def _update_digest(digest, file_path):
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(VIDEO_HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+
+
+def file_checksum(file_path):
+    """Hashes the whole content of a file, e.g. a labeled SLEAP project."""
+    digest = hashlib.sha1()
+    _update_digest(digest, file_path)
+    return digest.hexdigest()
+
+
+def model_checksum(model_path):
+    """
+    Hashes the files defining a trained SLEAP model.
+
+    Args:
+        model_path (str): Path to the model directory (or to a file inside it).
+
+    Returns:
+        str: Hex digest of the model weights and training config.
+    """
+    model_dir = model_path if os.path.isdir(model_path) else os.path.dirname(model_path)
+    file_names = [name for name in MODEL_FILES if os.path.exists(os.path.join(model_dir, name))]
+    if not file_names:
+        file_names = sorted(name for name in os.listdir(model_dir) if os.path.isfile(os.path.join(model_dir, name)))
+
+    digest = hashlib.sha1()
+    for name in file_names:
+        digest.update(name.encode("utf-8"))
+        _update_digest(digest, os.path.join(model_dir, name))
+    return digest.hexdigest()
+
+
+def prediction_key(video_path, model_paths):
+    """
+    Cache key for the predictions of some models on a video.
+
+    Combines the video content hash with the path and checksum of each model, so
+    retrained models or re-encoded videos never reuse stale predictions.
+    """
+    key_data = {
+        "video": video_fingerprint(video_path),
+        "models": [[os.path.abspath(path), model_checksum(path)] for path in model_paths],
+    }
+    return hashlib.sha1(json.dumps(key_data).encode("utf-8")).hexdigest()
+
+
+def prediction_store_path(video_path, key):
+    """Sidecar directory next to the video holding the predictions for `key`."""
+    return os.path.join(f"{video_path}.predictions", key[:16])
+
+
+class PredictionStore:
+    """
+    Per-frame instance peaks, stored in memory-mapped .npy files or in memory.
+
+    Frames can be filled in any order and in several sessions; frames that were
+    never predicted are reported by `missing()`, so an interrupted run resumes
+    where it stopped. The store can be read and filled from several threads.
+
+    Attributes:
+        path: Directory holding the .npy files, or None for a store kept in memory.
+        num_instances: Number of predicted instances per frame, -1 for frames not predicted yet.
+        peaks: Keypoints with shape (frames, max instances, nodes, 2), padded with NaN, or None
+            until the first instance is stored.
+        reused: True for frames whose peaks were copied from an earlier frame by motion gating
+            instead of being predicted.
+    """
+    def __init__(self, num_frames, path=None):
+        """
+        Opens the store in `path`, creating it if needed.
+
+        Args:
+            num_frames (int): Number of frames in the video.
+            path (str): Directory holding the .npy files. If None, the store only lives in memory
+                for the current session.
+        """
+        self.path = path
+        self.peaks = None
+        self._lock = threading.RLock()
+        if path is None:
+            self.num_instances = np.full(num_frames, -1, dtype=np.int32)
+            self.reused = np.zeros(num_frames, dtype=bool)
+            return
+
+        os.makedirs(path, exist_ok=True)
+        num_instances_path = os.path.join(path, "num_instances.npy")
+        peaks_path = os.path.join(path, "peaks.npy")
+        reused_path = os.path.join(path, "reused.npy")
+        if os.path.exists(num_instances_path):
+            self.num_instances = np.load(num_instances_path, mmap_mode="r+")
+            if len(self.num_instances) != num_frames:
+                raise ValueError(f"Prediction store {path} has {len(self.num_instances)} frames, expected {num_frames}")
+        else:
+            self.num_instances = np.lib.format.open_memmap(num_instances_path, mode="w+", dtype=np.int32, shape=(num_frames,))
+            self.num_instances[:] = -1
+
+        if os.path.exists(reused_path):
+            self.reused = np.load(reused_path, mmap_mode="r+")
+        else:
+            # Stores written before motion gating only hold predicted frames
+            self.reused = np.lib.format.open_memmap(reused_path, mode="w+", dtype=bool, shape=(num_frames,))
+
+        if os.path.exists(peaks_path):
+            self.peaks = np.load(peaks_path, mmap_mode="r+")
+
+    def __len__(self):
+        return len(self.num_instances)
+
+    def __contains__(self, frame_idx):
+        return self.num_instances[frame_idx] >= 0
+
+    def missing(self, include_reused=False):
+        """
+        Returns the indices of the frames that were not predicted yet.
+
+        Args:
+            include_reused (bool): Also return the frames whose peaks were reused from an earlier
+                frame, so they get predicted.
+        """
+        missing = np.asarray(self.num_instances) < 0
+        if include_reused:
+            missing |= np.asarray(self.reused)
+        return np.flatnonzero(missing)
+
+    def get(self, frame_idx):
+        """
+        Returns the peaks of a frame with shape (instances, nodes, 2), or None if it was not predicted yet.
+        """
+        with self._lock:
+            num_instances = self.num_instances[frame_idx]
+            if num_instances < 0:
+                return None
+            if num_instances == 0:
+                num_nodes = self.peaks.shape[2] if self.peaks is not None else 0
+                return np.empty((0, num_nodes, 2), dtype=np.float32)
+            return np.array(self.peaks[frame_idx, :num_instances])
+
+    def put(self, frame_idx, peaks_np, reused=False):
+        """
+        Stores the peaks of a frame, with shape (instances, nodes, 2).
+
+        Args:
+            frame_idx (int): Index of the frame.
+            peaks_np (np.ndarray): Peaks of the frame.
+            reused (bool): True if the peaks were copied from an earlier frame instead of predicted.
+        """
+        num_instances = len(peaks_np)
+        with self._lock:
+            self.reused[frame_idx] = reused
+            if num_instances > 0:
+                self._reserve(num_instances, np.shape(peaks_np)[1])
+                self.peaks[frame_idx] = np.nan
+                self.peaks[frame_idx, :num_instances] = peaks_np
+            # Written last, so a frame only counts as predicted once its peaks are stored
+            self.num_instances[frame_idx] = num_instances
+
+    def put_batch(self, frame_indices, frame_peaks):
+        """Stores the peaks of several frames."""
+        for frame_idx, peaks_np in zip(frame_indices, frame_peaks):
+            self.put(frame_idx, peaks_np)
+
+    def stack(self, start, stop):
+        """
+        Returns the peaks of a range of predicted frames, in the layout used by `RoiClassifier.classify`.
+
+        Returns:
+            tuple: (peaks with shape (frames, max instances, nodes, 2), number of instances per frame).
+        """
+        with self._lock:
+            num_instances = np.array(self.num_instances[start:stop])
+            if self.peaks is None:
+                return np.empty((len(num_instances), 0, 2, 2), dtype=np.float32), num_instances
+            return np.array(self.peaks[start:stop]), num_instances
+
+    def flush(self):
+        """Writes pending changes to disk."""
+        if self.path is None:
+            return
+        with self._lock:
+            self.num_instances.flush()
+            self.reused.flush()
+            if self.peaks is not None:
+                self.peaks.flush()
+
+    def _reserve(self, num_instances, num_nodes):
+        """Makes room for `num_instances` instances per frame, growing the peaks file if needed."""
+        if self.peaks is not None and self.peaks.shape[1] >= num_instances:
+            return
+
+        shape = (len(self.num_instances), num_instances, num_nodes, 2)
+        if self.path is None:
+            peaks = np.full(shape, np.nan, dtype=np.float32)
+            if self.peaks is not None:
+                peaks[:, :self.peaks.shape[1]] = self.peaks
+            self.peaks = peaks
+            return
+
+        peaks_path = os.path.join(self.path, "peaks.npy")
+        tmp_path = os.path.join(self.path, "peaks.tmp.npy")
+        peaks = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=shape)
+        peaks[:] = np.nan
+        if self.peaks is not None:
+            peaks[:, :self.peaks.shape[1]] = self.peaks
+        peaks.flush()
+        del peaks
+
+        self.peaks = None
+        os.replace(tmp_path, peaks_path)
+        self.peaks = np.load(peaks_path, mmap_mode="r+")
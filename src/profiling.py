@@ -0,0 +1,240 @@
+import collections
+import json
+import os
+import threading
+import time
+import numpy as np
+
+# Number of recent events kept per stage for the rolling statistics
+ROLLING_WINDOW = 500
+
+# Edges of the latency histograms, in milliseconds: log-spaced from 10 us to 10 s
+HISTOGRAM_EDGES_MS = np.logspace(-2, 4, 25)
+
+# Largest number of events kept for the trace; older events are dropped
+MAX_TRACE_EVENTS = 1_000_000
+
+
+class _NullStage:
+    """Stage of a disabled profiler: entering and leaving it does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """Times one run of a stage and records it on exit."""
+    __slots__ = ("profiler", "name", "frames", "start")
+
+    def __init__(self, profiler, name, frames):
+        self.profiler = profiler
+        self.name = name
+        self.frames = frames
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter(), self.frames)
+        return False
+
+
+class Profiler:
+    """
+    Per-stage timing of the labeling and evaluation pipelines.
+
+    Code wraps its stages in `with profiler.stage("inference", frames=len(batch)):`.
+    A disabled profiler hands out a shared no-op stage, so instrumented code costs one
+    attribute check per stage when profiling is off. An enabled profiler keeps the last
+    `window` latencies of each stage, for rolling statistics and histograms, and the
+    frame counts, for throughput. With `trace` set, every event is also kept as a Chrome
+    trace event, saved by `save_trace` for chrome://tracing or Perfetto.
+
+    Stages can be timed from any thread; nested stages show up nested in the trace. The
+    traces of profilers in other processes can be merged in with `export_trace` and
+    `import_trace`.
+
+    Attributes:
+        enabled: If False, nothing is recorded.
+        window: Number of recent events kept per stage.
+        trace: If True, events are kept for `save_trace`.
+    """
+    def __init__(self, enabled=True, window=ROLLING_WINDOW, trace=False):
+        self.enabled = enabled
+        self.window = window
+        self.trace = trace
+        self.start_time = time.perf_counter()
+        self._trace_events = collections.deque(maxlen=MAX_TRACE_EVENTS)
+        # (process id, thread id) -> thread name, for the trace
+        self._thread_names = {}
+        self.reset()
+
+    def reset(self, trace=False):
+        """Forgets the recorded statistics, and with `trace` the trace events too."""
+        self._durations = {}
+        self._frames = {}
+        if trace:
+            self._trace_events.clear()
+
+    def stage(self, name, frames=0):
+        """
+        Context manager timing a stage.
+
+        Args:
+            name (str): Stage name.
+            frames (int): Number of frames the stage processes, for `fps`.
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, frames)
+
+    def record(self, name, start, end, frames=0):
+        """Records a run of a stage, from `time.perf_counter` start and end times."""
+        if name not in self._durations:
+            self._durations.setdefault(name, collections.deque(maxlen=self.window))
+            self._frames.setdefault(name, collections.deque(maxlen=self.window))
+        self._durations[name].append(end - start)
+        self._frames[name].append((end, frames))
+
+        if self.trace:
+            thread = threading.current_thread()
+            self._thread_names[(os.getpid(), thread.ident)] = thread.name
+            self._trace_events.append({
+                "name": name,
+                "ph": "X",
+                "ts": 1e6 * (start - self.start_time),
+                "dur": 1e6 * (end - start),
+                "pid": os.getpid(),
+                "tid": thread.ident,
+                "args": {"frames": frames} if frames else {},
+            })
+
+    def stages(self):
+        """Names of the stages recorded so far, in first-seen order."""
+        return list(self._durations)
+
+    def latencies(self, name):
+        """Recent latencies of a stage, in milliseconds."""
+        return 1000 * np.array(self._durations.get(name, ()))
+
+    def stats(self, name):
+        """
+        Rolling statistics of a stage.
+
+        Returns:
+            dict: Number of recent events and their mean, p50, p95 and max latency, in milliseconds.
+        """
+        latencies = self.latencies(name)
+        if len(latencies) == 0:
+            return {"count": 0, "mean_ms": np.nan, "p50_ms": np.nan, "p95_ms": np.nan, "max_ms": np.nan}
+        return {
+            "count": len(latencies),
+            "mean_ms": latencies.mean(),
+            "p50_ms": np.percentile(latencies, 50),
+            "p95_ms": np.percentile(latencies, 95),
+            "max_ms": latencies.max(),
+        }
+
+    def histogram(self, name):
+        """
+        Histogram of the recent latencies of a stage.
+
+        Returns:
+            tuple: (counts, bin edges in milliseconds), with the edges of `HISTOGRAM_EDGES_MS`.
+        """
+        counts, edges = np.histogram(np.clip(self.latencies(name), HISTOGRAM_EDGES_MS[0], HISTOGRAM_EDGES_MS[-1]),
+                                     bins=HISTOGRAM_EDGES_MS)
+        return counts, edges
+
+    def fps(self, name, period=2.0):
+        """Frames per second processed by a stage over the last `period` seconds."""
+        now = time.perf_counter()
+        num_frames = sum(frames for end, frames in list(self._frames.get(name, ())) if end >= now - period)
+        return num_frames / period
+
+    def status_line(self, fps_stages=(), stages=None):
+        """
+        One-line summary for a status bar, e.g. "viewer 24.8 fps | decode 2.1 ms | draw 0.8 ms".
+
+        Args:
+            fps_stages (list): (label, stage name) pairs whose throughput is shown.
+            stages (list): Stages whose mean latency is shown. Defaults to all stages.
+        """
+        parts = [f"{label} {self.fps(name):.1f} fps" for label, name in fps_stages]
+        for name in stages if stages is not None else self.stages():
+            stats = self.stats(name)
+            if stats["count"]:
+                parts.append(f"{name} {stats['mean_ms']:.1f} ms")
+        return " | ".join(parts)
+
+    def summary(self):
+        """Rolling statistics and histogram of every stage."""
+        summary = {}
+        for name in self.stages():
+            counts, edges = self.histogram(name)
+            summary[name] = {**self.stats(name), "histogram_counts": counts.tolist(), "histogram_edges_ms": edges.tolist()}
+        return summary
+
+    def print_summary(self):
+        """Prints the rolling statistics of every stage."""
+        print_stage_stats({name: self.stats(name) for name in self.stages()})
+
+    def export_trace(self):
+        """
+        Trace events recorded so far, for `import_trace` in another process.
+
+        Returns:
+            dict: Events with timestamps from the `time.perf_counter` origin, which all processes
+            of a machine share, and thread names.
+        """
+        offset = 1e6 * self.start_time
+        return {
+            "events": [{**event, "ts": event["ts"] + offset} for event in self._trace_events],
+            "thread_names": [(pid, tid, name) for (pid, tid), name in self._thread_names.items()],
+        }
+
+    def import_trace(self, trace):
+        """Adds the trace events exported by another profiler (see `export_trace`)."""
+        offset = 1e6 * self.start_time
+        self._trace_events.extend({**event, "ts": event["ts"] - offset} for event in trace["events"])
+        self._thread_names.update({(pid, tid): name for pid, tid, name in trace["thread_names"]})
+
+    def save_trace(self, file_path):
+        """
+        Writes the recorded events as a Chrome trace-event JSON file.
+
+        Returns:
+            int: Number of events written.
+        """
+        events = list(self._trace_events)
+        metadata = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                    for (pid, tid), name in self._thread_names.items()]
+        with open(file_path, "w") as json_file:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, json_file)
+        return len(events)
+
+
+def print_stage_stats(stage_stats, title="Stage timings (recent events)"):
+    """
+    Prints per-stage statistics.
+
+    Args:
+        stage_stats (dict): Stage name -> `Profiler.stats` of the stage.
+        title (str): Title line.
+    """
+    print(f"\n--- {title} ---")
+    for name, stats in stage_stats.items():
+        print(f"{name:>20}: {stats['count']:>5} | mean {stats['mean_ms']:9.2f} ms | p50 {stats['p50_ms']:9.2f} ms | "
+              f"p95 {stats['p95_ms']:9.2f} ms | max {stats['max_ms']:9.2f} ms")
+
+
+# Profiler used when none is given: disabled, so instrumented code runs at full speed
+DISABLED_PROFILER = Profiler(enabled=False)
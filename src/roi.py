@@ -0,0 +1,475 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# Labels used when no keypoint falls inside an ROI, or when nothing was detected
+EXPLORE_LABEL = "Explore"
+NONE_LABEL = "None"
+
+# Skeleton nodes tested against the ROIs, in priority order (head before tail)
+ROI_NODES = (0, 1)
+
+# Number of points tested against a polygon at once, to bound temporary memory
+POINTS_PER_CHUNK = 65536
+
+# Upper bound on the number of cells of the `RoiIndex` grid
+GRID_MAX_CELLS = 1 << 16
+
+
+def load_roi_config(config_path):
+    """Loads an ROI config saved by the "Create Labels" page."""
+    with open(config_path, "r") as json_file:
+        return json.load(json_file)
+
+
+def polygon_edges(shape_points):
+    """
+    Converts polygon vertices to an array of edges.
+
+    Args:
+        shape_points (list): Polygon vertices as (x, y) pairs, in drawing order.
+
+    Returns:
+        np.ndarray: Edges with shape (vertices, 4), each row holding (x0, y0, x1, y1).
+    """
+    vertices = np.asarray(shape_points, dtype=np.float64)
+    return np.concatenate([vertices, np.roll(vertices, -1, axis=0)], axis=1)
+
+
+def points_in_polygon(points, edges):
+    """
+    Vectorized point-in-polygon test.
+
+    Uses the even-odd crossing rule and then excludes points lying exactly on an
+    edge, which matches shapely's `Polygon.contains` (the boundary is not part of
+    the interior). Points with NaN coordinates are never inside.
+
+    Args:
+        points (np.ndarray): Points with shape (..., 2).
+        edges (np.ndarray): Polygon edges with shape (vertices, 4), or (..., vertices, 4)
+            to test each point against its own polygon.
+
+    Returns:
+        np.ndarray: Boolean mask with shape points.shape[:-1].
+    """
+    px = points[..., 0, None]
+    py = points[..., 1, None]
+    x0, y0, x1, y1 = edges[..., 0], edges[..., 1], edges[..., 2], edges[..., 3]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Count the edges crossed by a ray going from the point towards +x
+        straddles = (y0 > py) != (y1 > py)
+        x_cross = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+        crossings = np.count_nonzero(straddles & (px < x_cross), axis=-1)
+
+        # Points on an edge are collinear with it and inside its bounding box
+        collinear = (x1 - x0) * (py - y0) - (y1 - y0) * (px - x0) == 0
+        on_edge = (
+            collinear
+            & (px >= np.minimum(x0, x1)) & (px <= np.maximum(x0, x1))
+            & (py >= np.minimum(y0, y1)) & (py <= np.maximum(y0, y1))
+        )
+
+    return (crossings % 2 == 1) & ~on_edge.any(axis=-1)
+
+
+class PolygonLocator:
+    """
+    Finds the first ROI, in config order, that contains each point by testing the
+    points against every polygon.
+    """
+    def __init__(self, shapes_config):
+        """
+        Args:
+            shapes_config (dict): ROI config mapping shape names to {"shape_points": [...]}.
+        """
+        self.edges = [polygon_edges(shape_data["shape_points"]) for shape_data in shapes_config.values()]
+
+    def locate(self, points):
+        """
+        Args:
+            points (np.ndarray): Points with shape (..., 2).
+
+        Returns:
+            np.ndarray: Index of the first ROI containing each point, or -1, with shape points.shape[:-1].
+        """
+        points = np.asarray(points, dtype=np.float64)
+        flat_points = points.reshape(-1, 2)
+        roi_idx = np.full(len(flat_points), -1, dtype=np.int32)
+
+        for chunk_start in range(0, len(flat_points), POINTS_PER_CHUNK):
+            chunk = slice(chunk_start, chunk_start + POINTS_PER_CHUNK)
+            chunk_points = flat_points[chunk]
+            chunk_idx = roi_idx[chunk]
+            for i, edges in enumerate(self.edges):
+                # Only points that are not in an earlier ROI need to be tested
+                pending = np.flatnonzero(chunk_idx < 0)
+                if len(pending) == 0:
+                    break
+                inside = points_in_polygon(chunk_points[pending], edges)
+                chunk_idx[pending[inside]] = i
+
+        return roi_idx.reshape(points.shape[:-1])
+
+
+class RoiIndex:
+    """
+    Finds the first ROI, in config order, that contains each point, testing each
+    point only against the ROIs whose bounding box overlaps its grid cell.
+
+    The ROI bounding boxes are bucketed in a uniform grid whose cells are about the
+    size of a typical ROI, so a cell holds a handful of candidates however many
+    ROIs the config has. The candidates of a cell are kept in config order and
+    tested in that order, so a point gets the same ROI as with `PolygonLocator`.
+
+    Attributes:
+        edges: Polygon edges of each ROI, with shape (ROIs, max vertices, 4), padded with NaN
+            (NaN edges never cross a ray and no point lies on them).
+        origin: Coordinates of the top left corner of the grid.
+        cell_size: Side of a grid cell.
+        grid_shape: Number of cells as (rows, columns).
+        candidates: ROI indices per cell, with shape (cells, max candidates), in config order
+            and padded with -1.
+        num_candidates: Number of candidate ROIs per cell.
+    """
+    def __init__(self, shapes_config):
+        """
+        Args:
+            shapes_config (dict): ROI config mapping shape names to {"shape_points": [...]}.
+        """
+        roi_edges = [polygon_edges(shape_data["shape_points"]) for shape_data in shapes_config.values()]
+        max_vertices = max((len(edges) for edges in roi_edges), default=0)
+        self.edges = np.full((len(roi_edges), max_vertices, 4), np.nan)
+        for i, edges in enumerate(roi_edges):
+            self.edges[i, :len(edges)] = edges
+
+        if not roi_edges:
+            self.origin = np.zeros(2)
+            self.cell_size = 1.0
+            self.grid_shape = (0, 0)
+            self.candidates = np.empty((0, 0), dtype=np.int32)
+            self.num_candidates = np.empty(0, dtype=np.int32)
+            return
+
+        bbox_min = np.array([edges[:, :2].min(axis=0) for edges in roi_edges])
+        bbox_max = np.array([edges[:, :2].max(axis=0) for edges in roi_edges])
+        self.origin = bbox_min.min(axis=0)
+        extent = bbox_max.max(axis=0) - self.origin
+
+        # Cells about the size of a typical ROI, coarsened if the grid would get too large
+        cell_size = max(float(np.median((bbox_max - bbox_min).max(axis=1))), 1.0)
+        num_cells = np.prod(np.floor(extent / cell_size) + 1)
+        if num_cells > GRID_MAX_CELLS:
+            cell_size *= np.sqrt(num_cells / GRID_MAX_CELLS)
+        self.cell_size = cell_size
+        num_rows, num_cols = (np.floor(extent[::-1] / cell_size) + 1).astype(int)
+        self.grid_shape = (int(num_rows), int(num_cols))
+
+        # Bucket each ROI in the cells overlapped by its bounding box, in config order
+        cell_rois = [[] for _ in range(num_rows * num_cols)]
+        first_cells = np.floor((bbox_min - self.origin) / cell_size).astype(int)
+        last_cells = np.minimum(np.floor((bbox_max - self.origin) / cell_size).astype(int), [num_cols - 1, num_rows - 1])
+        for i, ((col0, row0), (col1, row1)) in enumerate(zip(first_cells, last_cells)):
+            for row in range(row0, row1 + 1):
+                for col in range(col0, col1 + 1):
+                    cell_rois[row * num_cols + col].append(i)
+
+        self.num_candidates = np.array([len(rois) for rois in cell_rois], dtype=np.int32)
+        self.candidates = np.full((len(cell_rois), self.num_candidates.max()), -1, dtype=np.int32)
+        for cell, rois in enumerate(cell_rois):
+            self.candidates[cell, :len(rois)] = rois
+
+    def cell_of(self, points):
+        """Returns the grid cell of each point, or -1 for points outside the grid (or NaN)."""
+        num_rows, num_cols = self.grid_shape
+        with np.errstate(invalid="ignore"):
+            col_row = np.floor((points - self.origin) / self.cell_size)
+            valid = (
+                (col_row[..., 0] >= 0) & (col_row[..., 0] < num_cols)
+                & (col_row[..., 1] >= 0) & (col_row[..., 1] < num_rows)
+            )
+        cells = np.full(points.shape[:-1], -1, dtype=np.intp)
+        cells[valid] = col_row[..., 1][valid].astype(np.intp) * num_cols + col_row[..., 0][valid].astype(np.intp)
+        return cells
+
+    def locate(self, points):
+        """
+        Args:
+            points (np.ndarray): Points with shape (..., 2).
+
+        Returns:
+            np.ndarray: Index of the first ROI containing each point, or -1, with shape points.shape[:-1].
+        """
+        points = np.asarray(points, dtype=np.float64)
+        flat_points = points.reshape(-1, 2)
+        roi_idx = np.full(len(flat_points), -1, dtype=np.int32)
+        if len(self.edges) == 0:
+            return roi_idx.reshape(points.shape[:-1])
+
+        for chunk_start in range(0, len(flat_points), POINTS_PER_CHUNK):
+            chunk = slice(chunk_start, chunk_start + POINTS_PER_CHUNK)
+            chunk_points = flat_points[chunk]
+            chunk_idx = roi_idx[chunk]
+            cells = self.cell_of(chunk_points)
+            chunk_num_candidates = np.where(cells >= 0, self.num_candidates[cells], 0)
+
+            # Round k tests each pending point against the k-th candidate of its cell
+            for k in range(self.candidates.shape[1]):
+                pending = np.flatnonzero((chunk_idx < 0) & (chunk_num_candidates > k))
+                if len(pending) == 0:
+                    break
+                rois = self.candidates[cells[pending], k]
+                inside = points_in_polygon(chunk_points[pending], self.edges[rois])
+                chunk_idx[pending[inside]] = rois[inside]
+
+        return roi_idx.reshape(points.shape[:-1])
+
+
+class RoiMask:
+    """
+    ROI config compiled into an integer label image at video resolution.
+
+    `mask[y, x]` holds the index of the first ROI, in config order, containing the
+    pixel, or -1. Locating a keypoint is then a single gather instead of a polygon
+    test per ROI.
+
+    Sub-pixel handling: pixel (x, y) stands for the point with integer coordinates
+    (x, y), and its value is the exact polygon test at that point (boundary
+    excluded, like shapely). Keypoints are rounded to the nearest pixel before the
+    lookup, so the result is exact for integer coordinates, and fractional
+    keypoints can only disagree with the exact test when they are less than half
+    a pixel (along x or y) away from an ROI edge. Keypoints outside the frame are
+    in no ROI.
+
+    Attributes:
+        mask: Label image with shape (height, width).
+    """
+    def __init__(self, mask):
+        self.mask = mask
+
+    @classmethod
+    def compile(cls, shapes_config, frame_size):
+        """
+        Rasterizes an ROI config.
+
+        Args:
+            shapes_config (dict): ROI config mapping shape names to {"shape_points": [...]}.
+            frame_size (tuple): Video frame size as (width, height).
+
+        Returns:
+            RoiMask: The compiled mask.
+        """
+        width, height = frame_size
+        mask = np.full((height, width), -1, dtype=np.int16)
+        locator = PolygonLocator(shapes_config)
+
+        for i, edges in enumerate(locator.edges):
+            # Only the pixels inside the bounding box of the ROI can be inside it
+            x_min, y_min = np.maximum(np.ceil(edges[:, :2].min(axis=0)).astype(int), 0)
+            x_max, y_max = np.floor(edges[:, :2].max(axis=0)).astype(int)
+            x_max, y_max = min(x_max, width - 1), min(y_max, height - 1)
+            if x_min > x_max or y_min > y_max:
+                continue
+
+            ys, xs = np.mgrid[y_min:y_max + 1, x_min:x_max + 1]
+            region = mask[y_min:y_max + 1, x_min:x_max + 1]
+            # Pixels already owned by an earlier ROI keep their label
+            pending = region < 0
+            points = np.stack([xs[pending], ys[pending]], axis=-1)
+            inside = np.zeros_like(pending)
+            inside[pending] = points_in_polygon(points, edges)
+            region[inside] = i
+
+        return cls(mask)
+
+    @classmethod
+    def load_or_compile(cls, config_path, shapes_config, frame_size):
+        """
+        Loads the compiled mask cached next to the ROI config, compiling and caching it if needed.
+
+        Args:
+            config_path (str): Path to the ROI config JSON file.
+            shapes_config (dict): The loaded ROI config.
+            frame_size (tuple): Video frame size as (width, height).
+
+        Returns:
+            RoiMask: The compiled mask.
+        """
+        mask_path = roi_mask_path(config_path, shapes_config, frame_size)
+        if os.path.exists(mask_path):
+            return cls(np.load(mask_path))
+
+        roi_mask = cls.compile(shapes_config, frame_size)
+        # Workers compiling the same mask each write their own file, and readers only ever see a
+        # complete one
+        tmp_path = f"{mask_path[:-len('.npy')]}.{os.getpid()}.tmp.npy"
+        try:
+            np.save(tmp_path, roi_mask.mask)
+            os.replace(tmp_path, mask_path)
+        except OSError as e:
+            print(f"Failed to cache ROI mask to {mask_path}: {e}")
+        return roi_mask
+
+    def locate(self, points):
+        """
+        Args:
+            points (np.ndarray): Points with shape (..., 2).
+
+        Returns:
+            np.ndarray: Index of the first ROI containing each point, or -1, with shape points.shape[:-1].
+        """
+        points = np.asarray(points, dtype=np.float64)
+        height, width = self.mask.shape
+        with np.errstate(invalid="ignore"):
+            xy = np.rint(points)
+            valid = (
+                (xy[..., 0] >= 0) & (xy[..., 0] < width)
+                & (xy[..., 1] >= 0) & (xy[..., 1] < height)
+            )
+
+        roi_idx = np.full(points.shape[:-1], -1, dtype=np.int32)
+        roi_idx[valid] = self.mask[xy[..., 1][valid].astype(np.intp), xy[..., 0][valid].astype(np.intp)]
+        return roi_idx
+
+
+def roi_mask_path(config_path, shapes_config, frame_size):
+    """
+    Path of the cached ROI mask, next to the config file.
+
+    The file name holds a hash of the config (ROI order included, since it decides
+    which ROI owns overlapping pixels) and the frame size, so edited configs or
+    other video resolutions never reuse a stale mask.
+    """
+    width, height = frame_size
+    config_hash = hashlib.sha1(json.dumps(shapes_config).encode("utf-8")).hexdigest()[:12]
+    return f"{os.path.splitext(config_path)[0]}.roimask-{config_hash}-{width}x{height}.npy"
+
+
+class RoiClassifier:
+    """
+    Labels frames from predicted keypoints and the ROIs.
+
+    The rules are the ones used by the auto-labeling:
+        - Instances are checked in order, and for each instance the head is checked
+          before the tail. The first point that falls inside an ROI labels the frame.
+        - If a point is inside several ROIs, the first ROI in config order wins.
+        - Frames with instances but no point inside an ROI are labeled "Explore".
+        - Frames without instances are labeled "None".
+
+    Labels are returned as integer codes indexing `labels`.
+
+    Attributes:
+        roi_names: ROI names in config order.
+        labels: Category table, "Explore" and "None" followed by the ROI names.
+        locator: Object mapping points to the index of the first ROI containing them
+            (`RoiIndex` by default).
+    """
+    EXPLORE = 0
+    NONE = 1
+    FIRST_ROI = 2
+
+    def __init__(self, shapes_config, locator=None):
+        self.roi_names = list(shapes_config)
+        self.labels = [EXPLORE_LABEL, NONE_LABEL] + self.roi_names
+        self.locator = locator if locator is not None else RoiIndex(shapes_config)
+
+    def classify(self, peaks, num_instances=None):
+        """
+        Labels every frame of a peaks array.
+
+        Args:
+            peaks (np.ndarray): Keypoints with shape (frames, instances, nodes, 2), padded with NaN
+                for frames with fewer instances.
+            num_instances (np.ndarray): Number of predicted instances in each frame. Defaults to
+                the number of instances with at least one non-NaN coordinate, which treats
+                instances predicted with all points missing as padding.
+
+        Returns:
+            np.ndarray: Label code for each frame, with shape (frames,).
+        """
+        peaks = np.asarray(peaks, dtype=np.float64)
+        num_frames, max_instances = peaks.shape[:2]
+        if num_instances is None:
+            num_instances = np.count_nonzero(~np.isnan(peaks).all(axis=(2, 3)), axis=1)
+        num_instances = np.asarray(num_instances)
+
+        codes = np.full(num_frames, self.EXPLORE, dtype=np.int32)
+        if max_instances > 0:
+            # Candidate points in priority order: instance by instance, head before tail
+            nodes = peaks[:, :, list(ROI_NODES[:peaks.shape[2]])]
+            is_instance = np.arange(max_instances)[None, :] < num_instances[:, None]
+            nodes[~is_instance] = np.nan
+            roi_idx = self.locator.locate(nodes.reshape(num_frames, -1, 2))
+
+            hit = roi_idx >= 0
+            first_hit = roi_idx[np.arange(num_frames), hit.argmax(axis=1)]
+            labeled = hit.any(axis=1)
+            codes[labeled] = first_hit[labeled] + self.FIRST_ROI
+
+        codes[num_instances == 0] = self.NONE
+        return codes
+
+    def classify_instances(self, peaks, num_instances=None):
+        """
+        Labels every instance of a peaks array, with the head checked before the tail.
+
+        Args:
+            peaks (np.ndarray): Keypoints with shape (frames, instances, nodes, 2), padded with NaN.
+            num_instances (np.ndarray): Number of predicted instances in each frame (see `classify`).
+
+        Returns:
+            np.ndarray: Label code for each instance, with shape (frames, instances): the ROI of the
+            instance, "Explore" if it is in no ROI, or -1 for padding.
+        """
+        peaks = np.asarray(peaks, dtype=np.float64)
+        num_frames, max_instances = peaks.shape[:2]
+        if num_instances is None:
+            num_instances = np.count_nonzero(~np.isnan(peaks).all(axis=(2, 3)), axis=1)
+        is_instance = np.arange(max_instances)[None, :] < np.asarray(num_instances)[:, None]
+
+        codes = np.full((num_frames, max_instances), self.EXPLORE, dtype=np.int32)
+        if max_instances > 0:
+            roi_idx = self.locator.locate(peaks[:, :, list(ROI_NODES[:peaks.shape[2]])])
+            hit = roi_idx >= 0
+            first_hit = np.take_along_axis(roi_idx, hit.argmax(axis=2)[..., None], axis=2)[..., 0]
+            labeled = hit.any(axis=2)
+            codes[labeled] = first_hit[labeled] + self.FIRST_ROI
+        codes[~is_instance] = -1
+        return codes
+
+    def classify_frame(self, peaks_np):
+        """
+        Labels a single frame.
+
+        Args:
+            peaks_np (np.ndarray): Instance peaks of the frame, with shape (instances, nodes, 2).
+
+        Returns:
+            str: Label of the frame.
+        """
+        if len(peaks_np) == 0:
+            return NONE_LABEL
+        code = self.classify(np.asarray(peaks_np)[None], [len(peaks_np)])[0]
+        return self.labels[code]
+
+
+def stack_peaks(frame_peaks):
+    """
+    Stacks per-frame instance peaks into a single NaN-padded array.
+
+    Args:
+        frame_peaks (list): One array of shape (instances, nodes, 2) per frame.
+
+    Returns:
+        tuple: (peaks with shape (frames, max instances, nodes, 2), number of instances per frame).
+    """
+    num_instances = np.array([len(peaks_np) for peaks_np in frame_peaks], dtype=np.int32)
+    max_instances = int(num_instances.max()) if len(num_instances) else 0
+    num_nodes = max((np.shape(peaks_np)[1] for peaks_np in frame_peaks if len(peaks_np)), default=len(ROI_NODES))
+
+    peaks = np.full((len(frame_peaks), max_instances, num_nodes, 2), np.nan)
+    for i, peaks_np in enumerate(frame_peaks):
+        if len(peaks_np):
+            peaks[i, :len(peaks_np)] = peaks_np
+    return peaks, num_instances
@@ -0,0 +1,377 @@
+import argparse
+import collections
+import csv
+import threading
+import time
+
+import numpy as np
+
+from models import get_predictor, load_sleap
+from profiling import DISABLED_PROFILER, Profiler
+from roi import RoiClassifier, RoiMask, load_roi_config
+from utils import SimulatedCamera, VideoFrameSource, predict_peaks
+
+# Rate at which the simulated camera delivers frames, when the video does not say
+DEFAULT_FPS = 30.0
+
+# Largest time (ms) from the capture of a frame to its label; frames that cannot make it are dropped
+DEFAULT_LATENCY_BUDGET_MS = 50.0
+
+# Number of frames waiting between two stages; short queues keep the waiting time short
+DEFAULT_QUEUE_SIZE = 2
+
+# Queue drop policies: drop the frame waiting the longest, or the incoming frame
+DROP_OLDEST = "oldest"
+DROP_NEWEST = "newest"
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+# Weight of the latest inference call in the running estimate of the inference time
+INFERENCE_TIME_SMOOTHING = 0.2
+
+# Number of recent labels whose latency is kept for the statistics
+LATENCY_WINDOW = 10000
+
+
+class DropQueue:
+    """
+    Bounded FIFO queue between two pipeline stages that never blocks the producer.
+
+    When the queue is full, the "oldest" policy drops the item waiting the longest, so the
+    consumer always gets the freshest frames, and the "newest" policy drops the incoming
+    item, so the frames already waiting go through without gaps.
+
+    Attributes:
+        maxsize: Largest number of waiting items.
+        policy: `DROP_OLDEST` or `DROP_NEWEST`.
+        num_dropped: Number of items dropped so far.
+    """
+    def __init__(self, maxsize, policy=DROP_OLDEST):
+        if maxsize < 1:
+            raise ValueError(f"Queue size must be at least 1, got {maxsize}")
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy {policy!r}, expected one of {', '.join(DROP_POLICIES)}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.num_dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """
+        Adds an item, dropping one if the queue is full. Items put after `close` are ignored.
+
+        Returns:
+            The dropped item, or None.
+        """
+        with self._cond:
+            if self._closed:
+                return None
+            dropped = None
+            if len(self._items) >= self.maxsize:
+                self.num_dropped += 1
+                if self.policy == DROP_NEWEST:
+                    return item
+                dropped = self._items.popleft()
+            self._items.append(item)
+            self._cond.notify()
+            return dropped
+
+    def get(self, max_items=1):
+        """
+        Waits for items and takes up to `max_items` of them, oldest first.
+
+        Returns:
+            list: The items; empty once the queue is closed and drained.
+        """
+        with self._cond:
+            while not self._items and not self._closed:
+                self._cond.wait()
+            return [self._items.popleft() for _ in range(min(max_items, len(self._items)))]
+
+    def close(self):
+        """Wakes up the consumer; it gets the remaining items, then empty lists."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class StreamingLabeler:
+    """
+    Labels the frames of a live camera as they come, within a latency budget.
+
+    The pipeline runs in three threads connected by `DropQueue`s: a source thread grabs
+    frames from the camera at `fps`, an inference thread runs the predictor, and the thread
+    iterating `run` classifies the peaks by ROI. A stage that falls behind makes its input
+    queue drop frames instead of building up a backlog, so latency stays bounded.
+
+    Frames are dropped at three places:
+        source: the source thread fell behind the camera rate (e.g. slow decoding), so
+            the camera delivered frames nobody grabbed.
+        queue: a queue was full and `drop_policy` dropped a frame.
+        stale: the frame waited so long that, with the recent inference time, its label
+            would miss the budget; it is dropped before wasting an inference call on it.
+    Labels that still end up over the budget are yielded and counted as late.
+
+    Attributes:
+        camera: `SimulatedCamera`, or any object with `grab_frame` and `frame_counter`.
+        predictor: Loaded SLEAP predictor.
+        roi_classifier: `RoiClassifier` built from the ROI config.
+        fps: Rate at which the camera delivers frames.
+        latency_budget: Largest time (s) from the capture of a frame to its label.
+        queue_size: Size of the queues between stages.
+        drop_policy: `DROP_OLDEST` or `DROP_NEWEST`.
+        batch_size: Largest number of waiting frames sent to the network at once.
+        inference_lock: Lock held while the predictor runs, so other threads can share it.
+        profiler: `Profiler` timing the "capture", "inference" and "roi" stages and the
+            end-to-end "latency" (disabled by default).
+    """
+    def __init__(self, camera, predictor, roi_classifier, fps=DEFAULT_FPS, latency_budget=DEFAULT_LATENCY_BUDGET_MS / 1000,
+                 queue_size=DEFAULT_QUEUE_SIZE, drop_policy=DROP_OLDEST, batch_size=1, inference_lock=None, profiler=None):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy {drop_policy!r}, expected one of {', '.join(DROP_POLICIES)}")
+        self.camera = camera
+        self.predictor = predictor
+        self.roi_classifier = roi_classifier
+        self.fps = fps
+        self.latency_budget = latency_budget
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self.batch_size = batch_size
+        self.inference_lock = inference_lock if inference_lock is not None else threading.Lock()
+        self.profiler = profiler if profiler is not None else DISABLED_PROFILER
+        self._reset()
+
+    def _reset(self):
+        self._frame_queue = DropQueue(self.queue_size, self.drop_policy)
+        self._peaks_queue = DropQueue(self.queue_size, self.drop_policy)
+        self._stop = threading.Event()
+        self._error = None
+        self._inference_time = 0.0
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.num_captured = 0
+        self.num_source_dropped = 0
+        self.num_stale = 0
+        self.num_labeled = 0
+        self.num_late = 0
+
+    def run(self, num_frames=None):
+        """
+        Streams and labels frames until the camera delivered `num_frames` frames or the iteration stops.
+
+        Args:
+            num_frames (int): Number of frames the camera delivers, grabbed or not. Unlimited if None.
+
+        Yields:
+            tuple: (camera frame index, label code, latency in seconds), in frame order.
+        """
+        self._reset()
+        threads = [threading.Thread(target=self._capture_loop, args=(num_frames,), name="stream-source", daemon=True),
+                   threading.Thread(target=self._inference_loop, name="stream-inference", daemon=True)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                items = self._peaks_queue.get()
+                if not items:
+                    break
+                frame_idx, capture_time, peaks_np = items[0]
+                with self.profiler.stage("roi", frames=1):
+                    code = int(self.roi_classifier.classify(np.asarray(peaks_np)[None], [len(peaks_np)])[0])
+                now = time.perf_counter()
+                self.profiler.record("latency", capture_time, now, frames=1)
+                latency = now - capture_time
+                self._latencies.append(latency)
+                self.num_labeled += 1
+                if latency > self.latency_budget:
+                    self.num_late += 1
+                yield frame_idx, code, latency
+        finally:
+            self._stop.set()
+            self._frame_queue.close()
+            self._peaks_queue.close()
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _capture_loop(self, num_frames):
+        """Grabs frames at the camera rate; ticks missed while busy are frames the camera dropped."""
+        period = 1.0 / self.fps
+        start_time = time.perf_counter()
+        tick = 0
+        try:
+            while not self._stop.is_set() and (num_frames is None or tick < num_frames):
+                delay = start_time + tick * period - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                with self.profiler.stage("capture", frames=1):
+                    frame_idx = self.camera.frame_counter
+                    frame = self.camera.grab_frame()
+                    capture_time = time.perf_counter()
+                self.num_captured += 1
+                self._frame_queue.put((frame_idx, capture_time, frame))
+                tick += 1
+
+                # A camera does not wait: frames due while this one was grabbed are lost
+                missed = int((time.perf_counter() - start_time) * self.fps) - tick
+                if num_frames is not None:
+                    missed = min(missed, num_frames - tick)
+                if missed > 0:
+                    self.camera.frame_counter += missed
+                    self.num_source_dropped += missed
+                    tick += missed
+        except Exception as e:
+            self._error = e
+        finally:
+            self._frame_queue.close()
+
+    def _inference_loop(self):
+        """Runs the predictor on the waiting frames that can still make the budget."""
+        try:
+            while True:
+                items = self._frame_queue.get(self.batch_size)
+                # The source finished (empty) or the consumer went away (stop)
+                if not items or self._stop.is_set():
+                    break
+                now = time.perf_counter()
+                fresh = [item for item in items if now - item[1] + self._inference_time <= self.latency_budget]
+                self.num_stale += len(items) - len(fresh)
+                if not fresh:
+                    continue
+
+                start_time = time.perf_counter()
+                with self.inference_lock, self.profiler.stage("inference", frames=len(fresh)):
+                    frame_peaks = predict_peaks(self.predictor, np.stack([frame for _, _, frame in fresh]))
+                self._inference_time += INFERENCE_TIME_SMOOTHING * (time.perf_counter() - start_time - self._inference_time)
+                for (frame_idx, capture_time, _), peaks_np in zip(fresh, frame_peaks):
+                    self._peaks_queue.put((frame_idx, capture_time, peaks_np))
+        except Exception as e:
+            self._error = e
+        finally:
+            self._stop.set()
+            self._peaks_queue.close()
+
+    @property
+    def num_dropped(self):
+        """Number of frames dropped so far, for any reason."""
+        return self.num_source_dropped + self._frame_queue.num_dropped + self._peaks_queue.num_dropped + self.num_stale
+
+    def stats(self):
+        """
+        Counts and latency statistics of the current or last run.
+
+        Returns:
+            dict: Frames delivered by the camera, captured, labeled and late, dropped frames per
+            place, and the p50, p95 and max latency (ms) of the recent labels.
+        """
+        latencies = 1000 * np.array(self._latencies)
+        return {
+            "delivered": self.num_captured + self.num_source_dropped,
+            "captured": self.num_captured,
+            "labeled": self.num_labeled,
+            "late": self.num_late,
+            "dropped": self.num_dropped,
+            "dropped_source": self.num_source_dropped,
+            "dropped_queue": self._frame_queue.num_dropped + self._peaks_queue.num_dropped,
+            "dropped_stale": self.num_stale,
+            "p50_ms": np.percentile(latencies, 50) if len(latencies) else np.nan,
+            "p95_ms": np.percentile(latencies, 95) if len(latencies) else np.nan,
+            "max_ms": latencies.max() if len(latencies) else np.nan,
+        }
+
+    def status_line(self):
+        """One-line summary of the stream, e.g. for printing once a second."""
+        stats = self.stats()
+        return (f"labeled {stats['labeled']}/{stats['delivered']} | dropped {stats['dropped']} "
+                f"(source {stats['dropped_source']}, queue {stats['dropped_queue']}, stale {stats['dropped_stale']}) | "
+                f"late {stats['late']} | latency p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms")
+
+
+def print_summary(labeler, elapsed):
+    """Prints the counts and latencies of a streaming run."""
+    stats = labeler.stats()
+    delivered = stats["delivered"]
+    print("\n--- Streaming summary ---")
+    print(f"Frames: {delivered} delivered at {labeler.fps:g} fps in {elapsed:.1f}s")
+    print(f"Labeled: {stats['labeled']} ({100 * stats['labeled'] / delivered if delivered else 0.0:.1f}%), "
+          f"{stats['late']} over the {1000 * labeler.latency_budget:g} ms budget")
+    print(f"Dropped: {stats['dropped']} (source {stats['dropped_source']}, queue {stats['dropped_queue']}, "
+          f"stale {stats['dropped_stale']}; policy: drop {labeler.drop_policy})")
+    print(f"Latency: p50 {stats['p50_ms']:.1f} ms | p95 {stats['p95_ms']:.1f} ms | max {stats['max_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    # Set up argument parsing
+    parser = argparse.ArgumentParser(description="Label a video live, replayed as a camera, within a latency budget.")
+    parser.add_argument("--video", required=True, help="Video replayed by the simulated camera.")
+    parser.add_argument("--roi_config", required=True, help="Path to the ROI JSON config file.")
+    parser.add_argument("--centroid_model_path", required=True, help="Path to the centroid SLEAP model.")
+    parser.add_argument("--centered_instance_model_path", required=True, help="Path to the centered instance model.")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS, help="Camera frame rate.")
+    parser.add_argument("--frames", type=int, default=None,
+                        help="Number of camera frames to stream (the video loops). Defaults to one pass; 0 streams until Ctrl+C.")
+    parser.add_argument("--latency_budget_ms", type=float, default=DEFAULT_LATENCY_BUDGET_MS,
+                        help="Largest time from capture to label; frames that cannot make it are dropped.")
+    parser.add_argument("--queue_size", type=int, default=DEFAULT_QUEUE_SIZE, help="Number of frames waiting between stages.")
+    parser.add_argument("--drop", choices=DROP_POLICIES, default=DROP_OLDEST,
+                        help="Frame dropped when a queue is full: the oldest one (freshest labels) or the newest one (no gaps).")
+    parser.add_argument("--batch_size", type=int, default=1, help="Largest number of waiting frames inferred at once.")
+    parser.add_argument("--roi_mask", action="store_true", help="Look keypoints up in a precomputed ROI mask.")
+    parser.add_argument("--output", default=None, help="CSV file for the live labels (Frame, Label, Latency).")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage timings at the end.")
+    parser.add_argument("--trace", default=None, help="Write a Chrome trace of the stages to this JSON file.")
+    args = parser.parse_args()
+
+    frames = VideoFrameSource(load_sleap().load_video(args.video))
+    shapes_config = load_roi_config(args.roi_config)
+    locator = None
+    if args.roi_mask:
+        _, height, width = frames.shape[:3]
+        locator = RoiMask.load_or_compile(args.roi_config, shapes_config, (width, height))
+    roi_classifier = RoiClassifier(shapes_config, locator=locator)
+    # Warmed up on the video shape, so the first frames do not pay for tracing the graphs
+    predictor, inference_lock = get_predictor([args.centroid_model_path, args.centered_instance_model_path], batch_size=args.batch_size,
+                                              frame_shape=frames.shape[1:])
+
+    profiler = Profiler(trace=args.trace is not None) if args.profile or args.trace else None
+    labeler = StreamingLabeler(SimulatedCamera(frames), predictor, roi_classifier, fps=args.fps,
+                               latency_budget=args.latency_budget_ms / 1000, queue_size=args.queue_size,
+                               drop_policy=args.drop, batch_size=args.batch_size, inference_lock=inference_lock,
+                               profiler=profiler)
+    num_frames = len(frames) if args.frames is None else args.frames or None
+
+    output_file = open(args.output, mode='w', newline='') if args.output else None
+    writer = csv.writer(output_file) if output_file else None
+    if writer:
+        writer.writerow(['Frame', 'Label', 'Latency (ms)'])
+
+    start_time = time.perf_counter()
+    last_status = start_time
+    last_code = None
+    try:
+        for frame_idx, code, latency in labeler.run(num_frames):
+            if writer:
+                writer.writerow([frame_idx, roi_classifier.labels[code], f"{1000 * latency:.2f}"])
+            if code != last_code:
+                print(f"[{frame_idx}] {roi_classifier.labels[code]} ({1000 * latency:.1f} ms)")
+                last_code = code
+            if time.perf_counter() - last_status >= 1.0:
+                print(labeler.status_line())
+                last_status = time.perf_counter()
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        if output_file:
+            output_file.close()
+        frames.close()
+
+    print_summary(labeler, time.perf_counter() - start_time)
+    if profiler is not None:
+        profiler.print_summary()
+        if args.trace:
+            num_events = profiler.save_trace(args.trace)
+            print(f"Wrote {num_events} events to {args.trace}")
@@ -0,0 +1,216 @@
+import csv
+import numpy as np
+
+from labeling import LABEL_CHUNK_SIZE
+from roi import ROI_NODES
+
+# Largest distance (pixels) between an instance and the last position of a track it continues
+DEFAULT_MAX_DISTANCE = 100.0
+
+# Number of frames a track can go unseen before it is closed
+DEFAULT_MAX_GAP = 30
+
+
+def instance_positions(peaks):
+    """
+    Position of each instance: the mean of its ROI nodes (head and tail) that were detected.
+
+    Args:
+        peaks (np.ndarray): Keypoints with shape (frames, instances, nodes, 2), padded with NaN.
+
+    Returns:
+        np.ndarray: Positions with shape (frames, instances, 2), NaN for instances without nodes.
+    """
+    nodes = np.asarray(peaks, dtype=np.float64)[:, :, list(ROI_NODES[:np.shape(peaks)[2]])]
+    detected = ~np.isnan(nodes).any(axis=-1, keepdims=True)
+    count = detected.sum(axis=2)
+    with np.errstate(invalid="ignore"):
+        return np.where(detected, nodes, 0).sum(axis=2) / count
+
+
+def greedy_assignment(distances, max_distance):
+    """
+    Matches rows to columns of a distance matrix, closest pairs first.
+
+    Args:
+        distances (np.ndarray): Distance matrix with shape (rows, columns).
+        max_distance (float): Pairs further apart are never matched.
+
+    Returns:
+        np.ndarray: Column matched to each row, or -1.
+    """
+    num_rows, num_cols = distances.shape
+    matches = np.full(num_rows, -1, dtype=np.int64)
+    if num_rows == 0 or num_cols == 0:
+        return matches
+
+    order = np.argsort(distances, axis=None, kind="stable")
+    order = order[distances.ravel()[order] <= max_distance]
+    row_used = np.zeros(num_rows, dtype=bool)
+    col_used = np.zeros(num_cols, dtype=bool)
+    for row, col in zip(*np.unravel_index(order, distances.shape)):
+        if not row_used[row] and not col_used[col]:
+            matches[row] = col
+            row_used[row] = col_used[col] = True
+    return matches
+
+
+class Tracker:
+    """
+    Links the instances of consecutive frames into tracks.
+
+    Each frame, the distance matrix between its instances and the last positions of
+    the open tracks is matched greedily, closest pairs first. Instances left
+    unmatched start new tracks, and tracks unseen for more than `max_gap` frames are
+    closed. Frames are fed in order, in chunks of any size, so the cost is linear in
+    the number of frames.
+
+    Attributes:
+        max_distance: Largest distance between an instance and the track it continues.
+        max_gap: Number of frames a track can go unseen before it is closed.
+        positions: Last position of each track.
+        last_seen: Last frame of each track.
+        num_frames: Number of frames fed so far.
+    """
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, max_gap=DEFAULT_MAX_GAP):
+        self.max_distance = max_distance
+        self.max_gap = max_gap
+        self.positions = np.empty((0, 2))
+        self.last_seen = np.empty(0, dtype=np.int64)
+        self.num_frames = 0
+
+    @property
+    def num_tracks(self):
+        return len(self.last_seen)
+
+    def update(self, peaks, num_instances=None):
+        """
+        Assigns the instances of the next frames to tracks.
+
+        Args:
+            peaks (np.ndarray): Keypoints with shape (frames, instances, nodes, 2), padded with NaN.
+            num_instances (np.ndarray): Number of predicted instances in each frame. Defaults to the
+                instances with at least one non-NaN coordinate.
+
+        Returns:
+            np.ndarray: Track of each instance, with shape (frames, instances), -1 for padding and
+            for instances without head or tail.
+        """
+        positions = instance_positions(peaks)
+        num_frames, max_instances = positions.shape[:2]
+        if num_instances is None:
+            num_instances = np.count_nonzero(~np.isnan(np.asarray(peaks)).all(axis=(2, 3)), axis=1)
+        is_instance = np.arange(max_instances)[None, :] < np.asarray(num_instances)[:, None]
+        valid = is_instance & ~np.isnan(positions).any(axis=-1)
+
+        track_ids = np.full((num_frames, max_instances), -1, dtype=np.int32)
+        frames, instances = np.nonzero(valid)
+        frame_starts = np.flatnonzero(np.diff(frames, prepend=-1))
+        for frame_offset, frame_instances in zip(frames[frame_starts], np.split(instances, frame_starts[1:])):
+            frame_idx = self.num_frames + frame_offset
+            frame_positions = positions[frame_offset, frame_instances]
+            frame_tracks = self._match(frame_positions, frame_idx)
+
+            # Unmatched instances start new tracks
+            new_tracks = frame_tracks < 0
+            if new_tracks.any():
+                num_new_tracks = np.count_nonzero(new_tracks)
+                frame_tracks[new_tracks] = self.num_tracks + np.arange(num_new_tracks)
+                self.positions = np.concatenate([self.positions, np.empty((num_new_tracks, 2))])
+                self.last_seen = np.concatenate([self.last_seen, np.empty(num_new_tracks, dtype=np.int64)])
+
+            self.positions[frame_tracks] = frame_positions
+            self.last_seen[frame_tracks] = frame_idx
+            track_ids[frame_offset, frame_instances] = frame_tracks
+
+        self.num_frames += num_frames
+        return track_ids
+
+    def _match(self, frame_positions, frame_idx):
+        """Matches the instances of a frame to the open tracks; returns the track of each instance, or -1."""
+        open_tracks = (self.last_seen >= frame_idx - self.max_gap).nonzero()[0]
+        if len(open_tracks) == 0:
+            return np.full(len(frame_positions), -1, dtype=np.int64)
+
+        offsets = frame_positions[:, None] - self.positions[open_tracks][None]
+        distances = np.hypot(offsets[..., 0], offsets[..., 1])
+
+        # Usual case: every instance has a different closest track, within reach. The greedy
+        # matching then pairs each instance with its closest track, no sorting needed.
+        closest = distances.argmin(axis=1)
+        if len(set(closest.tolist())) == len(closest) and distances[np.arange(len(closest)), closest].max() <= self.max_distance:
+            return open_tracks[closest]
+
+        matches = greedy_assignment(distances, self.max_distance)
+        return np.where(matches >= 0, open_tracks[matches], -1)
+
+
+def track_rows(track_ids, instance_codes, frame_start=0):
+    """
+    Per-track labels of a chunk of frames in long format: one row per track seen in a frame.
+
+    Args:
+        track_ids (np.ndarray): Track of each instance, with shape (frames, instances), -1 if none.
+        instance_codes (np.ndarray): Label code of each instance, with the same shape.
+        frame_start (int): Index of the first frame of the chunk.
+
+    Returns:
+        tuple: (frame indices, track ids, label codes), sorted by frame and then by track.
+    """
+    frames, instances = np.nonzero(track_ids >= 0)
+    tracks = track_ids[frames, instances]
+    order = np.lexsort((tracks, frames))
+    return (frames[order] + frame_start).astype(np.int64), tracks[order], instance_codes[frames, instances][order].astype(np.int16)
+
+
+def track_store(prediction_store, roi_classifier, tracker=None):
+    """
+    Tracks the instances of a whole prediction store and labels each track in each frame.
+
+    The labels are kept in long format, one row per track seen in a frame, so memory grows
+    with the number of detections rather than with frames times tracks (tracks keep
+    opening over long videos, as every gap longer than `max_gap` starts a new one).
+
+    Args:
+        prediction_store (PredictionStore): Predicted peaks of the video.
+        roi_classifier (RoiClassifier): Classifier giving the label codes.
+        tracker (Tracker): Tracker to use, a new one with the default parameters if None.
+
+    Returns:
+        tuple: (frame indices, track ids, label codes) of every track seen in every frame,
+        sorted by frame and then by track (see `track_rows`).
+    """
+    tracker = tracker if tracker is not None else Tracker()
+    rows = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int16))]
+    for chunk_start in range(0, len(prediction_store), LABEL_CHUNK_SIZE):
+        peaks, num_instances = prediction_store.stack(chunk_start, chunk_start + LABEL_CHUNK_SIZE)
+        num_instances = np.maximum(num_instances, 0)
+        track_ids = tracker.update(peaks, num_instances)
+        instance_codes = roi_classifier.classify_instances(peaks, num_instances)
+        rows.append(track_rows(track_ids, instance_codes, chunk_start))
+    return tuple(np.concatenate(column) for column in zip(*rows))
+
+
+def save_track_labels(file_path, track_labels, labels):
+    """
+    Writes per-track labels as a table with one `Frame,Track,Label` row per track seen in a frame.
+
+    Args:
+        file_path (str): Path to the CSV file.
+        track_labels (tuple): (frame indices, track ids, label codes), as returned by `track_store`.
+        labels (list): Label of each code.
+    """
+    frames, tracks, codes = track_labels
+    label_table = np.array(list(labels), dtype=object)
+    with open(file_path, mode='w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['Frame', 'Track', 'Label'])
+        for chunk_start in range(0, len(frames), LABEL_CHUNK_SIZE):
+            chunk = slice(chunk_start, chunk_start + LABEL_CHUNK_SIZE)
+            writer.writerows(zip(frames[chunk].tolist(), tracks[chunk].tolist(), label_table[codes[chunk]]))
+
+
+def num_tracks(track_labels):
+    """Number of tracks in per-track labels returned by `track_store`."""
+    tracks = track_labels[1]
+    return int(tracks.max()) + 1 if len(tracks) else 0
@@ -1,7 +1,16 @@
 import json
+import queue
+import threading
+from collections import OrderedDict
+
 import cv2
 import numpy as np
 
+from profiling import DISABLED_PROFILER
+
+# Default memory budget for decoded frames kept around by VideoFrameSource.
+DEFAULT_CACHE_BYTES = 512 * 1024 ** 2
+
 class ShapesVisualizer:
     def __init__(self, shapes_json):
         """Initializes the visualizer with a shapes JSON file."""
@@ -57,11 +66,229 @@ class ShapesVisualizer:
         
         return image_with_shapes
 
+def draw_predictions(frame, peaks_np, shapes_config):
+    """
+    Draws the predicted skeletons and the ROI shapes on a copy of a frame.
+
+    :param frame: Input frame in NumPy array format. It is not modified.
+    :param peaks_np: Instance peaks of the frame, with shape (instances, nodes, 2).
+    :param shapes_config: ROI config mapping shape names to {"shape_points": [...]}.
+    :return: Annotated copy of the frame.
+    """
+    frame = frame.copy()
+
+    # Process and display the peaks
+    for peak in peaks_np:
+        if len(peak) >= 1:
+            x_head, y_head = peak[0][0], peak[0][1]
+
+            # Only draw circle if the head coordinates are not NaN
+            if not (np.isnan(x_head) or np.isnan(y_head)):
+                x_head, y_head = int(x_head), int(y_head)
+                cv2.circle(frame, (x_head, y_head), 5, (0, 255, 0), -1)  # Green circle for the head point
+
+            # Check if there is a second peak (tail)
+            if len(peak) >= 2:
+                x_tail, y_tail = peak[1][0], peak[1][1]
+
+                # Only draw circle if the head coordinates are not NaN
+                if not (np.isnan(x_tail) or np.isnan(y_tail)):
+                    x_tail, y_tail = int(x_tail), int(y_tail)
+                    cv2.circle(frame, (x_tail, y_tail), 5, (0, 255, 0), -1)  # Green circle for the tail point
+
+                # Only draw circle and line if both head and tail coordinates are not NaN
+                if not (np.isnan(x_tail) or np.isnan(y_tail)) and not (np.isnan(x_head) or np.isnan(y_head)):
+                    # Draw a red line connecting the two points (head and tail)
+                    cv2.line(frame, (x_head, y_head), (x_tail, y_tail), (0, 0, 255), 2)  # Red line
+
+    # Display the ROI shapes from shapes_config
+    for shape_name, shape_data in shapes_config.items():
+        shape_points = shape_data["shape_points"]
+
+        # Convert shape points to integers and draw the polygon or line
+        points = np.array(shape_points, dtype=np.int32)
+        cv2.polylines(frame, [points], isClosed=True, color=(255, 0, 0), thickness=2)  # Blue lines for ROI
+
+    return frame
+
+
+class VideoFrameSource:
+    """Lazy, memory-bounded view over the frames of a video.
+
+    Behaves like the pre-loaded frames array for the operations the app uses
+    (``frames[i]``, ``len(frames)``, ``frames.shape``) but only decodes frames
+    when they are requested. Decoded frames are kept in an LRU cache capped by
+    a byte budget, and a background thread prefetches the frames around the
+    most recently requested index.
+
+    Returned frames are the cached arrays themselves; copy them before drawing
+    on them.
+
+    Attributes:
+        video: Video object exposing ``get_frame(idx)`` and ``len()``, e.g. a
+            ``sleap.Video``.
+        cache_bytes: Maximum number of bytes of decoded frames kept in memory.
+        prefetch_ahead: Number of frames to prefetch after the current index.
+        prefetch_behind: Number of frames to prefetch before the current index.
+    """
+
+    def __init__(self, video, cache_bytes=DEFAULT_CACHE_BYTES, prefetch_ahead=32, prefetch_behind=8):
+        self.video = video
+        self.cache_bytes = cache_bytes
+        self.prefetch_ahead = prefetch_ahead
+        self.prefetch_behind = prefetch_behind
+
+        self._num_frames = len(video)
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._frame_shape = None
+        self._frame_nbytes = None
+        # Guards the cache; decoding has its own lock since readers are not thread-safe
+        self._cache_lock = threading.Lock()
+        self._decode_lock = threading.Lock()
+
+        # Prefetch state, shared with the background thread
+        self._prefetch_center = None
+        self._prefetch_cond = threading.Condition()
+        self._closed = False
+        self._prefetch_thread = None
+        if prefetch_ahead > 0 or prefetch_behind > 0:
+            self._prefetch_thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+            self._prefetch_thread.start()
+
+    def __len__(self):
+        return self._num_frames
+
+    @property
+    def shape(self):
+        """Shape of the equivalent pre-loaded array, (frames, height, width, channels)."""
+        if self._frame_shape is None:
+            self._frame_shape = self[0].shape
+        return (self._num_frames,) + tuple(self._frame_shape)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return np.stack([self[i] for i in range(*idx.indices(self._num_frames))])
+
+        idx = int(idx)
+        if idx < 0:
+            idx += self._num_frames
+        if not 0 <= idx < self._num_frames:
+            raise IndexError(f"Frame index {idx} out of range for video with {self._num_frames} frames")
+
+        frame = self._get(idx)
+        self._request_prefetch(idx)
+        return frame
+
+    def close(self):
+        """Stops the prefetch thread, drops all cached frames and closes the video reader."""
+        with self._prefetch_cond:
+            self._closed = True
+            self._prefetch_cond.notify()
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join()
+        with self._cache_lock:
+            self._cache.clear()
+            self._cached_bytes = 0
+        # Not while another thread is decoding from it
+        with self._decode_lock:
+            close_video_reader(self.video)
+
+    def _get(self, idx):
+        """Returns frame `idx` from the cache, decoding it on a miss."""
+        with self._cache_lock:
+            frame = self._cache.get(idx)
+            if frame is not None:
+                self._cache.move_to_end(idx)
+                return frame
+
+        with self._decode_lock:
+            frame = np.asarray(self.video.get_frame(idx))
+        self._put(idx, frame)
+        return frame
+
+    def _put(self, idx, frame):
+        """Adds a decoded frame to the cache, evicting least recently used frames."""
+        if self._frame_shape is None:
+            self._frame_shape = frame.shape
+            self._frame_nbytes = frame.nbytes
+        with self._cache_lock:
+            if idx in self._cache:
+                return
+            self._cache[idx] = frame
+            self._cached_bytes += frame.nbytes
+            # Always keep the newest frame, even if it alone exceeds the budget
+            while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= evicted.nbytes
+
+    def _request_prefetch(self, idx):
+        if self._prefetch_thread is None:
+            return
+        with self._prefetch_cond:
+            self._prefetch_center = idx
+            self._prefetch_cond.notify()
+
+    def _prefetch_window(self, center):
+        """Frame indices to prefetch around `center`, nearest first."""
+        ahead, behind = self.prefetch_ahead, self.prefetch_behind
+        if self._frame_nbytes:
+            # Never prefetch more than half the budget so we don't evict what the user is looking at
+            max_frames = self.cache_bytes // (2 * self._frame_nbytes)
+            if ahead + behind > max_frames:
+                behind = behind * max_frames // (ahead + behind)
+                ahead = max_frames - behind
+        window = list(range(center + 1, min(center + 1 + ahead, self._num_frames)))
+        window += list(range(center - 1, max(center - 1 - behind, -1), -1))
+        return window
+
+    def _prefetch_loop(self):
+        while True:
+            with self._prefetch_cond:
+                while self._prefetch_center is None and not self._closed:
+                    self._prefetch_cond.wait()
+                if self._closed:
+                    return
+                center = self._prefetch_center
+                self._prefetch_center = None
+
+            for idx in self._prefetch_window(center):
+                # Restart around the new position as soon as the user moves
+                if self._prefetch_center is not None or self._closed:
+                    break
+                with self._cache_lock:
+                    if idx in self._cache:
+                        continue
+                with self._decode_lock:
+                    frame = np.asarray(self.video.get_frame(idx))
+                self._put(idx, frame)
+
+
+def close_video_reader(video):
+    """
+    Closes the file behind a video reader.
+
+    Readers with a `close` method (`IndexedVideoReader`, sleap videos of HDF5 files) are
+    closed with it. A sleap video of a media file has none, so its OpenCV capture is released;
+    sleap reopens it if the video is read again.
+    """
+    close = getattr(video, "close", None)
+    if close is not None:
+        close()
+        return
+    backend = getattr(video, "backend", None)
+    capture = getattr(backend, "_reader_", None)
+    if capture is not None:
+        capture.release()
+        backend._reader_ = None
+
+
 class SimulatedCamera:
-    """Simulated camera class that serves frames from memory continuously.
+    """Simulated camera class that serves frames continuously.
 
     Attributes:
-        frames: Numpy array with pre-loaded frames.
+        frames: Numpy array with pre-loaded frames, or a lazy frame source such
+            as `VideoFrameSource`.
         frame_counter: Count of frames that have been grabbed.
     """
 
@@ -75,4 +302,85 @@ class SimulatedCamera:
     def grab_frame(self):
         idx = self.frame_counter % len(self.frames)
         self.frame_counter += 1
-        return self.frames[idx]
\ No newline at end of file
+        return self.frames[idx]
+
+def iter_frame_batches(frames, batch_size, indices=None, max_queued_batches=2, profiler=None):
+    """Yields batches of frames, decoded ahead in a producer thread.
+
+    Decoding runs in a background thread that feeds a bounded queue, so the
+    next batch is decoded while the caller runs inference on the current one.
+
+    Args:
+        frames: Indexable frame container (array or `VideoFrameSource`).
+        batch_size (int): Number of frames per batch.
+        indices (np.ndarray): Indices of the frames to decode, in order. Defaults to all frames.
+        max_queued_batches (int): Maximum number of decoded batches waiting in the queue.
+        profiler (Profiler): If set, decoding is timed as the "decode" stage.
+
+    Yields:
+        tuple: (frame indices of the batch, array of shape (batch, height, width, channels)).
+    """
+    indices = np.arange(len(frames)) if indices is None else np.asarray(indices)
+    profiler = profiler if profiler is not None else DISABLED_PROFILER
+    batches = queue.Queue(maxsize=max_queued_batches)
+    finished = object()
+    cancelled = threading.Event()
+
+    def put(item):
+        # Block on the bounded queue, but give up if the consumer went away
+        while not cancelled.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for batch_start in range(0, len(indices), batch_size):
+                batch_indices = indices[batch_start:batch_start + batch_size]
+                with profiler.stage("decode", frames=len(batch_indices)):
+                    batch = np.stack([frames[i] for i in batch_indices])
+                if not put((batch_indices, batch)):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(finished)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        producer.join()
+
+
+def predict_peaks(predictor, frames):
+    """Runs the SLEAP inference model on a batch of frames.
+
+    Args:
+        predictor: Loaded SLEAP predictor.
+        frames (np.ndarray): Batch of frames with shape (batch, height, width, channels).
+
+    The network pads every frame of a batch to the largest instance count of the batch with
+    all-NaN instances. They are dropped, so a frame gets the same peaks whatever the batch size.
+
+    Returns:
+        list: One array of instance peaks per frame, with shape (instances, nodes, 2).
+    """
+    frame_predictions = predictor.inference_model.predict_on_batch(frames)
+    instance_peaks = frame_predictions["instance_peaks"]
+    frame_peaks = []
+    for i in range(len(frames)):
+        peaks_np = np.array(instance_peaks[i])
+        frame_peaks.append(peaks_np[~np.isnan(peaks_np).all(axis=(1, 2))])
+    return frame_peaks
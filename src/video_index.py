@@ -0,0 +1,145 @@
+import os
+import numpy as np
+
+# PyAV exposes the keyframe flags and timestamps that OpenCV hides; it is optional
+try:
+    import av
+except ImportError:
+    av = None
+
+
+def keyframe_index_path(video_path):
+    """Sidecar file next to the video holding its keyframe index."""
+    return f"{video_path}.keyframes.npz"
+
+
+class KeyframeIndex:
+    """
+    Presentation timestamps of every frame of a video and the positions of its keyframes.
+
+    Building the index only demuxes the packets of the video (no decoding), and it
+    is saved next to the video so it is built once per video.
+
+    Attributes:
+        pts: Presentation timestamp of each frame, in stream time base units, in display order.
+        keyframes: Sorted indices of the keyframes.
+        time_base: Duration of one timestamp unit, in seconds.
+    """
+    def __init__(self, pts, keyframes, time_base):
+        self.pts = pts
+        self.keyframes = keyframes
+        self.time_base = time_base
+
+    def __len__(self):
+        return len(self.pts)
+
+    @classmethod
+    def build(cls, video_path):
+        """Builds the index of a video by demuxing its packets."""
+        if av is None:
+            raise ImportError("Building a keyframe index requires PyAV (pip install av).")
+
+        with av.open(video_path) as container:
+            stream = container.streams.video[0]
+            packets = [(packet.pts, packet.is_keyframe) for packet in container.demux(stream) if packet.pts is not None]
+            time_base = float(stream.time_base)
+
+        # Packets come in decoding order; sorting by timestamp gives the display order
+        pts = np.array([packet_pts for packet_pts, _ in packets], dtype=np.int64)
+        is_keyframe = np.array([keyframe for _, keyframe in packets], dtype=bool)
+        order = np.argsort(pts, kind="stable")
+        return cls(pts[order], np.flatnonzero(is_keyframe[order]), time_base)
+
+    @classmethod
+    def load_or_build(cls, video_path):
+        """Loads the index saved next to the video, building and saving it if it is missing or stale."""
+        index_path = keyframe_index_path(video_path)
+        stat = os.stat(video_path)
+        if os.path.exists(index_path):
+            with np.load(index_path) as data:
+                # Rebuild if the video was replaced since the index was saved
+                if int(data["video_size"]) == stat.st_size and int(data["video_mtime_ns"]) == stat.st_mtime_ns:
+                    return cls(data["pts"], data["keyframes"], float(data["time_base"]))
+
+        index = cls.build(video_path)
+        try:
+            np.savez(index_path, pts=index.pts, keyframes=index.keyframes, time_base=index.time_base,
+                     video_size=stat.st_size, video_mtime_ns=stat.st_mtime_ns)
+        except OSError as e:
+            print(f"Failed to save keyframe index to {index_path}: {e}")
+        return index
+
+    def keyframe_before(self, frame_idx):
+        """Index of the last keyframe at or before `frame_idx`."""
+        i = np.searchsorted(self.keyframes, frame_idx, side="right") - 1
+        return int(self.keyframes[max(i, 0)])
+
+    def timestamp(self, frame_idx):
+        """Presentation time of a frame, in seconds."""
+        return float(self.pts[frame_idx] * self.time_base)
+
+
+class IndexedVideoReader:
+    """
+    Random-access video reader built on a `KeyframeIndex`.
+
+    Reading a frame seeks to the last keyframe before it and decodes forward, so any
+    access decodes at most one GOP. Reading forward within reach of the current
+    position keeps decoding without seeking, so sequential reads stay cheap.
+
+    It exposes the `get_frame(idx)` / `len()` interface of `sleap.Video`, so it can
+    back a `VideoFrameSource`.
+
+    Attributes:
+        video_path: Path to the video file.
+        index: Keyframe index of the video.
+        grayscale: If True, frames are returned with shape (height, width, 1), else as RGB.
+    """
+    def __init__(self, video_path, index=None, grayscale=False):
+        if av is None:
+            raise ImportError("IndexedVideoReader requires PyAV (pip install av).")
+
+        self.video_path = video_path
+        self.index = index if index is not None else KeyframeIndex.load_or_build(video_path)
+        self.grayscale = grayscale
+
+        self._container = av.open(video_path)
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = "AUTO"
+        self._decoder = None
+        self._next_idx = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_frame(self, idx):
+        """Decodes frame `idx`."""
+        idx = int(idx)
+        if not 0 <= idx < len(self.index):
+            raise IndexError(f"Frame index {idx} out of range for video with {len(self.index)} frames")
+
+        # Seek unless the frame can be reached by decoding forward from the current position
+        # without going through more than one keyframe
+        if self._next_idx is None or not self.index.keyframe_before(idx) <= self._next_idx <= idx:
+            self._seek(idx)
+
+        target_pts = self.index.pts[idx]
+        for frame in self._decoder:
+            if frame.pts is None or frame.pts < target_pts:
+                continue
+            self._next_idx = int(np.searchsorted(self.index.pts, frame.pts, side="right"))
+            if self.grayscale:
+                return frame.to_ndarray(format="gray")[..., None]
+            return frame.to_ndarray(format="rgb24")
+
+        self._next_idx = None
+        raise IndexError(f"Failed to decode frame {idx} of {self.video_path}")
+
+    def close(self):
+        self._container.close()
+
+    def _seek(self, idx):
+        keyframe_pts = int(self.index.pts[self.index.keyframe_before(idx)])
+        self._container.seek(keyframe_pts, stream=self._stream, backward=True, any_frame=False)
+        self._decoder = self._container.decode(self._stream)
+        self._next_idx = None
@@ -0,0 +1,90 @@
+import tkinter as tk
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+
+def to_display_rgb(frame, display_scale=1.0):
+    """
+    Converts a BGR (or grayscale) frame to the RGB image shown on screen.
+
+    Args:
+        frame (np.ndarray): Frame with shape (height, width) or (height, width, channels).
+        display_scale (float): Scale factor applied before display.
+
+    Returns:
+        np.ndarray: RGB image with shape (scaled height, scaled width, 3).
+    """
+    if frame.ndim == 2 or frame.shape[-1] == 1:
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+    else:
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    if display_scale != 1.0:
+        height, width = frame_rgb.shape[:2]
+        display_size = (max(1, round(width * display_scale)), max(1, round(height * display_scale)))
+        frame_rgb = cv2.resize(frame_rgb, display_size, interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(frame_rgb)
+
+
+class FrameViewer:
+    """
+    Displays frames in a Tk canvas.
+
+    A single PhotoImage is shown by one canvas image item and updated in place for
+    every frame, so showing a frame costs a color conversion, an optional resize and
+    a pixel copy into Tk.
+
+    Attributes:
+        canvas: Canvas widget holding the image.
+        display_scale: Scale factor applied to frames before display.
+    """
+    def __init__(self, master, display_scale=1.0):
+        self.canvas = tk.Canvas(master, highlightthickness=0)
+        self.display_scale = display_scale
+        self._photo = None
+        self._image_item = None
+
+    def pack(self, **kwargs):
+        self.canvas.pack(**kwargs)
+
+    def show(self, frame):
+        """Shows a BGR frame."""
+        image = Image.fromarray(to_display_rgb(frame, self.display_scale))
+
+        if self._photo is None or (self._photo.width(), self._photo.height()) != image.size:
+            # First frame, or the frame size changed: create the image and size the canvas to it
+            self._photo = ImageTk.PhotoImage(image)
+            self.canvas.config(width=image.width, height=image.height)
+            if self._image_item is None:
+                self._image_item = self.canvas.create_image(0, 0, image=self._photo, anchor=tk.NW)
+            else:
+                self.canvas.itemconfig(self._image_item, image=self._photo)
+        else:
+            self._photo.paste(image)
+
+
+class FigureFrameViewer:
+    """
+    Displays frames in a matplotlib figure embedded in Tk.
+
+    This is the viewer the auto-label page used before `FrameViewer`; it redraws the
+    whole figure for every frame. It is kept for comparison in the benchmarks.
+    """
+    def __init__(self, master):
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        self.fig, self.ax = plt.subplots()
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+
+    def pack(self, **kwargs):
+        self.canvas.get_tk_widget().pack(**kwargs)
+
+    def show(self, frame):
+        """Shows a BGR frame."""
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        self.ax.clear()
+        self.ax.imshow(frame_rgb)
+        self.ax.axis('off')
+        self.canvas.draw()
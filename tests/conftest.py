@@ -0,0 +1,21 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The sources are flat scripts importing each other by module name
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+
+
+@pytest.fixture
+def roi_config_path():
+    """ROI config shipped with the repo."""
+    return os.path.join(REPO_DIR, "roi_config.json")
+
+
+@pytest.fixture
+def shapes_config(roi_config_path):
+    with open(roi_config_path) as json_file:
+        return json.load(json_file)
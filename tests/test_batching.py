@@ -0,0 +1,64 @@
+import numpy as np
+
+from labeling import AutoLabeler
+from predictions import PredictionStore
+from roi import RoiClassifier
+from utils import predict_peaks
+
+NUM_FRAMES = 40
+FRAME_SHAPE = (720, 1280, 3)
+
+
+class PaddingModel:
+    """
+    Inference model padding each frame to the largest instance count of the batch with
+    all-NaN instances, like SLEAP. The detections of a frame only depend on its content.
+    """
+    def predict_on_batch(self, frames):
+        frame_peaks = []
+        for frame in frames:
+            rng = np.random.default_rng(int(frame[0, 0, 0]))
+            num_instances = rng.integers(0, 4)
+            frame_peaks.append(rng.uniform([250, 500], [1100, 620], size=(num_instances, 2, 2)))
+        max_instances = max(len(peaks_np) for peaks_np in frame_peaks)
+        instance_peaks = np.full((len(frames), max_instances, 2, 2), np.nan, dtype=np.float32)
+        for i, peaks_np in enumerate(frame_peaks):
+            instance_peaks[i, :len(peaks_np)] = peaks_np
+        return {"instance_peaks": instance_peaks}
+
+
+class PaddingPredictor:
+    inference_model = PaddingModel()
+
+
+def synthetic_frames():
+    frames = np.zeros((NUM_FRAMES, *FRAME_SHAPE), dtype=np.uint8)
+    # The first pixel seeds the detections of the frame
+    frames[:, 0, 0, 0] = np.arange(NUM_FRAMES)
+    return frames
+
+
+def auto_label_codes(frames, shapes_config, batch_size):
+    roi_classifier = RoiClassifier(shapes_config)
+    labeler = AutoLabeler(frames, PaddingPredictor(), roi_classifier, PredictionStore(len(frames)), batch_size=batch_size)
+    codes = np.full(len(frames), -1)
+    for start, chunk_codes in labeler.run():
+        codes[start:start + len(chunk_codes)] = chunk_codes
+    return codes
+
+
+def test_padding_instances_are_dropped():
+    frames = synthetic_frames()
+    for batch_peaks, frame in zip(predict_peaks(PaddingPredictor(), frames), frames):
+        assert not np.isnan(batch_peaks).all(axis=(1, 2)).any()
+        assert np.array_equal(batch_peaks, predict_peaks(PaddingPredictor(), frame[None])[0])
+
+
+def test_batch_size_does_not_change_labels(shapes_config):
+    frames = synthetic_frames()
+    single = auto_label_codes(frames, shapes_config, batch_size=1)
+    batched = auto_label_codes(frames, shapes_config, batch_size=8)
+
+    # Frames without detections are among them, labeled None in both cases
+    assert (single == RoiClassifier.NONE).any()
+    assert np.array_equal(single, batched)
@@ -0,0 +1,127 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app import LabelBatApp
+from labeling import AutoLabeler
+from labels import LabelStore
+from predictions import PredictionStore
+from profiling import DISABLED_PROFILER
+from roi import RoiClassifier
+from utils import SimulatedCamera, draw_predictions
+
+NUM_FRAMES = 6
+FRAME_SHAPE = (720, 1280, 3)
+
+
+class CountingModel:
+    """Inference model returning fixed peaks and counting the frames it is run on."""
+    def __init__(self):
+        self.num_frames = 0
+
+    def predict_on_batch(self, frames):
+        self.num_frames += len(frames)
+        peaks = np.tile(np.array([[[400.0, 560.0], [420.0, 570.0]]], dtype=np.float32), (len(frames), 1, 1, 1))
+        return {"instance_peaks": peaks}
+
+
+class CountingPredictor:
+    def __init__(self):
+        self.inference_model = CountingModel()
+
+
+class FailingModel:
+    def predict_on_batch(self, frames):
+        raise AssertionError("predict_on_batch should not be called")
+
+
+class FailingPredictor:
+    inference_model = FailingModel()
+
+
+class Widget:
+    """Stands in for a Tk label."""
+    def config(self, **kwargs):
+        self.options = kwargs
+
+
+class RecordingViewer:
+    """Stands in for the frame viewer, keeping a copy of every frame shown."""
+    def __init__(self):
+        self.shown = []
+
+    def show(self, frame):
+        self.shown.append(frame.copy())
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, size=(NUM_FRAMES, *FRAME_SHAPE), dtype=np.uint8)
+
+
+def labeling_page(frames, shapes_config, prediction_store=None):
+    """A `LabelBatApp` in the state of the auto-label page, without a Tk window."""
+    app = LabelBatApp.__new__(LabelBatApp)
+    app.profiler = DISABLED_PROFILER
+    app.camera = SimulatedCamera(frames)
+    app.current_frame_index = 0
+    app.total_frames = len(frames)
+    app.shapes_config = shapes_config
+    app.roi_classifier = RoiClassifier(shapes_config)
+    app.frame_labels = LabelStore(len(frames), app.roi_classifier.labels)
+    app.prediction_store = prediction_store if prediction_store is not None else PredictionStore(len(frames))
+    app.inference_lock = threading.Lock()
+    app.label_display = Widget()
+    app.frame_label = Widget()
+    app.viewer = RecordingViewer()
+    return app
+
+
+def test_draw_predictions_is_repeatable(frames, shapes_config):
+    frame = frames[0]
+    original = frame.copy()
+    peaks_np = np.array([[[400.0, 560.0], [420.0, 570.0]], [[np.nan, np.nan], [900.0, 580.0]]])
+
+    first = draw_predictions(frame, peaks_np, shapes_config)
+    second = draw_predictions(frame, peaks_np, shapes_config)
+
+    assert np.array_equal(first, second)
+    assert not np.array_equal(first, original)
+    assert np.array_equal(frame, original)
+
+
+def test_show_frame_revisits_produce_identical_pixels(frames, shapes_config):
+    original = frames.copy()
+    predictor = CountingPredictor()
+    app = labeling_page(frames, shapes_config)
+
+    for frame_idx in (2, 3, 2):
+        app.current_frame_index = frame_idx
+        app.show_frame(predictor)
+
+    first_visit, _, second_visit = app.viewer.shown
+    assert np.array_equal(first_visit, second_visit)
+    # Frame 2 was inferred once, then its peaks came from the prediction store
+    assert predictor.inference_model.num_frames == 2
+    assert np.array_equal(frames, original)
+
+
+def test_display_reuses_auto_label_peaks(frames, shapes_config):
+    prediction_store = PredictionStore(len(frames))
+    roi_classifier = RoiClassifier(shapes_config)
+    predictor = CountingPredictor()
+    labeler = AutoLabeler(frames, predictor, roi_classifier, prediction_store, batch_size=4)
+    for _ in labeler.run():
+        pass
+    assert predictor.inference_model.num_frames == len(frames)
+
+    app = labeling_page(frames, shapes_config, prediction_store)
+    for frame_idx in range(len(frames)):
+        app.current_frame_index = frame_idx
+        app.show_frame(FailingPredictor())
+
+    expected = draw_predictions(frames[0], prediction_store.get(0), shapes_config)
+    assert len(app.viewer.shown) == len(frames)
+    assert np.array_equal(app.viewer.shown[0], expected)
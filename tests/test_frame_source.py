@@ -0,0 +1,66 @@
+import numpy as np
+
+from utils import VideoFrameSource
+
+NUM_FRAMES = 10
+FRAME_SHAPE = (8, 8, 3)
+
+
+class FakeReader:
+    """Video reader returning frames filled with their index, recording whether it was closed."""
+    def __init__(self):
+        self.closed = False
+
+    def __len__(self):
+        return NUM_FRAMES
+
+    def get_frame(self, idx):
+        return np.full(FRAME_SHAPE, idx, dtype=np.uint8)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCapture:
+    def __init__(self):
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+class FakeBackend:
+    def __init__(self):
+        self._reader_ = FakeCapture()
+
+
+class FakeMediaVideo(FakeReader):
+    """Like a sleap video of a media file: no `close`, an OpenCV capture on its backend."""
+    close = None
+
+    def __init__(self):
+        super().__init__()
+        self.backend = FakeBackend()
+
+
+def test_close_closes_the_reader():
+    reader = FakeReader()
+    frames = VideoFrameSource(reader)
+    assert (frames[3] == 3).all()
+
+    frames.close()
+
+    assert reader.closed
+    assert not frames._prefetch_thread.is_alive()
+
+
+def test_close_releases_the_capture_of_a_media_video():
+    video = FakeMediaVideo()
+    capture = video.backend._reader_
+    frames = VideoFrameSource(video)
+    assert (frames[3] == 3).all()
+
+    frames.close()
+
+    assert capture.released
+    assert video.backend._reader_ is None
@@ -0,0 +1,100 @@
+import numpy as np
+
+from labels import UNLABELED, LabelStore
+
+CATEGORIES = ["Explore", "None", "roi_1", "roi_2"]
+NUM_FRAMES = 1000
+
+
+def saved_store(tmp_path):
+    """A binary label file with a label on every frame, opened for editing."""
+    rng = np.random.default_rng(0)
+    store = LabelStore(NUM_FRAMES, CATEGORIES)
+    store.set_codes(0, rng.integers(0, len(CATEGORIES), NUM_FRAMES).astype(np.int16))
+    file_path = str(tmp_path / "labels.npy")
+    store.save_binary(file_path)
+    return LabelStore.open(file_path)
+
+
+def test_save_binary_writes_only_the_changed_frames(tmp_path):
+    store = saved_store(tmp_path)
+    store[10] = "roi_2"
+    store[11] = "New"
+    store.set_codes(500, np.full(20, 1, dtype=np.int16))
+    store.set_codes(510, np.full(20, 0, dtype=np.int16))
+
+    # Change a frame nobody edited behind the store's back: saving must not overwrite it
+    on_disk = np.load(store.path, mmap_mode="r+")
+    on_disk[900] = 3 - on_disk[900]
+    on_disk.flush()
+    outside_edit = int(on_disk[900])
+    del on_disk
+
+    assert store.dirty_ranges() == [(10, 12), (500, 530)]
+    assert store.save_binary() == 32
+
+    saved = np.load(store.path)
+    assert saved[900] == outside_edit
+    saved[900] = store.codes[900]
+    assert np.array_equal(saved, store.codes)
+
+
+def test_reopened_binary_store_matches(tmp_path):
+    store = saved_store(tmp_path)
+    store[0] = "None"
+    store[999] = "New"
+    store.set_codes(300, np.full(50, 2, dtype=np.int16))
+    store.save_binary()
+
+    reopened = LabelStore.open(store.path)
+
+    assert reopened.categories == CATEGORIES + ["New"]
+    assert np.array_equal(reopened.codes, store.codes)
+    assert reopened.dirty_ranges() == []
+    # Nothing changed, so nothing is written
+    assert reopened.save_binary() == 0
+
+
+def store_with_gaps():
+    """Labels with unlabeled gaps (at both ends too) and runs of several categories."""
+    rng = np.random.default_rng(1)
+    store = LabelStore(NUM_FRAMES, CATEGORIES)
+    # Runs of random length, each with a random category or no label
+    frame_idx = 5
+    while frame_idx < NUM_FRAMES - 5:
+        length = int(rng.integers(1, 30))
+        code = int(rng.integers(-1, len(CATEGORIES) + 1))
+        label = None if code == -1 else (CATEGORIES + ["Extra"])[code]
+        for i in range(frame_idx, min(frame_idx + length, NUM_FRAMES - 5)):
+            if label is not None:
+                store[i] = label
+        frame_idx += length
+    return store
+
+
+def test_round_trip_through_every_format(tmp_path):
+    store = store_with_gaps()
+    assert (store.codes == UNLABELED).any() and len(store.categories) == len(CATEGORIES) + 1
+
+    store.save_frames(tmp_path / "frames.csv")
+    from_frames = LabelStore.load(tmp_path / "frames.csv", NUM_FRAMES, CATEGORIES)
+    store.save_segments(tmp_path / "segments.csv")
+    from_segments = LabelStore.load(tmp_path / "segments.csv", NUM_FRAMES, CATEGORIES)
+    store.save_binary(str(tmp_path / "labels.npy"))
+    from_binary = LabelStore.open(str(tmp_path / "labels.npy"))
+
+    for loaded in (from_frames, from_segments, from_binary):
+        assert loaded.categories == store.categories
+        assert np.array_equal(loaded.codes, store.codes)
+        assert list(loaded.items()) == list(store.items())
+
+
+def test_round_trip_without_the_frame_count(tmp_path):
+    # Without the number of frames, the video is taken to end at the last labeled frame
+    store = store_with_gaps()
+    last_labeled = int(np.flatnonzero(store.codes != UNLABELED)[-1])
+
+    for save, file_name in ((store.save_frames, "frames.csv"), (store.save_segments, "segments.csv")):
+        save(tmp_path / file_name)
+        loaded = LabelStore.load(tmp_path / file_name, categories=CATEGORIES)
+        assert np.array_equal(loaded.codes, store.codes[:last_labeled + 1])
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from metrics import evaluate_keypoints, instance_area, match_instances, pairwise_oks, voc_metrics
+
+# With this spread, the OKS normalization of an instance of area 100 is (2 * 0.05)^2 * 2 * 100 = 2
+STDDEV = 0.05
+
+
+def instances(*points):
+    """One frame of instances, with shape (1, instances, nodes, 2)."""
+    return np.array([points], dtype=np.float64)
+
+
+def test_instance_area_ignores_missing_points():
+    points = instances([[0, 0], [10, 10], [np.nan, np.nan]], [[2, 1], [5, 5], [3, 9]])
+    assert np.allclose(instance_area(points), [[100, 24]])
+
+
+def test_pairwise_oks():
+    points_gt = instances([[0, 0], [10, 10]])
+    exact = [[0, 0], [10, 10]]
+    off_by_one = [[1, 0], [10, 10]]
+    missing_point = [[np.nan, np.nan], [10, 10]]
+    points_pr = instances(exact, off_by_one, missing_point)
+
+    oks = pairwise_oks(points_gt, points_pr, stddev=STDDEV)
+
+    # exp(-d^2 / 2) per point, averaged; a missing predicted point scores 0
+    assert oks.shape == (1, 1, 3)
+    assert np.allclose(oks[0, 0], [1, (np.exp(-0.5) + 1) / 2, 0.5])
+
+
+def test_pairwise_oks_skips_missing_gt_points():
+    points_gt = instances([[0, 0], [10, 10], [np.nan, np.nan]])
+    points_pr = instances([[1, 0], [10, 10], [50, 50]])
+    assert np.allclose(pairwise_oks(points_gt, points_pr, stddev=STDDEV), (np.exp(-0.5) + 1) / 2)
+    # A given scale replaces the area: 25 makes the normalization 0.5
+    assert np.allclose(pairwise_oks(points_gt, points_pr, stddev=STDDEV, scale=25), (np.exp(-2) + 1) / 2)
+
+
+def test_match_instances_is_greedy_by_score():
+    # OKS of (GT, prediction); prediction 1 has the higher score, so it goes first and takes GT 0
+    oks = np.array([[[0.9, 0.8], [0.7, 0.1]]])
+    scores_pr = np.array([[0.2, 0.9]])
+
+    frames, gt, pr, pair_oks = match_instances(oks, scores_pr, num_gt=np.array([2]), num_pr=np.array([2]))
+
+    assert frames.tolist() == [0, 0]
+    assert gt.tolist() == [0, 1]
+    assert pr.tolist() == [1, 0]
+    assert np.allclose(pair_oks, [0.8, 0.7])
+
+
+def test_match_instances_threshold_is_exclusive():
+    oks = np.array([[[0.9, 0.8], [0.7, 0.1]]])
+    scores_pr = np.array([[0.2, 0.9]])
+
+    # An OKS equal to the threshold is not a match
+    _, gt, pr, pair_oks = match_instances(oks, scores_pr, np.array([2]), np.array([2]), threshold=0.7)
+    assert list(zip(gt.tolist(), pr.tolist())) == [(0, 1)]
+
+    # Padding predictions and GT instances are never matched
+    _, gt, pr, _ = match_instances(oks, scores_pr, np.array([1]), np.array([1]))
+    assert list(zip(gt.tolist(), pr.tolist())) == [(0, 0)]
+
+
+def test_voc_metrics():
+    # Ranked by detection score: OKS 0.6 first, then 0.9, with one GT instance unmatched (3 GT in all)
+    metrics = voc_metrics([0.9, 0.6], [0.8, 0.9], num_false_negatives=1,
+                          match_score_thresholds=np.array([0.5, 0.9]), recall_thresholds=np.array([0, 0.5, 1]))
+
+    # At 0.5 both pairs are true positives: recalls 1/3, 2/3 at precision 1
+    # At 0.9 (inclusive) only the second is: recalls 0, 1/3 at precisions 0, 1/2, made decreasing to 1/2, 1/2
+    assert np.allclose(metrics["oks_voc.precisions"], [[1, 1, 0], [0.5, 0, 0]])
+    assert np.allclose(metrics["oks_voc.recalls"], [2 / 3, 1 / 3])
+    assert np.allclose(metrics["oks_voc.AP"], [2 / 3, 1 / 6])
+    assert metrics["oks_voc.mAP"] == pytest.approx(5 / 12)
+    assert metrics["oks_voc.mAR"] == pytest.approx(0.5)
+
+
+def test_evaluate_keypoints():
+    # Frame 0: one GT matched by a prediction one pixel off on its first node
+    # Frame 1: a GT without prediction, and a prediction without GT
+    points_gt = np.array([[[[0, 0], [10, 10]]], [[[0, 0], [10, 10]]]], dtype=np.float64)
+    points_pr = np.array([[[[1, 0], [10, 10]]], [[[np.nan, np.nan], [np.nan, np.nan]]]])
+    keypoints = {
+        "points_gt": points_gt, "num_gt": np.array([1, 1]),
+        "points_pr": points_pr, "scores_pr": np.array([[0.9], [0.5]]), "num_pr": np.array([1, 1]),
+    }
+
+    metrics = evaluate_keypoints(keypoints, stddev=STDDEV, match_score_thresholds=np.array([0.5, 0.9]))
+
+    oks = (np.exp(-0.5) + 1) / 2
+    assert np.allclose(metrics["dist.dists"], [[1, 0]])
+    assert metrics["dist.avg"] == pytest.approx(0.5)
+    assert metrics["oks.mOKS"] == pytest.approx(oks)
+    # The OKS (about 0.80) passes 0.5 but not 0.9; one of the two GT instances is found
+    assert np.allclose(metrics["oks_voc.recalls"], [0.5, 0])
+
+    # Scoring only the second node, which is exact; the scale still comes from both nodes
+    metrics = evaluate_keypoints(keypoints, nodes=[1], stddev=STDDEV)
+    assert metrics["oks.mOKS"] == pytest.approx(1)
+    assert evaluate_keypoints(keypoints, frames=np.array([], dtype=int)) == {}
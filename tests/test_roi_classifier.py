@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from shapely.geometry import Point, Polygon
+
+from roi import ROI_NODES, RoiClassifier, points_in_polygon, polygon_edges
+
+
+def shapely_frame_label(polygons, peaks_np):
+    """The original per-point loop: instances in order, head before tail, first ROI in config order."""
+    if len(peaks_np) == 0:
+        return "None"
+    for instance in peaks_np:
+        for node in ROI_NODES:
+            point = Point(*instance[node])
+            for roi_name, polygon in polygons.items():
+                if polygon.contains(point):
+                    return roi_name
+    return "Explore"
+
+
+def overlapping_configs(shapes_config):
+    """The ROI config, plus a large ROI covering box1 placed before it and after it."""
+    big = {"shape_points": [[200, 450], [200, 650], [650, 650], [650, 450]]}
+    return [shapes_config, {"big": big, **shapes_config}, {**shapes_config, "big": big}]
+
+
+def sample_points(shapes_config, rng):
+    """Random points around the ROIs, their vertices and their edge midpoints."""
+    vertices = np.concatenate([shape_data["shape_points"] for shape_data in shapes_config.values()])
+    edges = np.concatenate([polygon_edges(shape_data["shape_points"]) for shape_data in shapes_config.values()])
+    midpoints = (edges[:, :2] + edges[:, 2:]) / 2
+    low, high = vertices.min(axis=0) - 20, vertices.max(axis=0) + 20
+    return np.concatenate([rng.uniform(low, high, size=(3000, 2)), vertices, midpoints])
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def random_peaks(points, rng, num_frames=2000, max_instances=3, num_nodes=3):
+    """Frames of 0 to `max_instances` instances whose nodes are drawn from `points`, some missing."""
+    peaks = points[rng.integers(0, len(points), size=(num_frames, max_instances, num_nodes))]
+    peaks[rng.random((num_frames, max_instances, num_nodes)) < 0.2] = np.nan
+    num_instances = rng.integers(0, max_instances + 1, size=num_frames)
+    peaks[np.arange(max_instances)[None, :] >= num_instances[:, None]] = np.nan
+    return peaks, num_instances
+
+
+def test_points_in_polygon_matches_shapely(shapes_config, rng):
+    points = sample_points(shapes_config, rng)
+    for shape_data in shapes_config.values():
+        polygon = Polygon(shape_data["shape_points"])
+        expected = np.array([polygon.contains(Point(x, y)) for x, y in points])
+        assert np.array_equal(points_in_polygon(points, polygon_edges(shape_data["shape_points"])), expected)
+
+
+def test_classify_matches_shapely_loop(shapes_config, rng):
+    for config in overlapping_configs(shapes_config):
+        polygons = {roi_name: Polygon(shape_data["shape_points"]) for roi_name, shape_data in config.items()}
+        classifier = RoiClassifier(config)
+        peaks, num_instances = random_peaks(sample_points(shapes_config, rng), rng)
+
+        codes = classifier.classify(peaks, num_instances)
+
+        expected = [shapely_frame_label(polygons, frame_peaks[:n]) for frame_peaks, n in zip(peaks, num_instances)]
+        assert [classifier.labels[code] for code in codes] == expected
+        assert len(set(expected)) >= len(shapes_config) + 2
+
+
+def test_classify_instances_matches_shapely_loop(shapes_config, rng):
+    for config in overlapping_configs(shapes_config):
+        polygons = {roi_name: Polygon(shape_data["shape_points"]) for roi_name, shape_data in config.items()}
+        classifier = RoiClassifier(config)
+        peaks, num_instances = random_peaks(sample_points(shapes_config, rng), rng)
+
+        codes = classifier.classify_instances(peaks, num_instances)
+
+        for frame_peaks, frame_codes, n in zip(peaks, codes, num_instances):
+            expected = [shapely_frame_label(polygons, instance[None]) for instance in frame_peaks[:n]]
+            assert [classifier.labels[code] for code in frame_codes[:n]] == expected
+            assert (frame_codes[n:] == -1).all()
+
+
+def test_head_is_checked_before_tail(shapes_config):
+    classifier = RoiClassifier(shapes_config)
+    in_box1, in_box2 = [450.0, 560.0], [900.0, 580.0]
+
+    # The head of an instance wins over its tail
+    assert classifier.classify_frame(np.array([[in_box2, in_box1]])) == "box2"
+    assert classifier.classify_frame(np.array([[[np.nan, np.nan], in_box1]])) == "box1"
+    # But instances come first: the tail of the first instance wins over the head of the second
+    assert classifier.classify_frame(np.array([[[0.0, 0.0], in_box1], [in_box2, in_box2]])) == "box1"
+
+
+def test_first_matching_roi_wins(shapes_config):
+    in_box1 = np.array([[[450.0, 560.0], [np.nan, np.nan]]])
+    config, big_first, big_last = overlapping_configs(shapes_config)
+    assert RoiClassifier(big_first).classify_frame(in_box1) == "big"
+    assert RoiClassifier(big_last).classify_frame(in_box1) == "box1"
+
+
+def test_explore_and_none(shapes_config):
+    classifier = RoiClassifier(shapes_config)
+    outside = [[0.0, 0.0], [10.0, 10.0]]
+    missing = [[np.nan, np.nan], [np.nan, np.nan]]
+    peaks = np.array([[outside], [missing], [missing]])
+
+    # An instance outside every ROI explores, a frame without instances is None
+    assert classifier.labels[classifier.classify(peaks[:1])[0]] == "Explore"
+    assert classifier.classify_frame(np.empty((0, 2, 2))) == "None"
+    # An instance with every point missing is padding by default, but counts when the number of instances says so
+    assert classifier.labels[classifier.classify(peaks[1:2])[0]] == "None"
+    assert classifier.labels[classifier.classify(peaks[2:], [1])[0]] == "Explore"
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from shapely.geometry import Point, Polygon
+
+from roi import RoiMask
+
+
+def shapely_roi_index(polygons, points):
+    """Index of the first polygon containing each point, or -1, with shapely."""
+    roi_idx = np.full(len(points), -1)
+    for i, (x, y) in enumerate(points):
+        for j, polygon in enumerate(polygons):
+            if polygon.contains(Point(x, y)):
+                roi_idx[i] = j
+                break
+    return roi_idx
+
+
+@pytest.fixture
+def polygons(shapes_config):
+    return [Polygon(shape_data["shape_points"]) for shape_data in shapes_config.values()]
+
+
+@pytest.fixture
+def roi_mask(shapes_config):
+    vertices = np.concatenate([shape_data["shape_points"] for shape_data in shapes_config.values()])
+    width, height = vertices.max(axis=0).astype(int) + 20
+    return RoiMask.compile(shapes_config, (width, height))
+
+
+def test_integer_points_match_shapely(roi_mask, polygons):
+    # Every pixel of a band around each ROI, which includes its vertices
+    points = []
+    for polygon in polygons:
+        x_min, y_min, x_max, y_max = np.array(polygon.bounds).astype(int)
+        ys, xs = np.mgrid[y_min - 3:y_max + 4, x_min - 3:x_max + 4]
+        points.append(np.stack([xs.ravel(), ys.ravel()], axis=-1))
+    points = np.concatenate(points).astype(np.float64)
+
+    assert np.array_equal(roi_mask.locate(points), shapely_roi_index(polygons, points))
+
+
+def test_vertices_are_outside(roi_mask, polygons):
+    # Vertices lie on the boundary, which is not part of the ROI
+    vertices = np.concatenate([np.array(polygon.exterior.coords[:-1]) for polygon in polygons])
+    assert np.array_equal(roi_mask.locate(vertices), shapely_roi_index(polygons, vertices))
+    assert (roi_mask.locate(vertices) == -1).all()
+
+
+def test_fractional_points_follow_the_rounding_rule(roi_mask, polygons):
+    rng = np.random.default_rng(0)
+    # Edge midpoints (often fractional) and random fractional points around each ROI
+    points = []
+    for polygon in polygons:
+        vertices = np.array(polygon.exterior.coords)
+        points.append((vertices[:-1] + vertices[1:]) / 2)
+        x_min, y_min, x_max, y_max = polygon.bounds
+        points.append(rng.uniform([x_min - 3, y_min - 3], [x_max + 3, y_max + 3], size=(5000, 2)))
+    points = np.concatenate(points)
+
+    located = roi_mask.locate(points)
+
+    # A keypoint gets the exact result at its nearest pixel
+    assert np.array_equal(located, shapely_roi_index(polygons, np.rint(points)))
+
+    # So it can only disagree with the exact test within half a pixel (along x and y) of an edge
+    exact = shapely_roi_index(polygons, points)
+    assert (located != exact).any()
+    for x, y in points[located != exact]:
+        distance = min(polygon.exterior.distance(Point(x, y)) for polygon in polygons)
+        assert distance <= np.sqrt(0.5)
+
+
+def test_points_outside_the_frame_are_in_no_roi(roi_mask):
+    height, width = roi_mask.mask.shape
+    points = np.array([[-1.0, 10.0], [10.0, -1.0], [width, 10.0], [10.0, height], [np.nan, np.nan]])
+    assert (roi_mask.locate(points) == -1).all()